@@ -4,18 +4,22 @@ import hashlib
 import os
 import signal
 import sys
+import threading
 from datetime import datetime
 
 import fire
 import urllib3
 
-from octopus.robot import config, log, utils, constants
+from octopus.robot import config, log, utils, constants, metrics
+from octopus.robot.profiler import profiler
 from octopus.robot.assistant import VoiceAssistant
+from octopus.robot.boot import BootGraph
 from octopus.robot.Conversation import Conversation
 from octopus.robot.LifeCycleHandler import LifeCycleEvent, LifeCycleHandler
 from octopus.robot.Sender import WebSocketSender, ACTION_ROBOT_WRITE
-from octopus.robot.compt import TimeoutMonitor
-from octopus.robot.jobs import ScreenControlJob, ClearVoiceJob
+from octopus.robot.compt import TimeoutMonitor, ThreadManager
+from octopus.robot.jobs import ScreenControlJob, ClearVoiceJob, MemoryWatchJob
+from octopus.robot.memwatch import memwatch
 from octopus.robot.schedulers import DeferredScheduler
 from octopus.web import server
 
@@ -37,6 +41,11 @@ class Octopus(object):
         self.life_cycle_handler = None
         self.scheduler = None
         self.timeout_monitor = None
+        self.web_workers = None
+        self.metrics = metrics.registry  # 运行指标
+        self.profiler = profiler  # 采样分析
+        self.memwatch = memwatch  # 内存增长追踪
+        self.boot = BootGraph(max_workers=config.get("/boot/workers", 8))  # 启动编排
 
     def init(self):
         print(
@@ -60,6 +69,29 @@ class Octopus(object):
         self.timeout_monitor = TimeoutMonitor()
         self.life_cycle_event = LifeCycleEvent()  # 生命周期事件
         self.sender = WebSocketSender()  # 信息发送
+        self.timeout_monitor.start()
+        self.sender.start()
+        # 互不依赖的组件并发创建, 远程连接并发预热
+        boot = self.boot
+        boot.add("conversation", self._boot_conversation)
+        boot.add("robot", self._boot_robot)
+        boot.add("asr_connect", self._boot_asr, deps=("robot",), required=False)
+        boot.add("ai_warm", self._boot_ai, deps=("conversation",), required=False)
+        boot.add("dh_warm", self._boot_dh, deps=("conversation",), required=False)
+        boot.add("robot_init", self._boot_robot_init, deps=("conversation", "robot"))
+        boot.add("jobs", self.init_jobs, deps=("conversation", "robot"))
+        boot.add(
+            "life_cycle",
+            lambda: self.life_cycle_event.fire_event("init"),
+            deps=("conversation", "robot_init"),  # 与原来一致, 在 robot.init() 之后
+        )
+        # 问候语合成同时预热TTS
+        boot.add(
+            "greeting", self._boot_greeting, deps=("life_cycle",), required=False
+        )
+        boot.run(timeout=config.get("/boot/timeout", 120))
+
+    def _boot_conversation(self):
         self.conversation = Conversation(
             life_cycle_event=self.life_cycle_event,
             profiling=self._profiling,
@@ -69,13 +101,6 @@ class Octopus(object):
             conversation=self.conversation, sender=self.sender
         )
         self.life_cycle_event.set_handler(handler=self.life_cycle_handler)
-        self.robot = VoiceAssistant(octopus=self, timeout_monitor=self.timeout_monitor)
-        # do something
-        self.init_jobs()
-        self.timeout_monitor.start()
-        self.sender.start()
-        self.robot.init()
-        self.life_cycle_event.fire_event("init")
         self.conversation.set_on_stream(
             on_stream=lambda message, resp_uuid, data=None, user_id=None: self.sender
             and self.sender.put_message(
@@ -86,6 +111,27 @@ class Octopus(object):
                 user_id=user_id,
             )
         )
+
+    def _boot_robot(self):
+        self.robot = VoiceAssistant(octopus=self, timeout_monitor=self.timeout_monitor)
+
+    def _boot_asr(self):
+        self.robot.asr.connect()
+        timeout = config.get("/boot/asr_timeout", 5)
+        if not self.robot.asr.wait_ok(timeout=timeout):
+            raise TimeoutError(f"实时ASR未在{timeout}秒内连接")
+
+    def _boot_ai(self):
+        self.conversation.ai.warm_up()
+
+    def _boot_dh(self):
+        dh = self.conversation.speaker.dh
+        dh and dh.warm_up()
+
+    def _boot_robot_init(self):
+        self.robot.init()
+
+    def _boot_greeting(self):
         self.conversation.say_simple(
             msg=f"{config.get('first_name', '主人')}{self.get_greeting()}！",
             cache=True,
@@ -96,8 +142,24 @@ class Octopus(object):
         # add jobs
         ScreenControlJob(scheduler=self.scheduler)
         ClearVoiceJob(scheduler=self.scheduler)
+        MemoryWatchJob(scheduler=self.scheduler)
+        self.init_probes()
         self.scheduler.start()
 
+    def init_probes(self):
+        """内存追踪的关键结构"""
+        memwatch.register("threads.managed", lambda: len(ThreadManager.threads))
+        memwatch.register("threads.alive", threading.active_count)
+        memwatch.register("player.queue", self._player_queue)
+        memwatch.register("ai.context", lambda: len(self.conversation.ai.context))
+        memwatch.register(
+            "asr.msg_queue", lambda: self.robot.asr.rt_asr.msg_queue.qsize()
+        )
+
+    def _player_queue(self) -> int:
+        player = self.conversation.speaker.player
+        return player.play_queue.qsize() if player else 0
+
     def get_greeting(self):
         # 获取当前小时
         current_hour = datetime.now().hour
@@ -124,6 +186,7 @@ class Octopus(object):
         server.run(octopus=self, debug=self._debug)
         # 启动
         self.robot.start()
+        self.boot.mark("ready")
 
     def help(self):
         print(
@@ -171,6 +234,8 @@ class Octopus(object):
         self.run()
 
     def stop(self):
+        if self.web_workers:
+            self.web_workers.stop()
         if self.timeout_monitor:
             self.timeout_monitor.stop()
         if self.scheduler:
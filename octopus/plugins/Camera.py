@@ -12,6 +12,7 @@ logger = log.getLogger(__name__)
 
 class Plugin(AbstractPlugin):
     SLUG = "camera"
+    KEYWORDS = ("拍照", "拍张照")
 
     def handle(self, text, parsed):
         quality = config.get("/camera/quality", 100)
@@ -8,6 +8,7 @@ from octopus.robot.sdk.AbstractPlugin import AbstractPlugin
 
 class Plugin(AbstractPlugin):
     SLUG = "cleancache"
+    KEYWORDS = ("清除缓存", "清空缓存", "清缓存")
 
     def handle(self, text, parsed):
         temp = constants.TEMP_PATH
@@ -10,6 +10,9 @@ logger = log.getLogger(__name__)
 
 
 class Plugin(AbstractPlugin):
+    SLUG = "echo"
+    KEYWORDS = ("echo", "传话")
+
     def handle(self, text, parsed):
         text = text.lower().replace("echo", "").replace("传话", "")
         self.say(text, cache=False)
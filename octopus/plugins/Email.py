@@ -12,6 +12,7 @@ from octopus.robot.sdk.AbstractPlugin import AbstractPlugin
 
 class Plugin(AbstractPlugin):
     SLUG = "email"
+    KEYWORDS = ("邮箱", "邮件")
 
     def getSender(self, msg):
         """
@@ -119,7 +120,9 @@ class Plugin(AbstractPlugin):
         logger = log.getLogger(__name__)
         profile = config.get()
         conn = imaplib.IMAP4(
-            profile[self.SLUG]["imap_server"], profile[self.SLUG]["imap_port"]
+            profile[self.SLUG]["imap_server"],
+            profile[self.SLUG]["imap_port"],
+            timeout=config.get("/email/timeout", 10),
         )
         conn.debug = 0
 
@@ -138,6 +141,8 @@ class Plugin(AbstractPlugin):
                 return numUnread
 
             for num in messages[0].split(b" "):
+                if self.is_cancelled():
+                    break
                 # parse email RFC822 format
                 ret, data = conn.fetch(num, "(RFC822)")
                 if data is None:
@@ -154,6 +159,8 @@ class Plugin(AbstractPlugin):
 
     def handle(self, text, parsed):
         msgs = self.fetchUnreadEmails(limit=5)
+        if self.is_cancelled():
+            return
 
         if msgs is None:
             self.say("抱歉，您的邮箱账户验证失败了", cache=True)
@@ -8,6 +8,7 @@ logger = log.getLogger(__name__)
 class Plugin(AbstractPlugin):
     IS_IMMERSIVE = True  # 这是个沉浸式技能
     SLUG = "geek"
+    KEYWORDS = ("模式",)
 
     def __init__(self, con):
         super(Plugin, self).__init__(con)
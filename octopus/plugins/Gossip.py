@@ -14,6 +14,7 @@ CLOSE_WORDS = ["退出", "结束", "停止"]
 
 class Plugin(AbstractPlugin):
     IS_IMMERSIVE = True
+    KEYWORDS = ("闲聊",)
 
     def handle(self, text, parsed):
 
@@ -11,6 +11,7 @@ logger = log.getLogger(__name__)
 
 class Plugin(AbstractPlugin):
     IS_IMMERSIVE = True  # 这是个沉浸式技能
+    KEYWORDS = ("本地音乐",)
 
     def __init__(self, con):
         super(Plugin, self).__init__(con)
@@ -13,6 +13,7 @@ logger = log.getLogger(__name__)
 
 class Plugin(AbstractPlugin):
     SLUG = "poem"
+    KEYWORDS = ("诗",)
 
     def handle(self, text, parsed):
         try:
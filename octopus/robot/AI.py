@@ -1,20 +1,92 @@
 # -*- coding: utf-8 -*-
+import functools
 import json
 import os
 import random
 import requests
+import time
 from abc import ABCMeta, abstractmethod
 from uuid import getnode as get_mac
 
-from octopus.robot import log, config, utils
+from octopus.robot import log, config, utils, metrics, registry
 from octopus.robot.sdk import unit
 
 logger = log.getLogger(__name__)
 
+m_request = metrics.histogram(
+    "octopus_ai_request_seconds", "对话机器人请求耗时", labelnames=("robot", "mode")
+)
+m_first_token = metrics.histogram(
+    "octopus_ai_first_token_seconds", "流式请求首个分片的耗时", labelnames=("robot",)
+)
+m_errors = metrics.counter(
+    "octopus_ai_errors", "对话机器人请求失败次数", labelnames=("robot",)
+)
+
+
+def _timed_chat(func):
+    @functools.wraps(func)
+    def chat(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        except Exception:
+            m_errors.labels(self.SLUG).inc()
+            raise
+        finally:
+            m_request.labels(self.SLUG, "chat").observe(time.perf_counter() - start)
+
+    return chat
+
+
+def _timed_stream_chat(func):
+    @functools.wraps(func)
+    def stream_chat(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            generate = func(self, *args, **kwargs)
+        except Exception:
+            m_errors.labels(self.SLUG).inc()
+            raise
+        if not callable(generate):
+            return generate
+
+        def timed():
+            generator = generate()
+            first = True
+            try:
+                for data in generator:
+                    if first:
+                        first = False
+                        m_first_token.labels(self.SLUG).observe(
+                            time.perf_counter() - start
+                        )
+                    yield data
+            except Exception:
+                m_errors.labels(self.SLUG).inc()
+                raise
+            finally:
+                generator.close()
+                m_request.labels(self.SLUG, "stream").observe(
+                    time.perf_counter() - start
+                )
+
+        return timed
+
+    return stream_chat
+
 
 class AbstractRobot(object):
     __metaclass__ = ABCMeta
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # 统计实现类的请求耗时
+        if "chat" in cls.__dict__:
+            cls.chat = _timed_chat(cls.__dict__["chat"])
+        if "stream_chat" in cls.__dict__:
+            cls.stream_chat = _timed_stream_chat(cls.__dict__["stream_chat"])
+
     @classmethod
     def get_instance(cls):
         profile = cls.get_config()
@@ -27,6 +99,10 @@ class AbstractRobot(object):
     def support_stream(self):
         return False
 
+    def warm_up(self):
+        """预热: 提前建立连接(启动时并发调用)"""
+        pass
+
     @abstractmethod
     def chat(self, texts, parsed, **kwargs):
         pass
@@ -144,6 +220,7 @@ class BingRobot(AbstractRobot):
         msg = utils.stripEndPunc(msg)
         try:
             import asyncio, json
+            from concurrent.futures import ThreadPoolExecutor
             from EdgeGPT.EdgeGPT import Chatbot, ConversationStyle
 
             async def query_bing():
@@ -163,7 +240,9 @@ class BingRobot(AbstractRobot):
                 return response["text"]
                 await bot.close()
 
-            result = asyncio.run(query_bing())
+            # 在独立线程的事件循环中执行(调用方可能是运行着事件循环的 tornado 线程)
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(asyncio.run, query_bing()).result()
 
             logger.debug("{} 回答：{}".format(self.SLUG, result))
             return result
@@ -281,6 +360,7 @@ class OPENAIRobot(AbstractRobot):
         self.presence_penalty = presence_penalty
         self.stop_ai = stop_ai
         self.api_base = api_base if api_base else "https://api.openai.com/v1/chat"
+        self.http = requests.Session()  # 复用连接
         self.context = []
 
     @classmethod
@@ -288,20 +368,29 @@ class OPENAIRobot(AbstractRobot):
         # Try to get anyq config from config
         return config.get("openai", {})
 
+    def warm_up(self):
+        # 建立TLS连接并留在连接池中, 首次对话不再握手
+        self.http.head(
+            self.api_base,
+            timeout=5,
+            proxies={"https": self.openai and self.openai.proxy},
+        )
+
     def support_stream(self):
         return True
 
-    def stream_chat(self, texts, **kwargs):
+    def stream_chat(self, texts, context: list = None, **kwargs):
         """
         从ChatGPT API获取回复
         :return: 回复
         """
+        context = self.context if context is None else context
 
         msg = "".join(texts)
         msg = utils.stripEndPunc(msg)
         msg = self.prefix + msg  # 增加一段前缀
         logger.debug("msg: " + msg)
-        self.context.append({"role": "user", "content": msg})
+        context.append({"role": "user", "content": msg})
 
         header = {
             "Content-Type": "application/json",
@@ -316,14 +405,14 @@ class OPENAIRobot(AbstractRobot):
                 "Please check your config file, OpenAiRobot's provider should be openai or azure."
             )
 
-        data = {"model": self.model, "messages": self.context, "stream": True}
+        data = {"model": self.model, "messages": context, "stream": True}
         logger.debug(f"使用模型：{self.model}，开始流式请求")
         url = self.api_base + "/completions"
         if self.provider == "azure":
             url = f"{self.api_base}/openai/deployments/{self.model}/chat/completions?api-version={self.api_version}"
         # 请求接收流式数据
         try:
-            response = requests.request(
+            response = self.http.request(
                 "POST",
                 url,
                 headers=header,
@@ -335,28 +424,35 @@ class OPENAIRobot(AbstractRobot):
             def generate():
                 contants = []
                 i = 0
-                for line in response.iter_lines():
-                    line_str = str(line, encoding="utf-8")
-                    if line_str.startswith("data:") and line_str[5:]:
-                        if line_str.startswith("data: [DONE]"):
-                            break
-                        line_json = json.loads(line_str[5:])
-                        choices = line_json.get("choices", [])
-                        if choices:
-                            delta_content = (
-                                choices[0].get("delta", {}).get("content", "")
-                            )
-                            i += 1
-                            if i < 40:
-                                logger.debug(delta_content)  # , end="")
-                            elif i == 40:
-                                logger.debug("......")
-                            contants.append(delta_content)
-                            yield delta_content
-                    elif len(line_str.strip()) > 0:
-                        logger.debug(line_str)
-                        yield line_str
-                self.context.append({"role": "assistant", "content": "".join(contants)})
+                debug = logger.isEnabledFor(log.DEBUG)
+                try:
+                    for line in response.iter_lines():
+                        line_str = str(line, encoding="utf-8")
+                        if line_str.startswith("data:") and line_str[5:]:
+                            if line_str.startswith("data: [DONE]"):
+                                break
+                            line_json = json.loads(line_str[5:])
+                            choices = line_json.get("choices", [])
+                            if choices:
+                                delta_content = (
+                                    choices[0].get("delta", {}).get("content", "")
+                                )
+                                i += 1
+                                if debug and i < 40:
+                                    logger.debug(delta_content)  # , end="")
+                                elif debug and i == 40:
+                                    logger.debug("......")
+                                contants.append(delta_content)
+                                yield delta_content
+                        elif len(line_str.strip()) > 0:
+                            logger.debug(line_str)
+                            yield line_str
+                finally:
+                    # 提前结束(取消)时也关闭连接
+                    response.close()
+                    context.append(
+                        {"role": "assistant", "content": "".join(contants)}
+                    )
 
         except Exception as e:
             ee = e
@@ -366,24 +462,25 @@ class OPENAIRobot(AbstractRobot):
 
         return generate
 
-    def chat(self, texts, parsed):
+    def chat(self, texts, parsed, context: list = None, **kwargs):
         """
         使用OpenAI机器人聊天
 
         Arguments:
         texts -- user input, typically speech, to be parsed by a module
         """
+        context = self.context if context is None else context
         msg = "".join(texts)
         msg = utils.stripEndPunc(msg)
         msg = self.prefix + msg  # 增加一段前缀
         logger.debug("msg: " + msg)
         try:
             respond = ""
-            self.context.append({"role": "user", "content": msg})
+            context.append({"role": "user", "content": msg})
             if self.provider == "openai":
                 response = self.openai.Completion.create(
                     model=self.model,
-                    messages=self.context,
+                    messages=context,
                     temperature=self.temperature,
                     max_tokens=self.max_tokens,
                     top_p=self.top_p,
@@ -401,16 +498,16 @@ class OPENAIRobot(AbstractRobot):
                     api_version=self.api_version,
                 )
                 response = client.chat.completions.create(
-                    model=self.model, messages=self.context
+                    model=self.model, messages=context
                 )
             message = response.choices[0].message
             respond = message.content
-            self.context.append(message)
+            context.append(message)
             return respond
         except self.openai.error.InvalidRequestError:
             logger.warning("token超出长度限制，丢弃历史会话")
-            self.context = []
-            return self.chat(texts, parsed)
+            context.clear()
+            return self.chat(texts, parsed, context=context)
         except Exception:
             logger.critical(
                 "openai robot failed to response for %r", msg, exc_info=True
@@ -538,6 +635,7 @@ class FastGPTRobot(AbstractRobot):
         self.prefix = prefix
         self.api_base = api_base if api_base else "https://api.tryfastgpt.ai"
         self.app_id = app_id
+        self.http = requests.Session()  # 复用连接
         self.context = []
         if proxy:
             logger.info(f"{self.SLUG} 使用代理：{proxy}")
@@ -547,16 +645,28 @@ class FastGPTRobot(AbstractRobot):
         # Try to get anyq config from config
         return config.get("fastgpt", {})
 
+    def warm_up(self):
+        # 建立TLS连接并留在连接池中, 首次对话不再握手
+        self.http.head(self.api_base, timeout=5, proxies={"https": self.proxy})
+
     def support_stream(self):
         return True
 
     def stream_chat(
-        self, texts, chat_id=None, data_id=None, response_id=None, vars=None, **kwargs
+        self,
+        texts,
+        chat_id=None,
+        data_id=None,
+        response_id=None,
+        vars=None,
+        context: list = None,
+        **kwargs,
     ):
         """
         从FastGPT API获取回复
         :return: 回复
         """
+        context = self.context if context is None else context
         header = {
             "Content-Type": "application/json",
             "Authorization": "Bearer " + self.api_key,
@@ -569,9 +679,9 @@ class FastGPTRobot(AbstractRobot):
         dict_msg = {"role": "user", "content": msg}
         if data_id:  # req数据ID
             dict_msg.update(dataId=data_id)
-        self.context.append(dict_msg)
+        context.append(dict_msg)
 
-        data = {"messages": self.context, "stream": True}
+        data = {"messages": context, "stream": True}
         if self.app_id:
             data.update(appId=self.app_id)
         if chat_id:  # 会话ID
@@ -585,7 +695,7 @@ class FastGPTRobot(AbstractRobot):
         url = self.api_base + "/api/v1/chat/completions"
         # 请求接收流式数据
         try:
-            response = requests.request(
+            response = self.http.request(
                 method="POST",
                 url=url,
                 headers=header,
@@ -597,27 +707,36 @@ class FastGPTRobot(AbstractRobot):
             def generate():
                 contants = []
                 i = 0
-                for line in response.iter_lines():
-                    line_str = str(line, encoding="utf-8")
-                    if line_str.startswith("data:") and line_str[5:]:
-                        if line_str.startswith("data: [DONE]"):
-                            break
-                        line_json = json.loads(line_str[5:])
-                        choices = line_json.get("choices", [])
-                        if not choices:
-                            continue
-                        delta_content = choices[0].get("delta", {}).get("content", "")
-                        i += 1
-                        if i < 40:
-                            logger.debug(delta_content)  # , end="")
-                        elif i == 40:
-                            logger.debug("......")
-                        contants.append(delta_content)
-                        yield delta_content
-                    elif len(line_str.strip()) > 0:
-                        logger.debug(line_str)
-                        yield line_str
-                self.context.append({"role": "assistant", "content": "".join(contants)})
+                debug = logger.isEnabledFor(log.DEBUG)
+                try:
+                    for line in response.iter_lines():
+                        line_str = str(line, encoding="utf-8")
+                        if line_str.startswith("data:") and line_str[5:]:
+                            if line_str.startswith("data: [DONE]"):
+                                break
+                            line_json = json.loads(line_str[5:])
+                            choices = line_json.get("choices", [])
+                            if not choices:
+                                continue
+                            delta_content = (
+                                choices[0].get("delta", {}).get("content", "")
+                            )
+                            i += 1
+                            if debug and i < 40:
+                                logger.debug(delta_content)  # , end="")
+                            elif debug and i == 40:
+                                logger.debug("......")
+                            contants.append(delta_content)
+                            yield delta_content
+                        elif len(line_str.strip()) > 0:
+                            logger.debug(line_str)
+                            yield line_str
+                finally:
+                    # 提前结束(取消)时也关闭连接
+                    response.close()
+                    context.append(
+                        {"role": "assistant", "content": "".join(contants)}
+                    )
 
         except Exception as e:
             ee = e
@@ -635,6 +754,7 @@ class FastGPTRobot(AbstractRobot):
         data_id=None,
         response_id=None,
         vars=None,
+        context: list = None,
         **kwargs,
     ):
         """
@@ -643,6 +763,7 @@ class FastGPTRobot(AbstractRobot):
         Arguments:
         texts -- user input, typically speech, to be parsed by a module
         """
+        context = self.context if context is None else context
         header = {
             "Content-Type": "application/json",
             "Authorization": "Bearer " + self.api_key,
@@ -655,9 +776,9 @@ class FastGPTRobot(AbstractRobot):
         dict_msg = {"role": "user", "content": msg}
         if data_id:  # req数据ID
             dict_msg.update(dataId=data_id)
-        self.context.append(dict_msg)
+        context.append(dict_msg)
 
-        data = {"messages": self.context, "stream": False}
+        data = {"messages": context, "stream": False}
         if self.app_id:
             data.update(appId=self.app_id)
         if chat_id:  # 会话ID
@@ -671,7 +792,7 @@ class FastGPTRobot(AbstractRobot):
         url = self.api_base + "/api/v1/chat/completions"
         # 请求接收流式数据
         try:
-            response = requests.request(
+            response = self.http.request(
                 method="POST",
                 url=url,
                 headers=header,
@@ -689,7 +810,7 @@ class FastGPTRobot(AbstractRobot):
                 if msg_txt:
                     contents.append(msg_txt)
             content = "".join(contents)
-            self.context.append({"role": "assistant", "content": content})
+            context.append({"role": "assistant", "content": content})
             return content
         except Exception as e:
             logger.critical("FastGPT failed to response for %r", str(e), exc_info=True)
@@ -718,7 +839,7 @@ class FastGPTRobot(AbstractRobot):
         url = self.api_base + "/api/core/chat/feedback/updateUserFeedback"
         # 请求数据
         try:
-            response = requests.request(
+            response = self.http.request(
                 method="POST",
                 url=url,
                 headers=header,
@@ -756,6 +877,11 @@ def get_robot_by_slug(slug):
     if not slug or type(slug) is not str:
         raise TypeError("Invalid slug '%s'", slug)
 
+    robot = registry.find("ai", slug)
+    if robot:
+        logger.info(f"使用 {robot.SLUG} 对话机器人")
+        return robot.get_instance()
+
     selected_robots = list(
         filter(
             lambda robot: hasattr(robot, "SLUG") and robot.SLUG == slug, get_robots()
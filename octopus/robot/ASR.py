@@ -3,15 +3,8 @@ import time
 from abc import ABCMeta, abstractmethod
 
 import requests
-from aip import AipSpeech
 
-from octopus.robot import log, utils, config
-from octopus.robot.sdk import AliSpeech, XunfeiSpeech, BaiduSpeech, FunASREngine
-from octopus.robot.sdk.TencentSpeech import (
-    Credential,
-    RecognizeListener,
-    SpeechRecognizer,
-)
+from octopus.robot import log, utils, config, registry
 
 logger = log.getLogger(__name__)
 
@@ -110,8 +103,12 @@ class BaiduASR(AbstractASR):
     def __init__(self, appid, api_key, secret_key, dev_pid=1936, **args):
         super(self.__class__, self).__init__()
         if dev_pid != 80001:
+            from aip import AipSpeech
+
             self.client = AipSpeech(appid, api_key, secret_key)
         else:
+            from octopus.robot.sdk import BaiduSpeech
+
             self.client = BaiduSpeech.baiduSpeech(api_key, secret_key, dev_pid)
         self.dev_pid = dev_pid
 
@@ -139,7 +136,9 @@ class BaiduASR(AbstractASR):
             return ""
 
 
-class TencentASRListener(RecognizeListener):
+class TencentASRListener(object):
+    """实现 TencentSpeech.RecognizeListener 的回调(不继承, SDK在识别时才导入)"""
+
     def __init__(self):
         self.words = []
 
@@ -174,6 +173,8 @@ class TencentASR(AbstractASR):
     SLUG = "tencent-asr"
 
     def __init__(self, appid, secretid, secret_key, engine_model_type=None, **kwargs):
+        from octopus.robot.sdk.TencentSpeech import Credential
+
         super(self.__class__, self).__init__()
         self.app_id = appid
         self.engine_model_type = engine_model_type or "16k_zh_en"
@@ -192,6 +193,8 @@ class TencentASR(AbstractASR):
         mp3_path = fp
         if isinstance(mp3_path, str):
             mp3_path = utils.convert_wav_to_mp3(wav_path=mp3_path)
+        from octopus.robot.sdk.TencentSpeech import SpeechRecognizer
+
         # init
         recognizer = SpeechRecognizer(
             app_id=self.app_id,
@@ -233,6 +236,8 @@ class XunfeiASR(AbstractASR):
         return config.get("xunfei_yuyin", {})
 
     def transcribe(self, fp):
+        from octopus.robot.sdk import XunfeiSpeech
+
         return XunfeiSpeech.transcribe(fp, self.appid, self.api_key, self.api_secret)
 
 
@@ -243,9 +248,17 @@ class AliASR(AbstractASR):
 
     SLUG = "ali-asr"
 
-    def __init__(self, appKey, token, **args):
+    def __init__(self, appKey, token, access_key_id="", access_key_secret="", **args):
+        from octopus.robot.sdk import AliSpeech
+
         super(self.__class__, self).__init__()
         self.appKey, self.token = appKey, token
+        self.access_key = (access_key_id, access_key_secret)
+        if access_key_id:
+            try:
+                AliSpeech.get_token(self.token, *self.access_key)
+            except Exception:
+                logger.error(f"{self.SLUG} 令牌获取失败", exc_info=True)
 
     @classmethod
     def get_config(cls):
@@ -253,7 +266,14 @@ class AliASR(AbstractASR):
         return config.get("ali_yuyin", {})
 
     def transcribe(self, fp):
-        result = AliSpeech.asr(self.appKey, self.token, fp)
+        from octopus.robot.sdk import AliSpeech
+
+        try:
+            token = AliSpeech.get_token(self.token, *self.access_key)
+        except Exception:
+            logger.error(f"{self.SLUG} 令牌获取失败", exc_info=True)
+            return ""
+        result = AliSpeech.asr(self.appKey, token, fp)
         if result:
             logger.debug(f"{self.SLUG} 语音识别到了：{result}")
             return result
@@ -307,6 +327,8 @@ class FunASR(AbstractASR):
     SLUG = "fun-asr"
 
     def __init__(self, inference_type, model_dir, **args):
+        from octopus.robot.sdk import FunASREngine
+
         super(self.__class__, self).__init__()
         self.engine = FunASREngine.funASREngine(inference_type, model_dir)
 
@@ -336,6 +358,11 @@ def get_engine_by_slug(slug=None):
     if not slug or type(slug) is not str:
         raise TypeError("无效的 ASR slug '%s'", slug)
 
+    engine = registry.find("asr", slug)
+    if engine:
+        logger.info(f"使用 {engine.SLUG} ASR 引擎")
+        return engine.get_instance()
+
     selected_engines = list(
         filter(
             lambda engine: hasattr(engine, "SLUG") and engine.SLUG == slug,
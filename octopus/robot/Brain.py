@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 import re
-import traceback
 
 from octopus.robot import config, log, plugin_loader
+from octopus.robot.plugin_runner import PluginBusy, PluginRunner
+from octopus.robot.router import IntentRouter
 
 logger = log.getLogger(__name__)
 
@@ -20,23 +21,39 @@ class Brain(object):
         self.plugins = []
         if config.get(item="plugin_enable", default=False):
             self.plugins = plugin_loader.get_plugins(self.conversation)
+        # 插件的自定义匹配规则
+        self.patterns = {
+            plugin.SLUG: config.bind(f"/{plugin.SLUG}/patterns", default=())
+            for plugin in self.plugins
+        }
+        self.router = IntentRouter(plugins=self.plugins, get_patterns=self.get_patterns)
+        self.runner = PluginRunner(
+            on_error=self._on_plugin_error, on_slow=self._on_plugin_slow
+        )
         self.handling = False
 
     def match(self, patterns, text):
+        """已废弃, 匹配规则由 router 预编译"""
         for pattern in patterns:
             if re.match(pattern, text):
                 return True
         return False
 
+    def get_patterns(self, plugin) -> tuple:
+        binding = self.patterns.get(plugin.SLUG)
+        if binding is None:
+            return config.get(f"/{plugin.SLUG}/patterns", ())
+        return binding.value
+
     def isValid(self, plugin, text, parsed):
-        patterns = config.get(f"/{plugin.SLUG}/patterns", [])
+        patterns = self.get_patterns(plugin)
         if len(patterns) > 0:
             return plugin.isValid(text, parsed) or self.match(patterns, text)
         else:
             return plugin.isValid(text, parsed)
 
     def isValidImmersive(self, plugin, text, parsed):
-        patterns = config.get(f"/{plugin.SLUG}/patterns", [])
+        patterns = self.get_patterns(plugin)
         if len(patterns) > 0:
             return plugin.isValidImmersive(text, parsed) or self.match(patterns, text)
         else:
@@ -44,10 +61,26 @@ class Brain(object):
 
     def isImmersive(self, plugin, text, parsed):
         return (
-            self.conversation.getImmersiveMode() == plugin.SLUG
+            self.conversation.get_immersive_mode() == plugin.SLUG
             and self.isValidImmersive(plugin, text, parsed)
         )
 
+    def plugin_report(self) -> list:
+        """插件是否已加载, 加载耗时及处理耗时"""
+        timings = {timing["slug"]: timing for timing in plugin_loader.report()}
+        runs = self.runner.report()
+        return [
+            dict(
+                timings.get(plugin.SLUG, {}),
+                slug=plugin.SLUG,
+                priority=plugin.PRIORITY,
+                loaded=plugin.loaded,
+                failed=plugin.failed,
+                runs=runs.get(plugin.SLUG),
+            )
+            for plugin in self.plugins
+        ]
+
     def printPlugins(self):
         plugin_list = []
         for plugin in self.plugins:
@@ -63,27 +96,20 @@ class Brain(object):
         parsed -- ULU解析出来的结果
         """
 
-        for plugin in self.plugins:
-            if not self.isValid(plugin, text, parsed) and not self.isImmersive(
-                plugin, text, parsed
-            ):
-                continue
-
+        immersive = self.conversation.get_immersive_mode()
+        for plugin in self.router.route(text, parsed, immersive=immersive):
             logger.info(f"'{text}' 命中技能 {plugin.SLUG}")
             self.conversation.set_plugin(plugin.SLUG)
 
             if plugin.IS_IMMERSIVE:
-                self.conversation.setImmersiveMode(plugin.SLUG)
+                self.conversation.set_immersive_mode(plugin.SLUG)
 
             continueHandle = False
             try:
                 self.handling = True
-                continueHandle = plugin.handle(text, parsed)
-                self.handling = False
-            except Exception as e:
-                logger.critical(f"Failed to execute plugin: {e}", stack_info=True)
-                traceback.print_exc()
-                reply = f"抱歉，插件{plugin.SLUG}出故障了，晚点再试试吧"
+                continueHandle = self.runner.run(plugin, text, parsed)
+            except PluginBusy:
+                reply = "抱歉，正在处理的事情太多了，晚点再试试吧"
                 self.conversation.say_simple(msg=reply, plugin=plugin.SLUG)
             else:
                 logger.debug(
@@ -92,12 +118,27 @@ class Brain(object):
                     plugin.SLUG,
                 )
             finally:
+                self.handling = False
                 if not continueHandle:
                     return True
 
         logger.debug(f"No plugin was able to handle phrase {text} ")
         return False
 
+    def cancel(self):
+        """打断: 取消执行中的技能"""
+        self.runner.cancel()
+
+    def _on_plugin_error(self, plugin, e):
+        logger.critical(f"Failed to execute plugin: {e}", exc_info=e)
+        reply = f"抱歉，插件{plugin.SLUG}出故障了，晚点再试试吧"
+        self.conversation.say_simple(msg=reply, plugin=plugin.SLUG)
+
+    def _on_plugin_slow(self, plugin):
+        ack = config.get("/plugin_executor/ack", "还在处理中，请稍等")
+        if ack:
+            self.conversation.say_simple(msg=ack, plugin=plugin.SLUG, cache=True)
+
     def restore(self):
         """恢复某个技能的处理"""
         immersive_mode = self.conversation.get_immersive_mode()
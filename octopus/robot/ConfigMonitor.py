@@ -22,5 +22,6 @@ class ConfigMonitor(FileSystemEventHandler):
         if extension in (".yaml", ".yml"):
             if utils.validyaml(filename):
                 logger.info(f"检测到文件 {filename} 发生变更")
+                old = config.snapshot()
                 config.reload()
-                self._conversation.re_init()
+                self._conversation.reload_config(old=old, new=config.snapshot())
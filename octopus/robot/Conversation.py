@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import contextlib
 import os
 import re
 import threading
@@ -13,6 +14,7 @@ from octopus.robot import (
     ASR,
     config,
     log,
+    metrics,
     NLU,
     Player,
     TTS,
@@ -32,7 +34,10 @@ from octopus.robot.Sender import (
     WebSocketSender,
 )
 from octopus.robot.compt import StreamStr
+from octopus.robot.reloader import ReloadPlanner
 from octopus.robot.sdk import History
+from octopus.robot.session import SessionManager
+from octopus.robot.tracer import tracer
 
 # tts输出规则
 re_tts = {
@@ -61,6 +66,11 @@ re_out = {
 
 logger = log.getLogger(__name__)
 
+m_tts_cache = metrics.counter(
+    "octopus_tts_cache", "TTS缓存命中情况", labelnames=("result",)
+)
+m_sentences = metrics.counter("octopus_speaker_sentences", "朗读的句子数")
+
 
 class Conversation(object):
 
@@ -78,6 +88,10 @@ class Conversation(object):
         self.plugin_cache = None
         self.immersive_mode = None
         self.profiling = profiling
+        # 耗时追踪
+        self.tracer = tracer
+        if profiling:
+            tracer.profiling()
         self.on_say = None
         self.on_stream = None
         self.sender = sender
@@ -87,8 +101,15 @@ class Conversation(object):
         self.resp_uuid = None  # 当前响应标记
         self.listener = None  # 聆听者
         self.speaker = OrderSpeaker(life_cycle_event=life_cycle_event, sender=sender)
+        # 文字会话(API)
+        self.sessions = SessionManager()
         # 初始化
         self.re_init()
+        # 配置热更新
+        self.reloader = ReloadPlanner(on_ready=self._on_reload_ready)
+        self.turns = 0  # 进行中的对话轮数, 期间不替换组件
+        self.turn_lock = threading.Lock()
+        self._register_components()
 
     def re_init(self):
         """重新初始化"""
@@ -102,13 +123,95 @@ class Conversation(object):
         except Exception as e:
             logger.critical("对话初始化失败：%s", str(e), exc_info=True)
 
-    def do_response(self, query, req_uuid=None, onSay=None):
+    def reload_config(self, old: config.Snapshot, new: config.Snapshot):
+        """配置变更: 只重建受影响的组件, 在两轮对话之间替换"""
+        self.reloader.reload(old=old, new=new)
+
+    def is_idle(self) -> bool:
+        """没有进行中的对话, 没有在朗读或执行技能(包括转入后台执行的技能)"""
+        return (
+            not self.turns
+            and not self.speaker.speaking.is_set()
+            and not (self.brain and (self.brain.handling or self.brain.runner.busy))
+        )
+
+    def _on_reload_ready(self):
+        with self.turn_lock:
+            if self.is_idle():
+                self.reloader.apply()
+
+    @contextlib.contextmanager
+    def _turn(self):
+        """一轮对话: 开始前替换热更新的组件, 进行中不替换, 结束后空闲时替换"""
+        with self.turn_lock:
+            if self.is_idle():
+                self.reloader.apply()
+            self.turns += 1
+        try:
+            yield
+        finally:
+            with self.turn_lock:
+                self.turns -= 1
+            if self.reloader.pending:
+                self._on_reload_ready()
+
+    def _register_components(self):
+        register = self.reloader.register
+        register(
+            "asr",
+            build=lambda: ASR.get_engine_by_slug(
+                config.get("asr_engine", "tencent-asr")
+            ),
+            current=lambda: self.asr,
+            swap=lambda new, old: setattr(self, "asr", new),
+            keys=("asr_engine",),
+        )
+        register(
+            "ai",
+            build=lambda: AI.get_robot_by_slug(config.get("robot", "tuling")),
+            current=lambda: self.ai,
+            swap=self._swap_ai,
+            keys=("robot",),
+        )
+        register(
+            "nlu",
+            build=lambda: NLU.get_engine_by_slug(config.get("nlu_engine", "unit")),
+            current=lambda: self.nlu,
+            swap=lambda new, old: setattr(self, "nlu", new),
+            keys=("nlu_engine",),
+        )
+        # 插件初始化时引用了nlu
+        register(
+            "brain",
+            build=lambda: Brain(self),
+            current=lambda: self.brain,
+            swap=self._swap_brain,
+            keys=lambda: ["plugin_enable", "nlu_engine"]
+            + [f"/{plugin.SLUG}" for plugin in self.brain.plugins],
+        )
+        self.speaker.register_components(register=register)
+
+    def _swap_ai(self, new, old):
+        # 保留对话上下文
+        if isinstance(getattr(old, "context", None), list) and isinstance(
+            getattr(new, "context", None), list
+        ):
+            new.context = old.context
+        self.ai = new
+
+    def _swap_brain(self, new, old):
+        self.brain = new
+        self.brain.printPlugins()
+        old and old.runner.shutdown()
+
+    def do_response(self, query, req_uuid=None, onSay=None, user_id=None):
         """
         响应指令
 
         :param query: 指令
         :param req_uuid: 指令的UUID
         :param onSay: 朗读时的回调
+        :param user_id: 提问的用户, 回复只发给该用户的频道(为空时广播)
         """
         # 空内容
         if not query:
@@ -119,21 +222,146 @@ class Conversation(object):
         # 停止说话
         if query in ["暂停。", "停止。", "闭嘴。", "停一下。"]:
             return
+        # 替换热更新的组件
+        with self._turn():
+            self._append_history(t=0, text=query, text_id=req_uuid)
+            if onSay:
+                self.set_on_say(onSay)
+
+            # 清除中断标记
+            self.clear_interrupt()
+            # 响应内容
+            # todo: 调用NLU, 识别指令动作
+            # nlu_res = self.do_parse(query=query)
+            # 没命中技能，使用机器人回复
+            resp_uuid = uuid.uuid4().hex
+            self.resp_uuid = resp_uuid
+            tracer.bind(resp_uuid=resp_uuid)
+            try:
+                # 不用self.resp_uuid, 避免多线程冲突
+                self._response_gpt(query=query, resp_uuid=resp_uuid, user_id=user_id)
+            finally:
+                tracer.end(resp_uuid=resp_uuid)
+
+    def do_stream(
+        self,
+        query,
+        on_delta,
+        req_uuid=None,
+        resp_uuid=None,
+        tts=False,
+        canceled=None,
+        session_id=None,
+        user_id=None,
+    ):
+        """
+        流式响应单个请求(不经过状态机)
+
+        :param query: 指令
+        :param on_delta: 每段文字的回调
+        :param req_uuid: 指令的UUID
+        :param resp_uuid: 响应的UUID
+        :param tts: 是否朗读, 否则只输出文字
+        :param canceled: 取消标记(threading.Event), 设置后停止请求
+        :param session_id: 会话ID, 会话之间上下文隔离; 同一会话的新请求会打断之前的请求
+        :param user_id: 提问的用户, 朗读时的回复只发给该用户的频道
+        :return: 响应的UUID
+        """
+        if tts:
+            self.interrupt()
+        # 替换热更新的组件
+        with self._turn():
+            return self._do_stream(
+                query=query,
+                on_delta=on_delta,
+                req_uuid=req_uuid,
+                resp_uuid=resp_uuid,
+                tts=tts,
+                canceled=canceled,
+                session_id=session_id,
+                user_id=user_id,
+            )
 
+    def _do_stream(
+        self, query, on_delta, req_uuid, resp_uuid, tts, canceled, session_id, user_id
+    ):
+        resp_uuid = resp_uuid or uuid.uuid4().hex
+        req_uuid = req_uuid or uuid.uuid4().hex
+        tracer.bind(resp_uuid=resp_uuid, source="api", current=False)
+        session, context, interrupted = None, None, None
+        if session_id:
+            session = self.sessions.get(session_id)
+            interrupted = session.begin(resp_uuid=resp_uuid)
+            context = session.context
+        if tts:
+            self.clear_interrupt()
+            self.resp_uuid = resp_uuid
         self._append_history(t=0, text=query, text_id=req_uuid)
-        if onSay:
-            self.set_on_say(onSay)
+        if not self.ai.support_stream():
+            parsed = {"Domain": "", "Intent": "", "Slot": query}
+            tracer.mark("llm_request", resp_uuid=resp_uuid)
+            if context is None:
+                msg = self.ai.chat(texts=query, parsed=parsed, chat_id=resp_uuid)
+            else:
+                msg = self.ai.chat(
+                    texts=query, parsed=parsed, chat_id=resp_uuid, context=context
+                )
+            tracer.mark("first_token", resp_uuid=resp_uuid)
+            on_delta(msg)
+            if tts:
+                self._say(
+                    resp_uuid=resp_uuid,
+                    msg=msg,
+                    cache=True,
+                    with_interrupt=True,
+                    user_id=user_id,
+                )
+            else:
+                self._append_history(t=1, text=msg, text_id=resp_uuid)
+            if session:
+                session.cursor = resp_uuid
+            tracer.end(resp_uuid=resp_uuid)
+            return resp_uuid
+        tracer.mark("llm_request", resp_uuid=resp_uuid)
+        if context is None:
+            stream = self.ai.stream_chat(
+                texts=query, chat_id=resp_uuid, response_id=resp_uuid
+            )
+        else:
+            stream = self.ai.stream_chat(
+                texts=query, chat_id=resp_uuid, response_id=resp_uuid, context=context
+            )
+        data_list = []
 
-        # 清除中断标记
-        self.clear_interrupt()
-        # 响应内容
-        # todo: 调用NLU, 识别指令动作
-        # nlu_res = self.do_parse(query=query)
-        # 没命中技能，使用机器人回复
-        resp_uuid = uuid.uuid4().hex
-        self.resp_uuid = resp_uuid
-        # 不用self.resp_uuid, 避免多线程冲突
-        self._response_gpt(query=query, resp_uuid=resp_uuid)
+        def tee():
+            generator = stream()
+            try:
+                for data in generator:
+                    if (canceled and canceled.is_set()) or (
+                        interrupted and interrupted.is_set()
+                    ):
+                        logger.debug("流式请求已取消: %s", resp_uuid)
+                        break
+                    tracer.mark("first_token", resp_uuid=resp_uuid)
+                    data_list.append(data)
+                    on_delta(data)
+                    yield data
+            finally:
+                # 关闭上游请求
+                generator.close()
+
+        if tts:
+            self._stream_say(
+                resp_uuid=resp_uuid, stream=tee, cache=True, user_id=user_id
+            )
+        else:
+            for _ in tee():
+                pass
+            self._append_history(t=1, text="".join(data_list), text_id=resp_uuid)
+        if session:
+            session.cursor = resp_uuid
+        tracer.end(resp_uuid=resp_uuid)
+        return resp_uuid
 
     def say_simple(
         self,
@@ -177,12 +405,15 @@ class Conversation(object):
 
     def interrupt(self, req_id=None, manual=False, interrupt_time=None):
         self.interrupted.set()
-        self.speaker.interrupt(req_id or self.resp_uuid)
-        if self.immersive_mode:
-            self.brain.pause()
+        req_id = req_id or self.resp_uuid
+        self.speaker.interrupt(req_id)
+        if self.brain:
+            self.brain.cancel()
+            if self.immersive_mode:
+                self.brain.pause()
         # 清空数据
         if manual:
-            self.sender.clear_message()
+            self.sender.clear_message(resp_uuid=req_id)
         # 打断时间
         if interrupt_time:
             time.sleep(interrupt_time)
@@ -230,7 +461,8 @@ class Conversation(object):
     def do_converse(self, voice, callback=None, onSay=None):
         query = ""
         try:
-            query = self.asr.transcribe(voice)
+            with self._turn():
+                query = self.asr.transcribe(voice)
         except Exception as e:
             logger.critical("ASR识别失败：%s", str(e), exc_info=True)
             traceback.print_exc()
@@ -264,13 +496,15 @@ class Conversation(object):
     def clear_break_time(self):
         self.manual_break_time = None
 
-    def _response_gpt(self, query, resp_uuid):
+    def _response_gpt(self, query, resp_uuid, user_id=None):
         if self.ai and self.ai.support_stream():
             self.sender.put_message(
                 action=ACTION_ROBOT_THINK,
                 data=StatusData(stage=STAGE_SEARCH, end=False).dict(),
                 message="开始查找资料",
+                user_id=user_id,
             )
+            tracer.mark("llm_request", resp_uuid=resp_uuid)
             stream = self.ai.stream_chat(
                 texts=query, chat_id=resp_uuid, response_id=resp_uuid
             )
@@ -278,12 +512,14 @@ class Conversation(object):
                 action=ACTION_ROBOT_THINK,
                 data=StatusData(stage=STAGE_SEARCH, end=True).dict(),
                 message="查找资料结束",
+                user_id=user_id,
             )
             self._stream_say(
                 resp_uuid=resp_uuid,
                 stream=stream,
                 cache=True,
                 on_completed=self.check_restore,
+                user_id=user_id,
             )
         else:
             parsed = {"Domain": "", "Intent": "", "Slot": query}
@@ -291,12 +527,16 @@ class Conversation(object):
                 action=ACTION_ROBOT_THINK,
                 data=StatusData(stage=STAGE_SEARCH, end=False).dict(),
                 message="开始查找资料",
+                user_id=user_id,
             )
+            tracer.mark("llm_request", resp_uuid=resp_uuid)
             msg = self.ai.chat(texts=query, parsed=parsed, chat_id=resp_uuid)
+            tracer.mark("first_token", resp_uuid=resp_uuid)
             self.sender.put_message(
                 action=ACTION_ROBOT_THINK,
                 data=StatusData(stage=STAGE_SEARCH, end=True).dict(),
                 message="查找资料结束",
+                user_id=user_id,
             )
             self._say(
                 resp_uuid=resp_uuid,
@@ -304,14 +544,18 @@ class Conversation(object):
                 cache=True,
                 onCompleted=self.check_restore,
                 with_interrupt=True,
+                user_id=user_id,
             )
 
-    def _stream_say(self, resp_uuid, stream, cache=False, on_completed=None):
+    def _stream_say(
+        self, resp_uuid, stream, cache=False, on_completed=None, user_id=None
+    ):
         """
         从流中逐字逐句生成语音
         :param stream: 文字流，可迭代对象
         :param cache: 是否缓存 TTS 结果
         :param on_completed: 声音播报完成后的回调
+        :param user_id: 回复的文字只发给该用户的频道(为空时广播)
         """
         # 重置index
         data_list = []
@@ -332,12 +576,16 @@ class Conversation(object):
                 if self.interrupted.is_set():
                     logger.debug("响应已经被中断....")
                     return
+                tracer.mark("first_token", resp_uuid=resp_uuid)
                 data_list.append(data)
                 if self.on_stream:
                     out_next = stream_text.next(text=data, clear=False)
                     if out_next:
                         self.on_stream(
-                            message=out_next, resp_uuid=resp_uuid, data=dict(end=False)
+                            message=out_next,
+                            resp_uuid=resp_uuid,
+                            data=dict(end=False),
+                            user_id=user_id,
                         )
                 lines = stream_tts.split(text=data, clear=True)
                 # 无需分割
@@ -351,6 +599,7 @@ class Conversation(object):
                     if self.interrupted.is_set():
                         logger.debug("响应已经被中断....")
                         return
+                    tracer.mark("first_sentence", resp_uuid=resp_uuid)
                     audio = self.speaker.speak_in_order(
                         line=line, req_id=resp_uuid, index=index, cache=cache
                     )
@@ -371,7 +620,7 @@ class Conversation(object):
             self.speaker.end_order(timeout=30, on_completed=on_completed)
 
         msg = "".join(data_list)
-        self._after_write(msg=msg, resp_uuid=resp_uuid)
+        self._after_write(msg=msg, resp_uuid=resp_uuid, user_id=user_id)
         self._after_speak(msg=msg, audios=audios)
 
     def _say(
@@ -383,6 +632,7 @@ class Conversation(object):
         onCompleted=None,
         append_history=True,
         with_interrupt=False,
+        user_id=None,
     ):
         """
         说一句话
@@ -391,6 +641,7 @@ class Conversation(object):
         :param plugin: 来自哪个插件的消息（将带上插件的说明）
         :param onCompleted: 完成的回调
         :param append_history: 是否要追加到聊天记录
+        :param user_id: 只发给该用户的频道(为空时广播)
         """
         audios = self.speaker.speak(
             msg=msg,
@@ -401,21 +652,28 @@ class Conversation(object):
             with_interrupt=with_interrupt,
         )
         self._after_write(
-            msg=msg, resp_uuid=resp_uuid, plugin=plugin, append_history=append_history
+            msg=msg,
+            resp_uuid=resp_uuid,
+            plugin=plugin,
+            append_history=append_history,
+            user_id=user_id,
         )
         self._after_speak(msg=msg, audios=audios, plugin=plugin)
 
-    def _after_write(self, msg, resp_uuid=None, append_history=True, plugin=""):
+    def _after_write(
+        self, msg, resp_uuid=None, append_history=True, plugin="", user_id=None
+    ):
         """
         输出结束: 历史记录
         :param msg: 内容
         :param audios: 音频
         :param plugin: 来自哪个插件的消息（将带上插件的说明）
+        :param user_id: 结束消息只发给该用户的频道(为空时广播)
         """
         resp_uuid = resp_uuid or self.resp_uuid
         # 结束事件
         self.life_cycle_event.fire_event(
-            event="resp_end", text=msg, resp_uuid=resp_uuid
+            event="resp_end", text=msg, resp_uuid=resp_uuid, user_id=user_id
         )
         # 历史记录
         if append_history:
@@ -445,18 +703,7 @@ class Conversation(object):
             text = text[:-1]
         if not text_id or text_id == "null":
             text_id = uuid.uuid4().hex
-        # 将图片处理成HTML
-        pattern = r"https?://.+\.(?:png|jpg|jpeg|bmp|gif|JPG|PNG|JPEG|BMP|GIF)"
-        url_pattern = r"^https?://.+"
-        imgs = re.findall(pattern, text)
-        for img in imgs:
-            text = text.replace(
-                img,
-                f'<a data-fancybox="images" href="{img}"><img src={img} class="img fancybox"></img></a>',
-            )
-        urls = re.findall(url_pattern, text)
-        for url in urls:
-            text = text.replace(url, f'<a href={url} target="_blank">{url}</a>')
+        # 保存原始文本, 读取时再处理成HTML
         self.history.add_message(
             {
                 "type": t,
@@ -502,18 +749,56 @@ class OrderSpeaker:
     def re_init(self):
         """重新初始化"""
         try:
-            self.server_host = (
-                f"http://{config.get('/server/host')}:{config.get('/server/port')}"
-            )
+            self.server_host = self._get_server_host()
             self.player = Player.OrderPlayer()
             self.tts = TTS.get_engine_by_slug(config.get("tts_engine", "baidu-tts"))
             if self.dh_enabled:
-                self.dh = DigitalHuman.get_engine_by_slug(
-                    config.get("/dh_engine/provider", "tencent-dh")
-                )
+                self.dh = self._build_dh()
         except:
             logger.critical("Speaker初始化失败.", exc_info=True)
 
+    def register_components(self, register):
+        """注册可热更新的组件(不重建播放器)"""
+        register(
+            "tts",
+            build=lambda: TTS.get_engine_by_slug(config.get("tts_engine", "baidu-tts")),
+            current=lambda: self.tts,
+            swap=self._swap_tts,
+            keys=("tts_engine",),
+        )
+        register(
+            "dh",
+            build=self._build_dh,
+            current=lambda: self.dh,
+            swap=self._swap_dh,
+            keys=("/dh_engine",),
+        )
+        register(
+            "server_host",
+            build=self._get_server_host,
+            current=lambda: self.server_host,
+            swap=lambda new, old: setattr(self, "server_host", new),
+            keys=("/server/host", "/server/port"),
+        )
+
+    def _get_server_host(self) -> str:
+        return f"http://{config.get('/server/host')}:{config.get('/server/port')}"
+
+    def _build_dh(self):
+        if not config.get("/dh_engine/enable", False):
+            return None
+        return DigitalHuman.get_engine_by_slug(
+            config.get("/dh_engine/provider", "tencent-dh")
+        )
+
+    def _swap_tts(self, new, old):
+        with self.tts_lock:
+            self.tts = new
+
+    def _swap_dh(self, new, old):
+        self.dh_enabled = new is not None
+        self.dh = new
+
     def speak(
         self,
         msg,
@@ -548,6 +833,7 @@ class OrderSpeaker:
         else:
             audios = self._tts(
                 lines=lines,
+                req_id=req_id,
                 on_completed=on_completed,
                 with_interrupt=with_interrupt,
                 cache=cache,
@@ -568,7 +854,7 @@ class OrderSpeaker:
             self.dh.speak(req_id, msg, 1, True)
         else:
             # 获取音频
-            self._get_tts_voice(msg=msg, on_completed=_play_voice)
+            self._get_tts_voice(msg=msg, req_id=req_id, on_completed=_play_voice)
 
     def speak_in_order(
         self, line, req_id=None, index=0, cache=True, on_completed=None, is_final=False
@@ -586,7 +872,11 @@ class OrderSpeaker:
             )
         else:
             return self._tts_in_order(
-                msg=line, cache=cache, index=index, on_completed=on_completed
+                msg=line,
+                cache=cache,
+                index=index,
+                req_id=req_id,
+                on_completed=on_completed,
             )
 
     def play_audio(self, src, delete=False, onCompleted=None, interrupt=False):
@@ -713,7 +1003,9 @@ class OrderSpeaker:
         finally:
             self.end_order(timeout=30, on_completed=on_completed)
 
-    def _tts(self, lines, cache, on_completed=None, with_interrupt=False) -> list:
+    def _tts(
+        self, lines, cache, req_id=None, on_completed=None, with_interrupt=False
+    ) -> list:
         """
         TTS语音合成: 播放多条语句, 并返回合成后的音频
         :param lines: 字符串列表
@@ -740,6 +1032,7 @@ class OrderSpeaker:
                             msg=line.strip(),
                             cache=cache,
                             index=index,
+                            req_id=req_id,
                             on_completed=None,
                         )
                         index += 1
@@ -765,7 +1058,7 @@ class OrderSpeaker:
         self.dh.speak(req_id, msg, index, is_final)
         self._on_item_completed(on_completed=on_completed)
 
-    def _tts_in_order(self, msg, cache, index, on_completed=None) -> str:
+    def _tts_in_order(self, msg, cache, index, req_id=None, on_completed=None) -> str:
         """TTS语音合成: 单条"""
         if not msg:
             return ""
@@ -774,29 +1067,57 @@ class OrderSpeaker:
             # 空判断
             if not audio or not os.path.exists(audio):
                 return
+            started = []
+            item_completed = self._wrap_item_completed(on_completed=on_completed)
+
+            def _on_played():
+                if started:
+                    tracer.add_span(
+                        "playback", started[0], resp_uuid=req_id, index=index
+                    )
+                item_completed()
+
             with self.play_lock:
                 self.order_len += 1
                 self.player.play(
                     src=audio,
                     delete=not cache,
-                    onCompleted=self._wrap_item_completed(on_completed=on_completed),
+                    onCompleted=_on_played,
+                    onStarted=lambda: started.append(time.perf_counter()),
                     index=index,
                 )
 
         # 获取音频
-        return self._get_tts_voice(msg=msg, index=index, on_completed=_play_voice)
+        return self._get_tts_voice(
+            msg=msg, index=index, req_id=req_id, on_completed=_play_voice
+        )
 
-    def _get_tts_voice(self, msg, index=0, on_completed=None):
+    def _get_tts_voice(self, msg, index=0, req_id=None, on_completed=None):
+        m_sentences.inc()
+        # 推送音频给websocket客户端
+        stream = None
+        if self.sender:
+            stream = self.sender.audio_stream(resp_uuid=req_id, index=index)
+        start = time.perf_counter()
         voice = utils.get_voice_cache(msg)
         if voice:
             logger.debug("第%s段TTS命中缓存，播放缓存语音", index)
+            m_tts_cache.labels("hit").inc()
+            tracer.add_span("tts", start, resp_uuid=req_id, index=index, cache=True)
         else:
+            m_tts_cache.labels("miss").inc()
             try:
                 # voice = self.tts.get_speech(phrase=msg, on_completed=on_completed)
-                voice = self.tts.get_speech(phrase=msg)
+                if stream and getattr(self.tts, "STREAMING", False):
+                    voice = self.tts.get_speech(phrase=msg, on_chunk=stream.write)
+                else:
+                    voice = self.tts.get_speech(phrase=msg)
                 logger.debug("第%s段TTS合成成功。msg: %s", index, msg)
             except Exception as e:
                 logger.critical("语音合成失败：%s", str(e), exc_info=True)
+            tracer.add_span("tts", start, resp_uuid=req_id, index=index, cache=False)
+        if stream:
+            stream.close(audio=voice)
         if voice and on_completed:
             on_completed(voice)
         return voice
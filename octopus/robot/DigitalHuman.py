@@ -11,7 +11,7 @@ import websocket
 from abc import ABCMeta, abstractmethod
 from urllib.parse import quote
 
-from octopus.robot import config, log, schedulers
+from octopus.robot import config, log, schedulers, registry
 from octopus.robot.compt import ThreadManager
 
 # 通用播报：
@@ -69,6 +69,10 @@ class AbstractDigitalHuman(object):
     def info(self) -> dict:
         return {}
 
+    def warm_up(self):
+        """预热: 建立会话(启动时并发调用, 不在构造函数中阻塞)"""
+        pass
+
 
 class TecentDigitalHuman(AbstractDigitalHuman):
     """
@@ -96,8 +100,6 @@ class TecentDigitalHuman(AbstractDigitalHuman):
         self.thread_ws_cmd = None  # 指令长连接线程
         self.ws_cmd_ok = threading.Event()
         self.sche_heart = None  # 心跳任务
-        # 准备就绪
-        self.be_ready()
 
     @classmethod
     def get_config(cls):
@@ -367,6 +369,9 @@ class TecentDigitalHuman(AbstractDigitalHuman):
         """关闭指令长连接"""
         return self.ws_cmd and self.ws_cmd.close()
 
+    def warm_up(self):
+        self.be_ready()
+
     def be_ready(self):
         # 先查询状态
         self.query_session_info()
@@ -482,6 +487,11 @@ def get_engine_by_slug(slug=None):
     if not slug or type(slug) is not str:
         raise TypeError("无效的 TTS slug '%s'", slug)
 
+    engine = registry.find("dh", slug)
+    if engine:
+        logger.info(f"使用 {engine.SLUG} DigitalHuman 引擎")
+        return engine.get_instance()
+
     selected_engines = list(
         filter(
             lambda engine: hasattr(engine, "SLUG") and engine.SLUG == slug,
@@ -118,6 +118,7 @@ class LifeCycleHandler(object):
         self,
         text="",
         resp_uuid=None,
+        user_id=None,
     ):
         """
         思考完成并播放结果的状态
@@ -127,6 +128,7 @@ class LifeCycleHandler(object):
             data=dict(end=True),
             message="",
             resp_uuid=resp_uuid,
+            user_id=user_id,
         )
         if self._unihiker:
             text = text[:60] + "..." if len(text) >= 60 else text
@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
+import math
+import os
+import re
+import time
+
+import numpy
+import yaml
+
 from octopus.robot.sdk import unit
-from octopus.robot import log
+from octopus.robot import config, constants, log, metrics, registry
 from abc import ABCMeta, abstractmethod
 
 logger = log.getLogger(__name__)
@@ -98,7 +106,7 @@ class UnitNLU(AbstractNLU):
     SLUG = "unit"
 
     def __init__(self):
-        super(self.__class__, self).__init__()
+        super(UnitNLU, self).__init__()
 
     @classmethod
     def get_config(cls):
@@ -194,6 +202,212 @@ class UnitNLU(AbstractNLU):
         return unit.getSay(parsed, intent)
 
 
+m_local = metrics.counter(
+    "octopus_nlu_local", "本地NLU解析次数(result: local/cloud)", labelnames=("result",)
+)
+
+
+class LocalNLU(UnitNLU):
+    """
+    本地NLU: 字符n-gram TF-IDF, 与训练样本的余弦相似度最高者为意图
+
+    解析结果与百度UNIT格式一致, 置信度低于阈值、与次高意图的差距不足,
+    或最相似的是闲聊样本(OTHER)时回退到云端NLU
+    """
+
+    SLUG = "local"
+    OTHER = "OTHER"  # 闲聊等领域外的样本, 不作为意图返回
+
+    def __init__(
+        self,
+        threshold=0.45,
+        margin=0.1,
+        ngram=3,
+        fallback="unit",
+        file="nlu.yml",
+        **kwargs,
+    ):
+        super(LocalNLU, self).__init__()
+        self.threshold = threshold
+        self.margin = margin
+        self.ngram = ngram
+        self.fallback = None
+        if fallback and fallback != self.SLUG:
+            self.fallback = get_engine_by_slug(fallback)
+        start = time.perf_counter()
+        self.intents = self._load_intents(file)
+        self._train()
+        logger.info(
+            "本地NLU: %d 个意图, %d 条样本, %d 个特征, %.0fms",
+            len(self.intents),
+            len(self.labels),
+            len(self.vocab),
+            (time.perf_counter() - start) * 1000,
+        )
+
+    @classmethod
+    def get_config(cls):
+        return config.get("local_nlu", {})
+
+    def parse(self, query, **args):
+        """
+        本地解析, 置信度不足(或意图需要云端结果)时使用云端NLU
+
+        :param query: 用户的指令字符串
+        :param **args: 云端NLU的参数
+        :returns: UNIT 格式的解析结果
+        """
+        intent, confidence, slots = self.classify(query)
+        if intent and (confidence >= self.threshold) and not (
+            self.intents[intent].get("cloud") and self.fallback
+        ):
+            m_local.labels("local").inc()
+            return self._result(intent, confidence, slots)
+        if not self.fallback:
+            m_local.labels("local").inc()
+            return None
+        m_local.labels("cloud").inc()
+        logger.debug("本地NLU置信度不足: %s, %s, %.2f", query, intent, confidence)
+        return self.fallback.parse(query, **args)
+
+    def classify(self, query) -> tuple:
+        """
+        :returns: (意图, 置信度, 词槽), 未识别(闲聊、与次高意图的差距不足)时意图为None
+        """
+        query = query.strip()
+        for intent, regex in self.patterns:
+            matched = regex.match(query)
+            if matched:
+                slots = {k: v for k, v in matched.groupdict().items() if v}
+                return intent, 1.0, slots
+        indexes, weights = self._vectorize(query)
+        if not indexes or not len(self.labels):
+            return None, 0.0, {}
+        scores = self.matrix[:, indexes] @ weights
+        best = int(numpy.argmax(scores))
+        intent, confidence = self.labels[best], float(scores[best])
+        # 每个意图的最高分, 与次高意图比较
+        per_intent = numpy.zeros(len(self.names), dtype=numpy.float32)
+        numpy.maximum.at(per_intent, self.label_ids, scores)
+        per_intent[self.names.index(intent)] = 0
+        second = float(per_intent.max()) if len(per_intent) else 0.0
+        if intent == self.OTHER or confidence - second < self.margin:
+            return None, confidence, {}
+        return intent, confidence, self.slots[best]
+
+    def getSay(self, parsed, intent):
+        say = unit.getSay(parsed, intent)
+        if not say and parsed and parsed.get("source") == self.SLUG:
+            return self.intents.get(intent, {}).get("say", "")
+        return say
+
+    def _result(self, intent, confidence, slots) -> dict:
+        return {
+            "source": self.SLUG,
+            "result": {
+                "response_list": [
+                    {
+                        "schema": {
+                            "intent": intent,
+                            "intent_confidence": round(confidence * 100, 2),
+                            "slots": [
+                                {
+                                    "name": name,
+                                    "normalized_word": value,
+                                    "original_word": value,
+                                }
+                                for name, value in slots.items()
+                            ],
+                        },
+                        "action_list": [
+                            {"say": self.intents[intent].get("say", "")}
+                        ],
+                    }
+                ]
+            },
+        }
+
+    def _load_intents(self, file) -> dict:
+        """内置样本与配置目录下的样本合并"""
+        intents = dict()
+        paths = [constants.getRS("nlu.yml")]
+        if file:
+            paths.append(os.path.join(constants.CONFIG_PATH, file))
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                data = yaml.safe_load(f) or {}
+            for intent, item in data.items():
+                merged = intents.setdefault(
+                    intent, dict(examples=[], patterns=[], say="", cloud=False)
+                )
+                merged["examples"].extend(item.get("examples") or [])
+                merged["patterns"].extend(item.get("patterns") or [])
+                merged["say"] = item.get("say", merged["say"])
+                merged["cloud"] = item.get("cloud", merged["cloud"])
+        return intents
+
+    def _ngrams(self, text):
+        text = text.lower()
+        for n in range(1, self.ngram + 1):
+            for i in range(len(text) - n + 1):
+                yield text[i : i + n]
+
+    def _train(self):
+        self.patterns = []
+        self.labels, self.slots, samples = [], [], []
+        for intent, item in self.intents.items():
+            for pattern in item["patterns"]:
+                self.patterns.append((intent, re.compile(pattern)))
+            for example in item["examples"]:
+                if isinstance(example, dict):
+                    text, slots = example.get("text", ""), example.get("slots") or {}
+                else:
+                    text, slots = str(example), {}
+                self.labels.append(intent)
+                self.slots.append(dict(slots))
+                samples.append(set(self._ngrams(text)))
+        self.names = list(self.intents)
+        self.label_ids = numpy.array(
+            [self.names.index(label) for label in self.labels], dtype=numpy.intp
+        )
+        # 文档频率
+        self.vocab = dict()
+        df = []
+        for grams in samples:
+            for gram in grams:
+                index = self.vocab.setdefault(gram, len(self.vocab))
+                if index == len(df):
+                    df.append(0)
+                df[index] += 1
+        count = len(samples)
+        self.idf = numpy.array(
+            [math.log((1 + count) / (1 + d)) + 1 for d in df], dtype=numpy.float32
+        )
+        self.oov_idf = math.log(1 + count) + 1  # 未出现过的特征
+        self.matrix = numpy.zeros((count, len(self.vocab)), dtype=numpy.float32)
+        for row, grams in enumerate(samples):
+            for gram in grams:
+                index = self.vocab[gram]
+                self.matrix[row, index] = self.idf[index]
+        norms = numpy.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.matrix /= numpy.maximum(norms, 1e-12)
+
+    def _vectorize(self, text) -> tuple:
+        """查询向量(只保留词表中的特征): (特征下标, 权重)"""
+        grams = set(self._ngrams(text))
+        indexes = [self.vocab[gram] for gram in grams if gram in self.vocab]
+        if not indexes:
+            return [], None
+        weights = self.idf[indexes]
+        # 不在词表中的特征只影响模长
+        total = float(weights @ weights) + (
+            len(grams) - len(indexes)
+        ) * self.oov_idf**2
+        return indexes, weights / math.sqrt(total)
+
+
 def get_engine_by_slug(slug=None):
     """
     Returns:
@@ -206,6 +420,11 @@ def get_engine_by_slug(slug=None):
     if not slug or type(slug) is not str:
         raise TypeError("无效的 NLU slug '%s'", slug)
 
+    engine = registry.find("nlu", slug)
+    if engine:
+        logger.info(f"使用 {engine.SLUG} NLU 引擎")
+        return engine.get_instance()
+
     selected_engines = list(
         filter(
             lambda engine: hasattr(engine, "SLUG") and engine.SLUG == slug,
@@ -10,11 +10,24 @@ import time
 from contextlib import contextmanager
 from ctypes import CFUNCTYPE, c_char_p, c_int, cdll
 
-from octopus.robot import log, utils, config
+from octopus.robot import log, utils, config, metrics
 from octopus.robot.compt import ThreadManager
 
 logger = log.getLogger(__name__)
 
+m_plays = metrics.counter(
+    "octopus_player_plays", "播放的音频数", labelnames=("player", "result")
+)
+m_play_seconds = metrics.histogram(
+    "octopus_player_play_seconds",
+    "单个音频的播放耗时",
+    labelnames=("player",),
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 300),
+)
+m_queue = metrics.gauge(
+    "octopus_player_queue_depth", "播放队列长度", labelnames=("player",)
+)
+
 
 def py_error_handler(filename, line, function, err, fmt):
     pass
@@ -122,10 +135,16 @@ class SoxPlayer(AbstractPlayer):
                 self.playing_src = src
                 self.playing_del = delete
                 res = False
+                self.on_started(src)
+                m_queue.labels(self.SLUG).set(self.play_queue.qsize())
+                start = time.perf_counter()
                 try:
                     res = self.doPlay(src)
                     self.play_queue.task_done()
                 finally:
+                    cost = time.perf_counter() - start
+                    m_play_seconds.labels(self.SLUG).observe(cost)
+                    m_plays.labels(self.SLUG, "ok" if res else "fail").inc()
                     self.playing_src = None
                     self.playing_del = False
                     # 将 onCompleted() 方法的调用放到事件循环的线程中执行
@@ -135,6 +154,10 @@ class SoxPlayer(AbstractPlayer):
                     if delete:
                         utils.check_and_delete(src)
 
+    def on_started(self, src):
+        """开始播放单个音频"""
+        pass
+
     def doPlay(self, src):
         cmd = [self.audio_bin, str(src)]
         logger.debug("Executing %s", " ".join(cmd))
@@ -353,13 +376,29 @@ class OrderPlayer(SoxPlayer):
     SLUG = "OrderPlayer"
 
     def __init__(self, **kwargs):
+        self.started_calls = {}  # src -> 开始播放的回调
         super(OrderPlayer, self).__init__(**kwargs)
 
-    def play(self, src, index, delete=False, onCompleted=None, wait_seconds: int = 0):
+    def on_started(self, src):
+        on_started = self.started_calls.pop(src, None)
+        if on_started:
+            on_started()
+
+    def play(
+        self,
+        src,
+        index,
+        delete=False,
+        onCompleted=None,
+        wait_seconds: int = 0,
+        onStarted=None,
+    ):
         if not src:
             logger.warning("path should not be none")
             return
         if os.path.exists(src) or src.startswith("http"):
+            if onStarted:
+                self.started_calls[src] = onStarted
             self.play_queue.put(index=index, item=(src, onCompleted, delete))
             if wait_seconds:
                 time.sleep(wait_seconds)
@@ -368,6 +407,7 @@ class OrderPlayer(SoxPlayer):
 
     def new_order(self):
         self.play_queue.clear()
+        self.started_calls.clear()
 
     def _clear_queue(self):
         while not self.play_queue.empty():
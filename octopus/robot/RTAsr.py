@@ -9,7 +9,7 @@ from typing import Optional, Union, Any
 
 import websocket
 
-from octopus.robot import config, constants, log
+from octopus.robot import config, constants, log, metrics, registry
 from octopus.robot.compt import ThreadManager
 from octopus.robot.sdk.VolcengineSpeech import StreamLmClient
 
@@ -144,7 +144,7 @@ class FunRTAsr(AbstractRTAsr):
     def wrap_message(self, on_message):
         def rev_message(ws, message, *args, **kwargs):
             data = json.loads(s=message)
-            logger.debug(f"FunAsr WebSocket Received Data: {data}")
+            logger.debug("FunAsr WebSocket Received Data: %s", data)
             # 封装成统一格式
             on_message(
                 AsrResponse(
@@ -433,6 +433,14 @@ class MixedRTAsr(AbstractRTAsr):
         return self.msg_queue.put
 
 
+m_asr_messages = metrics.counter("octopus_asr_messages", "实时ASR收到的识别结果数")
+m_asr_voice = metrics.counter("octopus_asr_voice_bytes", "发送给实时ASR的音频字节数")
+m_asr_connects = metrics.counter("octopus_asr_connects", "实时ASR连接次数")
+m_asr_handle = metrics.histogram(
+    "octopus_asr_handle_seconds", "实时ASR识别结果的处理耗时"
+)
+
+
 class RTAsrClient:
     def __init__(self, **kwargs) -> None:
         self.running = threading.Event()
@@ -443,6 +451,9 @@ class RTAsrClient:
         self.rt_asr_conn_ok = threading.Event()
         self.rt_asr = self._init_asr()
         self.on_messages = []
+        metrics.gauge("octopus_asr_connected", "实时ASR是否已连接").set_function(
+            lambda: int(self.is_ok())
+        )
 
     def connect(self):
         if self.running.is_set():
@@ -467,10 +478,15 @@ class RTAsrClient:
     def is_ok(self) -> bool:
         return self.rt_asr_conn_ok.is_set()
 
+    def wait_ok(self, timeout: float = None) -> bool:
+        """等待连接建立"""
+        return self.rt_asr_conn_ok.wait(timeout=timeout)
+
     def send_meta(self, data=None, **kwargs):
         self.rt_asr.send_meta(conn=self.rt_asr_conn, data=data, **kwargs)
 
     def send_voice(self, data, **kwargs):
+        m_asr_voice.inc(len(data))
         self.rt_asr.send_voice(conn=self.rt_asr_conn, data=data, **kwargs)
 
     def _init_asr(self):
@@ -493,6 +509,7 @@ class RTAsrClient:
             time.sleep(5)
 
     def _on_asr_open(self, ws):
+        m_asr_connects.inc()
         self.rt_asr_conn_ok.set()
         logger.info("Asr WebSocket Connection opened.")
 
@@ -501,8 +518,10 @@ class RTAsrClient:
         logger.info("Asr WebSocket Connection closed, reconnect.")
 
     def _on_message(self, data: AsrResponse, **kwargs):
-        for on_message in self.on_messages:
-            on_message(data, **kwargs)
+        m_asr_messages.inc()
+        with m_asr_handle.time():
+            for on_message in self.on_messages:
+                on_message(data, **kwargs)
 
 
 def get_rtasr_by_slug(slug, **kwargs) -> AbstractRTAsr:
@@ -513,6 +532,11 @@ def get_rtasr_by_slug(slug, **kwargs) -> AbstractRTAsr:
     if not slug or type(slug) is not str:
         raise TypeError("Invalid slug '%s'", slug)
 
+    select = registry.find("rtasr", slug)
+    if select:
+        logger.info(f"使用 {select.SLUG} 关键词检测")
+        return select.get_instance(**kwargs)
+
     selects = list(
         filter(lambda _cls: hasattr(_cls, "SLUG") and _cls.SLUG == slug, get_rtasrs())
     )
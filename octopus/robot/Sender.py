@@ -1,28 +1,73 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import json
 import queue
+import struct
 import threading
+import time
 import uuid
+from collections import deque
 from dataclasses import dataclass
+from typing import Optional, Dict, FrozenSet, List
+
 from tornado.httputil import HTTPServerRequest
+from tornado.ioloop import IOLoop
 from tornado.web import RequestHandler, Application
-from tornado.websocket import WebSocketHandler
+from tornado.websocket import WebSocketHandler, WebSocketClosedError
 
-from octopus.robot import log, config
-from octopus.robot.compt import ThreadManager
+from octopus.robot import log, config, metrics
+from octopus.robot.compt import ThreadManager, LaneQueue
 
 logger = log.getLogger(__name__)
 
+m_frames = metrics.counter("octopus_ws_frames", "websocket发送的消息帧数")
+m_fanout = metrics.histogram(
+    "octopus_ws_fanout_seconds",
+    "websocket消息分发给客户端的耗时",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1),
+)
+m_lag = metrics.histogram(
+    "octopus_ws_lag_seconds",
+    "websocket消息从入队到写出的延迟",
+    labelnames=("kind",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+m_client_dropped = metrics.counter(
+    "octopus_ws_client_dropped", "websocket客户端丢弃的消息帧数"
+)
+
 ACTION_USER_SPEAK = "user_speak"
 ACTION_ROBOT_LISTEN = "robot_listen"
 ACTION_ROBOT_THINK = "robot_think"
 ACTION_ROBOT_WRITE = "robot_write"
 ACTION_ROBOT_SPEAK = "robot_speak"
 ACTION_ROBOT_SLEEP = "robot_sleep"
+# 发送线程内部使用: 丢弃合并中的该响应的文字(不发送给客户端)
+_ACTION_DISCARD = "_discard"
 
 STAGE_UNDERSTAND = "理解您说的内容"
 STAGE_SEARCH = "查找相关资料"
 
+# 二进制音频子协议
+AUDIO_PROTOCOL = "octopus-audio"
+AUDIO_ACK = "audio_ack"
+# 帧头: magic(2) version(1) resp_uuid(16) 句子序号(2) 分片序号(2) 标记(1), 之后是音频数据
+AUDIO_HEADER = struct.Struct(">2sB16sHHB")
+AUDIO_MAGIC = b"OA"
+AUDIO_VERSION = 1
+AUDIO_FLAG_FINAL = 0x01  # 该句子的最后一个分片
+
+# 发送通道(优先级从高到低)
+LANE_CONTROL = 0  # 状态消息
+LANE_CONTENT = 1  # 文字内容
+LANE_HISTORY = 2  # 历史消息
+CONTROL_ACTIONS = (
+    ACTION_ROBOT_LISTEN,
+    ACTION_ROBOT_THINK,
+    ACTION_ROBOT_SPEAK,
+    ACTION_ROBOT_SLEEP,
+)
+
 
 @dataclass
 class StatusData:
@@ -33,8 +78,49 @@ class StatusData:
         return {"stage": self.stage, "end": self.end}
 
 
+@dataclass
+class ClientStats:
+    """客户端发送统计"""
+
+    sent: int = 0  # 已发送帧数
+    dropped: int = 0  # 丢弃帧数
+    merged: int = 0  # 队列满时合并掉的增量帧数
+    lag: float = 0  # 最近一帧的延迟(秒)
+    max_lag: float = 0  # 最大延迟(秒)
+    audio_sent: int = 0  # 已发送音频分片数
+    audio_bytes: int = 0  # 已发送音频字节数
+    audio_dropped: int = 0  # 丢弃音频分片数
+
+    def dict(self):
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "merged": self.merged,
+            "lag": round(self.lag, 4),
+            "max_lag": round(self.max_lag, 4),
+            "audio_sent": self.audio_sent,
+            "audio_bytes": self.audio_bytes,
+            "audio_dropped": self.audio_dropped,
+        }
+
+
 class ExtWebSocketHandler(WebSocketHandler, RequestHandler):
+    """
+    websocket推送
+    连接时通过参数 user_id 或 device 订阅频道, 只接收发给该频道的消息;
+    订阅 * 的客户端接收所有消息; 未指定 user_id 的消息广播给所有客户端
+    子协议 octopus-audio: 额外接收二进制音频分片(帧头见 AUDIO_HEADER),
+    按窗口流控, 客户端发送 {"action": "audio_ack", "credit": n} 归还窗口
+    """
+
+    CHANNEL_ALL = "*"
     clients = set()
+    channels: Dict[str, set] = dict()
+    io_loop: Optional[IOLoop] = None
+    # 订阅快照: 只在IOLoop线程中整体替换, 其它线程只读这几个值
+    client_count = 0
+    audio_count = 0
+    subscribed: FrozenSet[str] = frozenset()
 
     def initialize(self, **kwargs):
         pass
@@ -43,7 +129,18 @@ class ExtWebSocketHandler(WebSocketHandler, RequestHandler):
         self, application: Application, request: HTTPServerRequest, **kwargs
     ) -> None:
         super().__init__(application, request, **kwargs)
-        self.lock = threading.Lock()
+        # 待发送队列(只在IOLoop线程中操作): (已序列化的消息, 时间, 解析后的消息)
+        self.outbox = deque()
+        self.flushing = False
+        self.stats = ClientStats()
+        self.high_watermark = config.get("/server/ws_queue_size", 256)
+        self.max_lag = config.get("/server/ws_max_lag", 30)
+        self.channel = None
+        # 音频流
+        self.audio = False
+        self.audio_outbox = deque()
+        self.audio_window = config.get("/server/ws_audio_window", 32)
+        self.credit = self.audio_window
 
     def isValidated(self):
         if not self.get_secure_cookie("validation"):
@@ -59,14 +156,103 @@ class ExtWebSocketHandler(WebSocketHandler, RequestHandler):
             object=self.get_cookie("validation")
         )
 
+    def select_subprotocol(self, subprotocols: List[str]) -> Optional[str]:
+        if AUDIO_PROTOCOL in subprotocols:
+            return AUDIO_PROTOCOL
+        return None
+
     def open(self):
+        ExtWebSocketHandler.io_loop = IOLoop.current()
         self.clients.add(self)
+        self.audio = self.selected_subprotocol == AUDIO_PROTOCOL
+        # 订阅频道
+        self.channel = self.get_argument("user_id", None) or self.get_argument(
+            "device", None
+        )
+        if self.channel:
+            self.channels.setdefault(self.channel, set()).add(self)
+        self._update_snapshot()
+
+    def on_message(self, message):
+        if not self.audio or not isinstance(message, str):
+            return
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(data, dict) or data.get("action") != AUDIO_ACK:
+            return
+        # 归还窗口
+        self.credit = min(self.audio_window, self.credit + int(data.get("credit", 1)))
+        if self.audio_outbox and not self.flushing:
+            self.flushing = True
+            IOLoop.current().spawn_callback(self._flush)
 
     def on_close(self):
-        self.clients.remove(self)
+        self.clients.discard(self)
+        self.outbox.clear()
+        self.audio_outbox.clear()
+        if self.channel in self.channels:
+            subscribers = self.channels[self.channel]
+            subscribers.discard(self)
+            if not subscribers:
+                self.channels.pop(self.channel, None)
+        self._update_snapshot()
 
-    def send_response(
-        self,
+    @classmethod
+    def _update_snapshot(cls):
+        """连接或断开时更新订阅快照(IOLoop线程)"""
+        handler = ExtWebSocketHandler
+        handler.subscribed = frozenset(handler.channels)
+        handler.audio_count = sum(1 for client in handler.clients if client.audio)
+        handler.client_count = len(handler.clients)
+
+    @classmethod
+    def subscribers(cls, user_id=None) -> set:
+        """消息的接收者(必须在IOLoop线程中调用)"""
+        if not user_id:
+            return cls.clients
+        return cls.channels.get(user_id, set()) | cls.channels.get(
+            cls.CHANNEL_ALL, set()
+        )
+
+    @classmethod
+    def has_subscribers(cls, user_id=None) -> bool:
+        """是否有消息的接收者(读快照, 可在任意线程调用)"""
+        if not user_id:
+            return cls.client_count > 0
+        subscribed = cls.subscribed
+        return user_id in subscribed or cls.CHANNEL_ALL in subscribed
+
+    @classmethod
+    def has_audio_clients(cls) -> bool:
+        """是否有客户端订阅了音频(读快照, 可在任意线程调用)"""
+        return cls.audio_count > 0
+
+    @classmethod
+    def dispatch(cls, payload: str, put_time: float, user_id=None) -> int:
+        """
+        分发消息给订阅者(必须在IOLoop线程中调用)
+        返回: 接收的客户端数
+        """
+        subscribers = list(cls.subscribers(user_id=user_id))
+        for client in subscribers:
+            client.push(payload=payload, put_time=put_time)
+        return len(subscribers)
+
+    @classmethod
+    def dispatch_audio(cls, frame: bytes, put_time: float) -> int:
+        """分发音频分片(必须在IOLoop线程中调用)"""
+        count = 0
+        for client in list(cls.clients):
+            if client.audio:
+                client.push_audio(frame=frame, put_time=put_time)
+                count += 1
+        return count
+
+    @classmethod
+    def build_response(
+        cls,
         resp_uuid,
         action: str = None,
         data=None,
@@ -74,8 +260,8 @@ class ExtWebSocketHandler(WebSocketHandler, RequestHandler):
         plugin="",
         user_id=None,
         t=None,
-    ):
-        resp = {
+    ) -> dict:
+        return {
             "type": 1 if t is None else t,  # 机器人回复
             "action": action or "new_message",
             "data": data,
@@ -84,8 +270,123 @@ class ExtWebSocketHandler(WebSocketHandler, RequestHandler):
             "plugin": plugin,
             "user_id": user_id,
         }
-        with self.lock:
-            self.write_message(json.dumps(resp))
+
+    def push(self, payload: str, put_time: float):
+        """
+        投递已序列化的消息(必须在IOLoop线程中调用)
+        超过高水位时先合并同一响应的增量帧, 再丢弃最旧的状态帧, 避免慢客户端无限堆积
+        """
+        if len(self.outbox) >= self.high_watermark:
+            self._evict()
+        self.outbox.append((payload, put_time, None))
+        if not self.flushing:
+            self.flushing = True
+            IOLoop.current().spawn_callback(self._flush)
+
+    def push_audio(self, frame: bytes, put_time: float):
+        """投递音频分片(必须在IOLoop线程中调用)"""
+        if len(self.audio_outbox) >= self.high_watermark:
+            self.audio_outbox.popleft()
+            self.stats.audio_dropped += 1
+        self.audio_outbox.append((frame, put_time))
+        if not self.flushing and self.credit > 0:
+            self.flushing = True
+            IOLoop.current().spawn_callback(self._flush)
+
+    def info(self) -> dict:
+        data = self.stats.dict()
+        data.update(
+            remote=self.request.remote_ip,
+            channel=self.channel,
+            queued=len(self.outbox),
+            audio=self.audio,
+            audio_queued=len(self.audio_outbox),
+            credit=self.credit,
+        )
+        return data
+
+    def _evict(self):
+        """
+        腾出队列空间: 合并同一响应相邻的增量帧(文字不丢失),
+        仍然超过高水位时丢弃最旧的状态帧, 没有状态帧时才丢弃最旧的帧
+        """
+        items = []  # 合并后的消息在发送时才序列化
+        for payload, put_time, frame in self.outbox:
+            if frame is None:
+                # 每条消息只解析一次, 结果留在队列中
+                try:
+                    frame = json.loads(payload)
+                except ValueError:
+                    frame = None
+                if not isinstance(frame, dict):
+                    frame = {}
+            if items:
+                merged = merge_delta(items[-1][2], frame, text="text", uuid="uuid")
+                if merged:
+                    items[-1] = (None, items[-1][1], merged)
+                    self.stats.merged += 1
+                    continue
+            items.append((payload, put_time, frame))
+        if len(items) >= self.high_watermark:
+            index = next(
+                (
+                    i
+                    for i, (_, _, frame) in enumerate(items)
+                    if frame.get("action") in CONTROL_ACTIONS
+                ),
+                0,
+            )
+            del items[index]
+            self.stats.dropped += 1
+        self.outbox = deque(items)
+
+    def _next_frame(self):
+        """文字消息优先, 音频受窗口限制"""
+        if self.outbox:
+            return self.outbox.popleft(), False
+        if self.audio_outbox and self.credit > 0:
+            return self.audio_outbox.popleft(), True
+        return None, False
+
+    async def _flush(self):
+        try:
+            while True:
+                item, binary = self._next_frame()
+                if not item:
+                    break
+                payload, put_time = item[0], item[1]
+                if payload is None:
+                    payload = json.dumps(item[2], ensure_ascii=False)
+                lag = time.time() - put_time
+                m_lag.labels("audio" if binary else "text").observe(lag)
+                self.stats.lag = lag
+                self.stats.max_lag = max(self.stats.max_lag, lag)
+                # 延迟过大, 踢掉客户端
+                if lag > self.max_lag:
+                    logger.warning(
+                        "websocket客户端 %s 延迟 %.2fs, 断开连接",
+                        self.request.remote_ip,
+                        lag,
+                    )
+                    self.stats.dropped += len(self.outbox) + 1
+                    m_client_dropped.inc(len(self.outbox) + 1)
+                    self.outbox.clear()
+                    self.audio_outbox.clear()
+                    self.close(code=1013, reason="client too slow")
+                    return
+                # 等待写入完成, 只阻塞当前客户端
+                await self.write_message(payload, binary=binary)
+                if binary:
+                    self.credit -= 1
+                    self.stats.audio_sent += 1
+                    self.stats.audio_bytes += len(payload) - AUDIO_HEADER.size
+                else:
+                    self.stats.sent += 1
+        except WebSocketClosedError:
+            self.outbox.clear()
+            self.audio_outbox.clear()
+        finally:
+            self.flushing = False
 
 
 class WebSocketSender:
@@ -93,10 +394,35 @@ class WebSocketSender:
     def __init__(self):
         self.clients = ExtWebSocketHandler.clients
         self.running = threading.Event()
-        self.queue_msg = queue.Queue()
-        self.queue_lock = threading.Lock()
-        self.send_lock = threading.Lock()
+        self.queue_msg = LaneQueue(
+            lanes=3, size=config.get("/server/ws_lane_size", 4096), merge=merge_delta
+        )
         self.thread = None
+        # 合并增量帧
+        self.coalescer = FrameCoalescer(
+            window=config.get("/server/ws_coalesce_ms", 30) / 1000,
+            max_bytes=config.get("/server/ws_coalesce_bytes", 256),
+        )
+        self.compact = config.get("/server/ws_compact", False)
+        self.frames = 0  # 实际发送的帧数
+        self.fanout = 0  # 分发给客户端的总次数
+        self.fanout_time = 0  # 分发耗时(秒)
+        # 转发(多进程web服务), 需实现 send_text/send_audio/has_audio_clients
+        self.relays = []
+        # 指标
+        metrics.gauge("octopus_ws_clients", "websocket客户端数").set_function(
+            lambda: ExtWebSocketHandler.client_count
+        )
+        lanes = metrics.gauge(
+            "octopus_ws_queue_depth", "websocket发送队列长度", labelnames=("lane",)
+        )
+        for lane, name in enumerate(("control", "content", "history")):
+            lanes.labels(name).set_function(
+                lambda lane=lane: self.queue_msg.depth()[lane]
+            )
+        metrics.gauge("octopus_ws_queue_dropped", "websocket发送队列丢弃数").set_function(
+            lambda: self.queue_msg.dropped
+        )
 
     def send_message(
         self,
@@ -104,15 +430,75 @@ class WebSocketSender:
         data: dict = None,
         message: str = None,
         resp_uuid=None,
+        user_id=None,
         **kwargs
     ):
         logger.debug("机器人状态：%s", message)
+        io_loop = ExtWebSocketHandler.io_loop
+        # 没有客户端连接过, 或者没有订阅者
+        if not self.relays and (
+            not io_loop or not ExtWebSocketHandler.has_subscribers(user_id=user_id)
+        ):
+            return
         resp_uuid = resp_uuid or uuid.uuid4().hex
-        with self.send_lock:
-            for _, client in enumerate(self.clients):
-                client.send_response(
-                    resp_uuid=resp_uuid, action=action, data=data, message=message, **kwargs
-                )
+        resp = ExtWebSocketHandler.build_response(
+            resp_uuid=resp_uuid,
+            action=action,
+            data=data,
+            message=message,
+            user_id=user_id,
+            **kwargs
+        )
+        if self.compact:
+            resp = dict((k, v) for k, v in resp.items() if v is not None and v != "")
+        # 只序列化一次, 交给IOLoop分发
+        payload = json.dumps(resp, ensure_ascii=not self.compact)
+        self.frames += 1
+        m_frames.inc()
+        put_time = time.time()
+        for relay in list(self.relays):
+            relay.send_text(payload=payload, put_time=put_time, user_id=user_id)
+        if io_loop:
+            io_loop.add_callback(self._dispatch, payload, put_time, user_id)
+
+    def send_audio(self, resp_uuid, index: int, seq: int, chunk: bytes, final=False):
+        """
+        发送音频分片(二进制), 可在任意线程调用
+        :param resp_uuid: 响应标记
+        :param index: 句子序号
+        :param seq: 分片序号
+        :param chunk: 编码后的音频数据
+        :param final: 是否该句子的最后一个分片
+        """
+        io_loop = ExtWebSocketHandler.io_loop
+        if not io_loop and not self.relays:
+            return
+        frame = AUDIO_HEADER.pack(
+            AUDIO_MAGIC,
+            AUDIO_VERSION,
+            _uuid_bytes(resp_uuid),
+            index & 0xFFFF,
+            seq & 0xFFFF,
+            AUDIO_FLAG_FINAL if final else 0,
+        ) + (chunk or b"")
+        put_time = time.time()
+        for relay in list(self.relays):
+            relay.send_audio(frame=frame, put_time=put_time)
+        if io_loop:
+            io_loop.add_callback(ExtWebSocketHandler.dispatch_audio, frame, put_time)
+
+    def audio_stream(self, resp_uuid, index: int):
+        """句子的音频流, 没有订阅音频的客户端时返回None"""
+        if not ExtWebSocketHandler.has_audio_clients() and not any(
+            relay.has_audio_clients() for relay in list(self.relays)
+        ):
+            return None
+        return AudioStream(
+            sender=self,
+            resp_uuid=resp_uuid,
+            index=index,
+            chunk_size=config.get("/server/ws_audio_chunk", 8192),
+        )
 
     def put_message(
         self,
@@ -122,26 +508,70 @@ class WebSocketSender:
         resp_uuid=None,
         **kwargs
     ):
-        with self.queue_lock:
-            self.queue_msg.put(item=dict(
+        self.queue_msg.put(
+            item=dict(
                 action=action, data=data, message=message, resp_uuid=resp_uuid, **kwargs
-            ), timeout=3)
+            ),
+            lane=self._lane(action=action),
+        )
+
+    def clear_message(self, resp_uuid=None):
+        """
+        清除待发送的消息
+        :param resp_uuid: 只清除该响应的文字内容(保留结束帧), 为空时全部清除
+        """
+        if not resp_uuid:
+            self.queue_msg.purge()
+            return
+
+        def match(item):
+            return (
+                item
+                and item.get("resp_uuid") == resp_uuid
+                and not (item.get("data") or {}).get("end", False)
+            )
 
-    def clear_message(self):
-        with self.queue_lock:
-            while not self.queue_msg.empty():
-                self.queue_msg.get()
-                self.queue_msg.task_done()
+        count = self.queue_msg.purge(match=match, lanes=[LANE_CONTENT])
+        # 合并中的文字由发送线程丢弃
+        self.queue_msg.put(
+            item=dict(action=_ACTION_DISCARD, resp_uuid=resp_uuid), lane=LANE_CONTROL
+        )
+        logger.debug("清除待发送消息: resp_uuid=%s, count=%s", resp_uuid, count)
+
+    def stats(self) -> dict:
+        """发送统计(IOLoop线程中调用)"""
+        return {
+            "frames": self.frames,
+            "merged": self.coalescer.merged,
+            "lanes": self.queue_msg.depth(),
+            "lane_dropped": self.queue_msg.dropped,
+            "lane_merged": self.queue_msg.merged,
+            "fanout": self.fanout,
+            "fanout_avg": round(self.fanout / self.frames, 2) if self.frames else 0,
+            "fanout_time_us": (
+                round(self.fanout_time * 1e6 / self.frames, 1) if self.frames else 0
+            ),
+            "channels": dict(
+                (channel, len(subscribers))
+                for channel, subscribers in ExtWebSocketHandler.channels.items()
+            ),
+            "clients": [client.info() for client in list(self.clients)],
+        }
 
     def run(self):
         while self.running.is_set():
-            data = self.queue_msg.get()
+            try:
+                data = self.queue_msg.get(timeout=self.coalescer.timeout())
+            except queue.Empty:
+                # 合并窗口到期
+                self._send_frame(self.coalescer.flush())
+                continue
             if data:
                 try:
-                    self.send_message(**data)
+                    self._send_data(data)
                 except:
                     logger.critical("websocket send message err.", exc_info=True)
-            self.queue_msg.task_done()
+        self._send_frame(self.coalescer.flush())
 
     def start(self):
         self.running.set()
@@ -150,5 +580,187 @@ class WebSocketSender:
 
     def stop(self):
         self.running.clear()
-        self.queue_msg.put(None)
+        self.queue_msg.put(None, lane=LANE_CONTROL)
         self.thread and self.thread.join()
+
+    def _send_data(self, data: dict):
+        if data.get("action") == _ACTION_DISCARD:
+            self.coalescer.discard(resp_uuid=data.get("resp_uuid"))
+            return
+        if self.coalescer.accept(data):
+            # 增量帧: 合并后再发送
+            for frame in self.coalescer.add(data):
+                self._send_frame(frame)
+        else:
+            # 控制帧: 先发送已合并的内容, 再立即发送
+            self._send_frame(self.coalescer.flush())
+            self.send_message(**data)
+
+    @classmethod
+    def _lane(cls, action: str) -> int:
+        if action in CONTROL_ACTIONS:
+            return LANE_CONTROL
+        if action in (ACTION_ROBOT_WRITE, ACTION_USER_SPEAK):
+            return LANE_CONTENT
+        return LANE_HISTORY
+
+    def _send_frame(self, frame: Optional[dict]):
+        if frame:
+            self.send_message(**frame)
+
+    def _dispatch(self, payload: str, put_time: float, user_id=None):
+        start = time.perf_counter()
+        self.fanout += ExtWebSocketHandler.dispatch(
+            payload=payload, put_time=put_time, user_id=user_id
+        )
+        cost = time.perf_counter() - start
+        self.fanout_time += cost
+        m_fanout.observe(cost)
+
+
+class AudioStream:
+    """
+    单个句子的音频流
+    合成过程中通过 write 发送分片; 不支持流式合成的引擎, close 时读取音频文件发送
+    """
+
+    def __init__(self, sender: WebSocketSender, resp_uuid, index: int, chunk_size: int):
+        self.sender = sender
+        self.resp_uuid = resp_uuid or uuid.uuid4().hex
+        self.index = index
+        self.chunk_size = chunk_size
+        self.seq = 0
+        self.streamed = False
+
+    def write(self, data: bytes):
+        """发送合成中的音频数据"""
+        for i in range(0, len(data), self.chunk_size):
+            self._send(chunk=data[i : i + self.chunk_size])
+        self.streamed = True
+
+    def close(self, audio: str = None):
+        """结束, 没有流式发送过则发送音频文件"""
+        if not self.streamed and audio:
+            try:
+                with open(audio, "rb") as f:
+                    for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                        self._send(chunk=chunk)
+            except OSError:
+                logger.warning("读取音频失败: %s", audio, exc_info=True)
+        self._send(chunk=b"", final=True)
+
+    def _send(self, chunk: bytes, final=False):
+        self.sender.send_audio(
+            resp_uuid=self.resp_uuid,
+            index=self.index,
+            seq=self.seq,
+            chunk=chunk,
+            final=final,
+        )
+        self.seq += 1
+
+
+def merge_delta(older, newer, text="message", uuid="resp_uuid") -> Optional[dict]:
+    """
+    合并同一响应相邻的两个 robot_write 增量帧, 不能合并时返回None
+    :param text: 文字的键(序列化后的消息为 text)
+    :param uuid: 响应标记的键(序列化后的消息为 uuid)
+    """
+
+    def is_delta(item) -> bool:
+        return (
+            isinstance(item, dict)
+            and item.get("action") == ACTION_ROBOT_WRITE
+            and bool(item.get(text))
+            and not (item.get("data") or {}).get("end", False)
+        )
+
+    if not (is_delta(older) and is_delta(newer)):
+        return None
+    if older.get(uuid) != newer.get(uuid) or older.get("user_id") != newer.get(
+        "user_id"
+    ):
+        return None
+    return dict(older, **{text: older[text] + newer[text]})
+
+
+def _uuid_bytes(resp_uuid) -> bytes:
+    try:
+        return uuid.UUID(hex=str(resp_uuid)).bytes
+    except ValueError:
+        return hashlib.md5(str(resp_uuid).encode("utf-8")).digest()
+
+
+class FrameCoalescer:
+    """
+    合并同一响应连续的 robot_write 增量帧
+    窗口(window)到期或内容超过 max_bytes 时输出一帧; window<=0 时不合并
+    """
+
+    def __init__(self, window: float, max_bytes: int):
+        self.window = window
+        self.max_bytes = max_bytes
+        self.pending: Optional[dict] = None
+        self.texts = []
+        self.size = 0
+        self.deadline = 0
+        self.merged = 0  # 被合并掉的帧数
+
+    def accept(self, data: dict) -> bool:
+        """是否可合并"""
+        return (
+            self.window > 0
+            and data.get("action") == ACTION_ROBOT_WRITE
+            and bool(data.get("message"))
+            and not (data.get("data") or {}).get("end", False)
+        )
+
+    def add(self, data: dict) -> list:
+        """
+        加入增量帧
+        返回: 需要立即发送的帧
+        """
+        frames = []
+        if self.pending and not self._same_stream(data):
+            frames.append(self.flush())
+        if self.pending:
+            self.merged += 1
+        else:
+            self.pending = data
+            self.deadline = time.time() + self.window
+        self.texts.append(data["message"])
+        self.size += len(data["message"].encode("utf-8"))
+        # 增量帧持续到达时发送线程不会超时, 在这里检查窗口是否到期
+        if self.size >= self.max_bytes or time.time() >= self.deadline:
+            frames.append(self.flush())
+        return frames
+
+    def discard(self, resp_uuid) -> bool:
+        """丢弃合并中的该响应的文字(响应被打断)"""
+        if not self.pending or self.pending.get("resp_uuid") != resp_uuid:
+            return False
+        self.pending = None
+        self.texts = []
+        self.size = 0
+        return True
+
+    def flush(self) -> Optional[dict]:
+        """输出已合并的帧"""
+        if not self.pending:
+            return None
+        frame = dict(self.pending, message="".join(self.texts))
+        self.pending = None
+        self.texts = []
+        self.size = 0
+        return frame
+
+    def timeout(self) -> Optional[float]:
+        """距离窗口到期的时间, 没有待合并内容时返回None(一直等待)"""
+        if not self.pending:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def _same_stream(self, data: dict) -> bool:
+        return data.get("resp_uuid") == self.pending.get("resp_uuid") and data.get(
+            "user_id"
+        ) == self.pending.get("user_id")
@@ -1,32 +1,44 @@
 # -*- coding: utf -8-*-
 import os
 import base64
+import functools
 import tempfile
 import threading
+import time
 
-import pypinyin
 import subprocess
 import uuid
 
 import asyncio
-import edge_tts
-import nest_asyncio
 
-from aip import AipSpeech
-from octopus.robot import utils, config, constants
+from octopus.robot import utils, config, constants, metrics, registry
 from octopus.robot import log
 from pathlib import Path
-from pypinyin import lazy_pinyin
-from pydub import AudioSegment
 from abc import ABCMeta, abstractmethod
-from octopus.robot.sdk import TencentSpeech, AliSpeech, XunfeiSpeech, atc, VITSClient
 import requests
 from xml.etree import ElementTree
 
-from octopus.robot.sdk.TencentSpeech import Credential, SpeechSynthesizer, SynthesisListener
-
 logger = log.getLogger(__name__)
-nest_asyncio.apply()
+
+m_speech = metrics.histogram(
+    "octopus_tts_seconds", "TTS合成耗时", labelnames=("engine",)
+)
+m_errors = metrics.counter("octopus_tts_errors", "TTS合成失败次数", labelnames=("engine",))
+
+
+def _timed_speech(func):
+    @functools.wraps(func)
+    def get_speech(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        except Exception:
+            m_errors.labels(self.SLUG).inc()
+            raise
+        finally:
+            m_speech.labels(self.SLUG).observe(time.perf_counter() - start)
+
+    return get_speech
 
 
 class AbstractTTS(object):
@@ -35,6 +47,13 @@ class AbstractTTS(object):
     """
 
     __metaclass__ = ABCMeta
+    STREAMING = False  # get_speech 是否支持 on_chunk 流式输出
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # 统计实现类的合成耗时
+        if "get_speech" in cls.__dict__:
+            cls.get_speech = _timed_speech(cls.__dict__["get_speech"])
 
     @classmethod
     def get_config(cls):
@@ -97,6 +116,11 @@ class HanTTS(AbstractTTS):
         """
         Synthesize .wav from text
         """
+        from pydub import AudioSegment
+        from pypinyin import lazy_pinyin, Style
+
+        from octopus.robot.sdk import atc
+
         src = os.path.join(constants.CONFIG_PATH, self.voice)
         text = phrase
 
@@ -107,7 +131,7 @@ class HanTTS(AbstractTTS):
                     syllable = syllable.replace(p, "")
                 if syllable.isdigit():
                     syllable = atc.num2chinese(syllable)
-                    new_sounds = lazy_pinyin(syllable, style=pypinyin.TONE3)
+                    new_sounds = lazy_pinyin(syllable, style=Style.TONE3)
                     for e in new_sounds:
                         temp.append(e)
                 else:
@@ -124,7 +148,7 @@ class HanTTS(AbstractTTS):
         delay = 0
         increment = 355  # milliseconds
         pause = 500  # pause for punctuation
-        syllables = lazy_pinyin(text, style=pypinyin.TONE3)
+        syllables = lazy_pinyin(text, style=Style.TONE3)
         syllables = preprocess(syllables)
 
         # initialize to be complete silence, each character takes up ~500ms
@@ -224,6 +248,8 @@ class BaiduTTS(AbstractTTS):
     SLUG = "baidu-tts"
 
     def __init__(self, appid, api_key, secret_key, per=1, lan="zh", **args):
+        from aip import AipSpeech
+
         super(self.__class__, self).__init__()
         self.client = AipSpeech(appid, api_key, secret_key)
         self.per, self.lan = str(per), lan
@@ -244,11 +270,13 @@ class BaiduTTS(AbstractTTS):
             logger.critical(f"{self.SLUG} 合成失败！", stack_info=True)
 
 
-class TencentTTSListener(SynthesisListener):
+class TencentTTSListener(object):
+    """实现 TencentSpeech.SynthesisListener 的回调(不继承, SDK在合成时才导入)"""
 
-    def __init__(self, text, ext, on_end=None):
+    def __init__(self, text, ext, on_end=None, on_chunk=None):
         self.cache_file = utils.voice_cache_name(msg=text, ext=ext)
         self.on_end = on_end
+        self.on_chunk = on_chunk
 
     def on_synthesis_start(self, ws, session_id):
         logger.debug("tencent tts start: session_id={}".format(session_id))
@@ -268,6 +296,8 @@ class TencentTTSListener(SynthesisListener):
         logger.debug("on_audio_result: recv audio bytes, len={}".format(len(audio_bytes)))
         with open(file=self.cache_file, mode='a+b') as f:
             f.write(audio_bytes)
+        if self.on_chunk:
+            self.on_chunk(audio_bytes)
 
     def on_text_result(self, ws, response):
         session_id = response["session_id"]
@@ -296,6 +326,7 @@ class TencentTTS(AbstractTTS):
     """
 
     SLUG = "tencent-tts"
+    STREAMING = True
 
     def __init__(
             self,
@@ -305,6 +336,8 @@ class TencentTTS(AbstractTTS):
             voiceType=0,
             **kwargs,
     ):
+        from octopus.robot.sdk.TencentSpeech import Credential
+
         super(self.__class__, self).__init__()
         self.app_id = appid
         self.voice_type = voiceType
@@ -316,10 +349,14 @@ class TencentTTS(AbstractTTS):
         # Try to get tencent_yuyin config from config
         return config.get("tencent_yuyin", {})
 
-    def get_speech(self, phrase, is_final=False, on_completed=None):
+    def get_speech(self, phrase, is_final=False, on_completed=None, on_chunk=None):
+        from octopus.robot.sdk.TencentSpeech import SpeechSynthesizer
+
         # init
         speech = SpeechSynthesizer(app_id=self.app_id, credential=self.credential)
-        listener = TencentTTSListener(text=phrase, ext=f'.{self.codec}', on_end=on_completed)
+        listener = TencentTTSListener(
+            text=phrase, ext=f'.{self.codec}', on_end=on_completed, on_chunk=on_chunk
+        )
         speech.set_voice_type(self.voice_type)
         speech.set_codec(self.codec)
         speech.set_text(phrase)
@@ -352,6 +389,8 @@ class XunfeiTTS(AbstractTTS):
         return config.get("xunfei_yuyin", {})
 
     def get_speech(self, phrase, is_final=False):
+        from octopus.robot.sdk import XunfeiSpeech
+
         return XunfeiSpeech.synthesize(
             phrase, self.appid, self.api_key, self.api_secret, self.voice_name
         )
@@ -366,9 +405,25 @@ class AliTTS(AbstractTTS):
 
     SLUG = "ali-tts"
 
-    def __init__(self, appKey, token, voice="xiaoyun", **args):
+    def __init__(
+        self,
+        appKey,
+        token,
+        voice="xiaoyun",
+        access_key_id="",
+        access_key_secret="",
+        **args,
+    ):
+        from octopus.robot.sdk import AliSpeech
+
         super(self.__class__, self).__init__()
         self.appKey, self.token, self.voice = appKey, token, voice
+        self.access_key = (access_key_id, access_key_secret)
+        if access_key_id:
+            try:
+                AliSpeech.get_token(self.token, *self.access_key)
+            except Exception:
+                logger.error(f"{self.SLUG} 令牌获取失败", exc_info=True)
 
     @classmethod
     def get_config(cls):
@@ -376,7 +431,14 @@ class AliTTS(AbstractTTS):
         return config.get("ali_yuyin", {})
 
     def get_speech(self, phrase, is_final=False):
-        tmpfile = AliSpeech.tts(self.appKey, self.token, self.voice, phrase)
+        from octopus.robot.sdk import AliSpeech
+
+        try:
+            token = AliSpeech.get_token(self.token, *self.access_key)
+        except Exception:
+            logger.error(f"{self.SLUG} 令牌获取失败", exc_info=True)
+            return None
+        tmpfile = AliSpeech.tts(self.appKey, token, self.voice, phrase)
         if tmpfile:
             logger.debug("%s 语音合成成功，合成路径：%s", self.SLUG, tmpfile)
             return tmpfile
@@ -392,30 +454,49 @@ class EdgeTTS(AbstractTTS):
     """
 
     SLUG = "edge-tts"
+    STREAMING = True
 
     def __init__(self, voice="zh-CN-XiaoxiaoNeural", **args):
+        import edge_tts
+        import nest_asyncio
+
         super(self.__class__, self).__init__()
         self.voice = voice
+        self.edge_tts = edge_tts
+        self.nest_asyncio = nest_asyncio
 
     @classmethod
     def get_config(cls):
         # Try to get ali_yuyin config from config
         return config.get("edge-tts", {})
 
-    async def async_get_speech(self, phrase):
+    async def async_get_speech(self, phrase, on_chunk=None):
         try:
             tmpfile = os.path.join(constants.TEMP_PATH, uuid.uuid4().hex + ".mp3")
-            tts = edge_tts.Communicate(text=phrase, voice=self.voice)
-            await tts.save(tmpfile)
+            tts = self.edge_tts.Communicate(text=phrase, voice=self.voice)
+            if on_chunk:
+                # 边合成边输出
+                with open(tmpfile, "wb") as f:
+                    async for chunk in tts.stream():
+                        if chunk["type"] == "audio":
+                            f.write(chunk["data"])
+                            on_chunk(chunk["data"])
+            else:
+                await tts.save(tmpfile)
             logger.debug("%s 语音合成成功，合成路径：%s", self.SLUG, tmpfile)
             return tmpfile
         except Exception as e:
             logger.critical(f"{self.SLUG} 合成失败：{str(e)}！", stack_info=True)
             return None
 
-    def get_speech(self, phrase, is_final=False):
+    def get_speech(self, phrase, is_final=False, on_chunk=None):
         event_loop = asyncio.new_event_loop()
-        tmpfile = event_loop.run_until_complete(self.async_get_speech(phrase))
+        # 允许在已运行事件循环的线程中(如 tornado)同步合成
+        # 注意: 除了 event_loop, nest_asyncio 也会全局替换 asyncio 的实现
+        self.nest_asyncio.apply(event_loop)
+        tmpfile = event_loop.run_until_complete(
+            self.async_get_speech(phrase, on_chunk=on_chunk)
+        )
         event_loop.close()
         return tmpfile
 
@@ -479,6 +560,8 @@ class VITS(AbstractTTS):
         return config.get("VITS", {})
 
     def get_speech(self, phrase, is_final=False):
+        from octopus.robot.sdk import VITSClient
+
         result = VITSClient.tts(phrase, self.server_url, self.api_key, self.speaker_id, self.length, self.noise,
                                 self.noisew, self.max, self.timeout)
         tmpfile = utils.save_voice_cache(msg=phrase, ext=".wav", data=result)
@@ -498,6 +581,11 @@ def get_engine_by_slug(slug=None):
     if not slug or type(slug) is not str:
         raise TypeError("无效的 TTS slug '%s'", slug)
 
+    engine = registry.find("tts", slug)
+    if engine:
+        logger.info(f"使用 {engine.SLUG} TTS 引擎")
+        return engine.get_instance()
+
     selected_engines = list(
         filter(
             lambda engine: hasattr(engine, "SLUG") and engine.SLUG == slug,
@@ -54,10 +54,12 @@ class ConversationAgent(AbstractAgent):
     def stop(self):
         self.running.clear()
 
-    def response(self, query: str, **kwargs):
+    def response(self, query: str, user_id=None, **kwargs):
         # 响应
         self.interrupted.clear()
-        ThreadManager.new(target=self._do_response, kwargs=dict(query=query)).start()
+        ThreadManager.new(
+            target=self._do_response, kwargs=dict(query=query, user_id=user_id)
+        ).start()
 
     def stop_response(self, req_id=None, manual=False, interrupt_time=None, **kwargs):
         # 停止响应
@@ -66,9 +68,9 @@ class ConversationAgent(AbstractAgent):
             req_id=req_id, manual=manual, interrupt_time=interrupt_time
         )
 
-    def _do_response(self, query: str, **kwargs):
+    def _do_response(self, query: str, user_id=None, **kwargs):
         try:
-            self.conversation.do_response(query=query)
+            self.conversation.do_response(query=query, user_id=user_id)
         finally:
             if not self.interrupted.is_set():
                 self.bot.action(event=AssistantEvent.RESPONDED)
@@ -2,16 +2,25 @@
 import queue
 import threading
 import time
+from concurrent.futures import Future
 from typing import Optional
 
 import numpy
 
 from octopus.robot import config, log, RTAsr
 from octopus.robot.agent import get_agent_by_slug
-from octopus.robot.compt import Robot, ThreadManager, StateMachine, TimeoutMonitor
+from octopus.robot.compt import (
+    Robot,
+    ThreadManager,
+    StateMachine,
+    TimeoutMonitor,
+    CircularQueue,
+    ControlBus,
+)
 from octopus.robot.detector import get_detector_by_slug
 from octopus.robot.enums import AssistantStatus, AssistantEvent
 from octopus.robot.recognizer import get_recongnizer_by_slug
+from octopus.robot.tracer import tracer
 
 logger = log.getLogger(__name__)
 
@@ -25,6 +34,7 @@ class VoiceAssistant(Robot):
         self.running = threading.Event()  # 运行标记
         self.listener = VoiceListener(timeout_monitor=timeout_monitor)  # 麦克风控制
         self.machine = StateMachine()  # 状态机
+        self.control = ControlBus()  # 控制命令(web等外部操作)
         self.audio_queue = queue.Queue()  # 语音队列
         # 组件
         self.detector = None  # 语音检测组件
@@ -41,6 +51,8 @@ class VoiceAssistant(Robot):
     def start(self):
         self.running.set()
         self.machine.init_status(AssistantStatus.DEFAULT)
+        self.machine.start()
+        self.control.start()
         # 组件
         self.asr.connect()
         self.listener.start(on_voice=self._on_voice)
@@ -50,6 +62,8 @@ class VoiceAssistant(Robot):
 
     def stop(self):
         self.running.clear()
+        self.control.stop()
+        self.machine.stop()
         # 组件
         self.asr.disconnect()
         self.listener.stop()
@@ -60,8 +74,27 @@ class VoiceAssistant(Robot):
     def is_running(self):
         return self.running.is_set()
 
-    def action(self, event: AssistantEvent, **kwargs):
-        self.machine.send_event(event=event, **kwargs)
+    def action(self, event: AssistantEvent, **kwargs) -> Future:
+        """提交事件, 由状态机的事件线程按顺序处理"""
+        return self.machine.dispatch(event=event, **kwargs)
+
+    def submit(self, event: AssistantEvent, on_done=None, **kwargs) -> int:
+        """
+        提交控制事件, 由控制线程按顺序执行, 不阻塞调用方
+        :param on_done: 完成回调, 参数为执行结果(dict)
+        返回: 命令ID
+        """
+        command = self.control.submit(
+            name=event.name, func=self._apply, on_done=on_done, event=event, **kwargs
+        )
+        return command.cmd_id
+
+    def _apply(self, event: AssistantEvent, **kwargs):
+        # 等待状态机处理完成, 以便统计控制命令的实际耗时
+        return self.action(event=event, **kwargs).result()
+
+    def control_stats(self) -> dict:
+        return self.control.stats()
 
     def status(self):
         return self.machine.get_status()
@@ -206,6 +239,7 @@ class VoiceAssistant(Robot):
 
     def _on_ctrl_wakeup_(self, from_status, to_status, event, **kwargs):
         self._log(from_status, to_status, event, **kwargs)
+        tracer.begin(source="manual")
         self.detector.skip_detect(**kwargs)
 
     def _on_ctrl_commit_listen_(self, from_status, to_status, event, **kwargs):
@@ -260,6 +294,10 @@ class VoiceListener:
         self.thread_audio: Optional[threading.Thread] = None
         self.running = threading.Event()
         self.listening = threading.Event()
+        # 音频帧间隔(秒), 用于统计抖动
+        self.frame_intervals = CircularQueue(
+            size=config.get(item="/voice/jitter_window", default=600)
+        )
 
     def start(self, on_voice=None):
         self.running.set()
@@ -296,9 +334,14 @@ class VoiceListener:
             frames_per_buffer=frames,
         )
         # 发送语音前, 要先发送MetaInfo
+        last_read = None
         while self.running.is_set():
             # last_time = time.time()
             data = stream.read(chunk)
+            now = time.perf_counter()
+            if last_read:
+                self.frame_intervals.enqueue(now - last_read)
+            last_read = now
             try:
                 # 发送空内容, 触发offline
                 if not self.listening.is_set():
@@ -318,6 +361,19 @@ class VoiceListener:
             #     interval_time = self.interval_time
             time.sleep(self.interval_time)
 
+    def frame_stats(self) -> dict:
+        """音频帧间隔统计(毫秒)"""
+        intervals = numpy.array(self.frame_intervals.all()) * 1000
+        if not len(intervals):
+            return {"frames": 0}
+        return {
+            "frames": len(intervals),
+            "interval_ms": round(float(intervals.mean()), 2),
+            "jitter_ms": round(float(intervals.std()), 2),
+            "p95_ms": round(float(numpy.percentile(intervals, 95)), 2),
+            "max_ms": round(float(intervals.max()), 2),
+        }
+
     def sleep_time(self, last_time: float) -> float:
         """音频块时长"""
         return self.interval_time - time.time() + last_time
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+启动编排: 按依赖关系并发执行启动步骤(组件创建、建立连接、预热), 记录每一步的耗时
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from octopus.robot import log
+
+logger = log.getLogger(__name__)
+
+
+class BootStep:
+    def __init__(self, name: str, func: Callable, deps=(), required=True):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.required = required  # 失败时启动失败, 否则只记录
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+        self.exc: Optional[BaseException] = None
+        self.skipped = False
+        self.thread = None
+
+    @property
+    def finished(self) -> bool:
+        return self.end is not None
+
+    @property
+    def ok(self) -> bool:
+        return self.finished and not self.error
+
+
+class BootGraph:
+    """启动步骤的依赖图"""
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self.steps: Dict[str, BootStep] = dict()
+        self.marks: Dict[str, float] = dict()  # 瞬时事件(如 ready)
+        self.lock = threading.Lock()
+        self.all_done = threading.Event()
+        self.origin = time.perf_counter()
+        self.wall_origin = time.time()
+        self.executor = None
+
+    def add(self, name: str, func: Callable, deps=(), required=True) -> BootStep:
+        step = BootStep(name=name, func=func, deps=deps, required=required)
+        self.steps[name] = step
+        return step
+
+    def mark(self, name: str):
+        self.marks[name] = time.perf_counter()
+        logger.info("启动: %s, %.0fms", name, (self.marks[name] - self.origin) * 1000)
+
+    def run(self, timeout: float = None):
+        """
+        执行所有步骤, 必需的步骤失败时抛出其异常
+
+        :raises TimeoutError: 超时时还有未完成的必需步骤
+        """
+        self._check()
+        self.origin = time.perf_counter()
+        self.wall_origin = time.time()
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="boot"
+        )
+        pending = []
+        try:
+            self._schedule()
+            if not self.all_done.wait(timeout=timeout):
+                pending = [s for s in self.steps.values() if not s.finished]
+                logger.warning("启动步骤超时: %s", [s.name for s in pending])
+        finally:
+            self.executor.shutdown(wait=False)
+        self.mark("booted")
+        required = [s.name for s in pending if s.required]
+        if required:
+            raise TimeoutError(f"必需的启动步骤超时: {required}")
+        for step in self.steps.values():
+            if step.required and step.exc:
+                raise step.exc
+
+    def timeline(self) -> dict:
+        """每一步的开始/结束时间(毫秒, 相对启动开始)"""
+
+        def ms(t):
+            return None if t is None else round((t - self.origin) * 1000, 1)
+
+        steps = []
+        for step in sorted(
+            self.steps.values(), key=lambda s: (s.start is None, s.start or 0)
+        ):
+            steps.append(
+                {
+                    "name": step.name,
+                    "deps": list(step.deps),
+                    "start_ms": ms(step.start),
+                    "end_ms": ms(step.end),
+                    "dur_ms": (
+                        round((step.end - step.start) * 1000, 1)
+                        if step.start is not None and step.end is not None
+                        else None
+                    ),
+                    "ok": step.ok,
+                    "skipped": step.skipped,
+                    "error": step.error,
+                    "thread": step.thread,
+                }
+            )
+        return {
+            "time": self.wall_origin,
+            "marks": {name: ms(t) for name, t in self.marks.items()},
+            "steps": steps,
+        }
+
+    def _check(self):
+        for step in self.steps.values():
+            for dep in step.deps:
+                if dep not in self.steps:
+                    raise ValueError(f"启动步骤 {step.name} 依赖的 {dep} 不存在")
+        # 环检测
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"启动步骤存在循环依赖: {name}")
+            visiting.add(name)
+            for dep in self.steps[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.steps:
+            visit(name)
+
+    def _schedule(self):
+        """提交依赖都已完成的步骤"""
+        ready = []
+        with self.lock:
+            changed = True
+            while changed:  # 跳过的步骤会让依赖它的步骤也可以判断
+                changed = False
+                for step in self.steps.values():
+                    if step.start is not None:
+                        continue
+                    deps = [self.steps[d] for d in step.deps]
+                    if not all(d.finished for d in deps):
+                        continue
+                    step.start = time.perf_counter()
+                    failed = [d.name for d in deps if not d.ok]
+                    if failed:
+                        step.skipped = True
+                        step.error = f"依赖失败: {failed}"
+                        step.end = step.start
+                        changed = True
+                        logger.warning("跳过启动步骤: %s, %s", step.name, step.error)
+                    else:
+                        ready.append(step)
+            if all(s.finished for s in self.steps.values()):
+                self.all_done.set()
+        for step in ready:
+            self.executor.submit(self._run_step, step)
+
+    def _run_step(self, step: BootStep):
+        step.thread = threading.current_thread().name
+        try:
+            step.func()
+        except BaseException as e:
+            step.exc = e
+            step.error = f"{type(e).__name__}: {e}"
+            log_func = logger.critical if step.required else logger.warning
+            log_func("启动步骤失败: %s", step.name, exc_info=True)
+        finally:
+            step.end = time.perf_counter()
+            logger.info(
+                "启动步骤: %s, %.0fms", step.name, (step.end - step.start) * 1000
+            )
+        self._schedule()
@@ -2,10 +2,13 @@
 from abc import ABCMeta, abstractmethod
 import asyncio
 import collections
+import itertools
+import queue
 import subprocess
 import threading
 import time
 from collections import deque
+from concurrent.futures import Future
 from ctypes import cast, POINTER
 from enum import Enum
 from typing import Callable, List, Tuple, Dict, Optional
@@ -17,11 +20,29 @@ from octopus.robot import log, utils
 logger = log.getLogger(__name__)
 
 
+# 状态停留时长的直方图分桶(秒)
+DWELL_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60)
+
+
 class StateMachine:
+    """
+    状态机
+    dispatch: 事件进入队列, 由事件线程按顺序处理(start之后)
+    send_event: 在调用线程中直接处理
+    记录状态变更轨迹(环形缓冲)和各状态的停留时长
+    """
 
-    def __init__(self):
+    def __init__(self, trace_size: int = 256):
         self.status = None
         self.changes: Dict[str, tuple] = {}
+        self.queue_event = queue.Queue()
+        self.running = threading.Event()
+        self.lock = threading.Lock()
+        # 轨迹
+        self.trace = CircularQueue(size=trace_size)
+        self.entered = time.perf_counter()  # 进入当前状态的时间
+        self.dwell: Dict[str, dict] = {}
+        self.dropped = 0  # 未定义(丢弃)的事件数
 
     def regedit(
         self, from_status: Enum, to_status: Enum, event: Enum, call=None, replace=False
@@ -35,18 +56,50 @@ class StateMachine:
 
     def init_status(self, status: Enum):
         self.status = status
+        self.entered = time.perf_counter()
+
+    def start(self):
+        self.running.set()
+        ThreadManager.new(target=self._run, name="state-machine").start()
+
+    def stop(self):
+        self.running.clear()
+        self.queue_event.put(None)
+
+    def dispatch(self, event: Enum, **kwargs) -> Future:
+        """
+        提交事件, 按提交顺序处理, 可在任意线程调用
+        返回: Future, 结果为变更后的状态(未定义的事件为None)
+        """
+        future = Future()
+        put_time = time.perf_counter()
+        if not self.running.is_set():
+            self._handle(event, kwargs, future, put_time)
+        else:
+            self.queue_event.put((event, kwargs, future, put_time))
+        return future
 
-    def send_event(self, event: Enum, **kwargs):
+    def send_event(self, event: Enum, put_time: float = None, **kwargs):
+        """处理事件, 返回变更后的状态(未定义的事件返回None)"""
+        start = time.perf_counter()
         dst = self.next_status(event=event)
         if not dst:
-            logger.error("status=%s, event=%s 未定义", self.status.value, event.value)
-            return
+            logger.warning("status=%s, event=%s 未定义", self.status.value, event.value)
+            with self.lock:
+                self.dropped += 1
+            self._trace(self.status, event, None, put_time or start, start)
+            return None
         s_from = self.status
         # 变更状态
         self.status = dst[0]
+        self._record_dwell(status=s_from, now=start)
         # 执行处理
-        if dst[1]:
-            dst[1](s_from, self.status, event, **kwargs)
+        try:
+            if dst[1]:
+                dst[1](s_from, self.status, event, **kwargs)
+        finally:
+            self._trace(s_from, event, self.status, put_time or start, start)
+        return self.status
 
     def next_status(self, event: Enum) -> Optional[tuple]:
         return self.changes.get(self.get_key(status=self.status, event=event), None)
@@ -54,10 +107,80 @@ class StateMachine:
     def get_status(self):
         return self.status
 
+    def traces(self) -> list:
+        """状态变更轨迹"""
+        return self.trace.all()
+
+    def stats(self) -> dict:
+        with self.lock:
+            dwell = dict((k, dict(v)) for k, v in self.dwell.items())
+            dropped = self.dropped
+        for v in dwell.values():
+            v["avg"] = round(v.pop("sum") / v["count"], 3)
+            v["max"] = round(v["max"], 3)
+            labels = [f"<={b}" for b in DWELL_BUCKETS] + [f">{DWELL_BUCKETS[-1]}"]
+            v["buckets"] = dict(zip(labels, v["buckets"]))
+        return {
+            "status": self.status and self.status.name,
+            "dwell_now": round(time.perf_counter() - self.entered, 3),
+            "pending": self.queue_event.qsize(),
+            "dropped": dropped,
+            "dwell": dwell,
+        }
+
     @classmethod
     def get_key(cls, status: Enum, event: Enum) -> str:
         return f"{status.name}_{event.name}"
 
+    def _run(self):
+        while self.running.is_set():
+            item = self.queue_event.get()
+            if item is None:
+                continue
+            self._handle(*item)
+
+    def _handle(self, event: Enum, kwargs: dict, future: Future, put_time: float):
+        try:
+            future.set_result(self.send_event(event, put_time=put_time, **kwargs))
+        except Exception as e:
+            logger.error("事件处理失败: event=%s, %s", event.value, str(e), exc_info=True)
+            future.set_exception(e)
+
+    def _record_dwell(self, status: Enum, now: float):
+        cost = now - self.entered
+        self.entered = now
+        idx = len(DWELL_BUCKETS)
+        for i, bound in enumerate(DWELL_BUCKETS):
+            if cost <= bound:
+                idx = i
+                break
+        with self.lock:
+            h = self.dwell.setdefault(
+                status.name,
+                {
+                    "count": 0,
+                    "sum": 0.0,
+                    "max": 0.0,
+                    "buckets": [0] * (len(DWELL_BUCKETS) + 1),
+                },
+            )
+            h["count"] += 1
+            h["sum"] += cost
+            h["max"] = max(h["max"], cost)
+            h["buckets"][idx] += 1
+
+    def _trace(self, s_from, event, s_to, put_time: float, start: float):
+        self.trace.enqueue(
+            {
+                "time": time.time(),
+                "from": s_from and s_from.name,
+                "event": event.name,
+                "to": s_to and s_to.name,
+                "wait_ms": round((start - put_time) * 1000, 2),
+                "cost_ms": round((time.perf_counter() - start) * 1000, 2),
+            }
+        )
+
 
 class CircularQueue:
     """
@@ -98,6 +221,92 @@ class CircularQueue:
         return len(self.queue)
 
 
+class LaneQueue:
+    """
+    多通道优先级队列: 序号小的通道优先取出, 同一通道内先进先出
+    写入不阻塞, 通道满时先合并相邻的元素(merge), 仍然满时丢弃最旧的元素
+    """
+
+    def __init__(self, lanes: int, size: int = 0, merge: Callable = None):
+        """
+        :param merge: 合并相邻的两个元素 merge(older, newer), 不能合并时返回None
+        """
+        self.lanes = [deque() for _ in range(lanes)]
+        self.size = size
+        self.merge = merge
+        self.dropped = [0] * lanes
+        self.merged = [0] * lanes
+        self.cond = threading.Condition()
+
+    def put(self, item, lane: int = 0):
+        """
+        写入
+        """
+        with self.cond:
+            items = self.lanes[lane]
+            if self.size and len(items) >= self.size:
+                self._compact(lane)
+            if self.size and len(items) >= self.size:
+                items.popleft()
+                self.dropped[lane] += 1
+            items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout: float = None):
+        """
+        取出, 超时抛出 queue.Empty
+        """
+        with self.cond:
+            if not self.cond.wait_for(self._not_empty, timeout=timeout):
+                raise queue.Empty
+            for lane in self.lanes:
+                if lane:
+                    return lane.popleft()
+
+    def purge(
+        self, match: Callable[[object], bool] = None, lanes: List[int] = None
+    ) -> int:
+        """
+        删除匹配的元素, match为空时清空
+        返回: 删除的数量
+        """
+        count = 0
+        with self.cond:
+            for index in lanes if lanes is not None else range(len(self.lanes)):
+                lane = self.lanes[index]
+                keep = [item for item in lane if match and not match(item)]
+                count += len(lane) - len(keep)
+                lane.clear()
+                lane.extend(keep)
+        return count
+
+    def depth(self) -> List[int]:
+        return [len(lane) for lane in self.lanes]
+
+    def _compact(self, lane: int):
+        """合并通道中相邻的元素"""
+        if not self.merge:
+            return
+        items = self.lanes[lane]
+        kept = []
+        for item in items:
+            merged = kept and self.merge(kept[-1], item)
+            if merged:
+                kept[-1] = merged
+            else:
+                kept.append(item)
+        if len(kept) < len(items):
+            self.merged[lane] += len(items) - len(kept)
+            items.clear()
+            items.extend(kept)
+
+    def _not_empty(self) -> bool:
+        return any(self.lanes)
+
+    def __len__(self):
+        return sum(self.depth())
+
+
 class StreamStr:
     """
     处理流式字符串: 根据规则, 屏蔽特殊字符
@@ -151,14 +360,17 @@ class StreamStr:
         返回: 剩下内容, 起始关键字的内容
         """
         text_strip = text
+        debug = logger.isEnabledFor(log.DEBUG)
         # 去掉全匹配
         for rec in self.re_full:
             text_strip = rec.sub(repl="", string=text_strip)
-        logger.debug("cut full: %s", text_strip)
+        if debug:
+            logger.debug("cut full: %s", text_strip)
         # 去掉特殊字符
         for ch in self.re_special:
             text_strip = text_strip.replace(ch, "")
-        logger.debug("cut char: %s", text_strip)
+        if debug:
+            logger.debug("cut char: %s", text_strip)
         if clear:
             text = text_strip
         # 匹配开头
@@ -306,18 +518,43 @@ class ThreadManager:
 
     @classmethod
     def new(
-        cls, group=None, target=None, name=None, args=(), kwargs=None, *, daemon=None
+        cls,
+        group=None,
+        target=None,
+        name=None,
+        args=(),
+        kwargs=None,
+        *,
+        daemon=None,
+        role=None,
     ) -> threading.Thread:
+        """
+        :param role: 线程角色(线程栈快照/采样时标记), 默认为线程名或target的名称
+        """
         thread = threading.Thread(
             group=group, target=target, name=name, args=args, kwargs=kwargs, daemon=None
         )
+        thread.role = role or name or getattr(target, "__qualname__", thread.name)
+        cls.prune()
         cls.threads.update({thread.name: thread})
         return thread
 
+    @classmethod
+    def prune(cls):
+        """移除已结束的线程(未启动的保留)"""
+        for name, t in list(cls.threads.items()):
+            if t.ident is not None and not t.is_alive():
+                cls.threads.pop(name, None)
+
     @classmethod
     def get(cls, name) -> threading.Thread:
         return cls.threads.get(name, None)
 
+    @classmethod
+    def role(cls, thread: threading.Thread) -> str:
+        """线程角色: 非ThreadManager创建的线程为线程名"""
+        return getattr(thread, "role", None) or thread.name
+
     @classmethod
     def count(
         cls,
@@ -583,6 +820,127 @@ class TimeoutMonitor:
         return False
 
 
+class ControlCommand:
+    """控制命令"""
+
+    def __init__(self, cmd_id: int, name: str, func: Callable, kwargs: dict):
+        self.cmd_id = cmd_id
+        self.name = name
+        self.func = func
+        self.kwargs = kwargs
+        self.future = Future()
+        self.put_time = time.perf_counter()
+        self.start_time = None
+        self.end_time = None
+
+    def result(self) -> dict:
+        """执行结果(可跨进程传递)"""
+        error = self.future.exception() if self.future.done() else None
+        return {
+            "id": self.cmd_id,
+            "command": self.name,
+            "ok": self.future.done() and error is None,
+            "error": str(error) if error else None,
+            "wait_ms": round((self.start_time - self.put_time) * 1000, 2)
+            if self.start_time
+            else None,
+            "exec_ms": round((self.end_time - self.start_time) * 1000, 2)
+            if self.end_time
+            else None,
+        }
+
+
+class ControlBus:
+    """
+    控制命令总线: 调用方(如web线程)提交命令后立即返回, 由控制线程按顺序执行
+    统计每种命令的排队和执行耗时
+    """
+
+    def __init__(self, size: int = 256):
+        self.queue_cmd = queue.Queue(maxsize=size)
+        self.running = threading.Event()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, dict] = dict()
+        self.current: Optional[ControlCommand] = None
+
+    def start(self):
+        self.running.set()
+        ThreadManager.new(target=self._run, name="control-bus").start()
+
+    def stop(self):
+        self.running.clear()
+        try:
+            self.queue_cmd.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def submit(
+        self, name: str, func: Callable, on_done: Callable = None, **kwargs
+    ) -> ControlCommand:
+        """
+        提交命令, 队列已满时抛出 queue.Full
+        :param name: 命令名称(用于统计)
+        :param func: 执行函数, 参数为kwargs
+        :param on_done: 完成回调, 参数为 ControlCommand.result()
+        """
+        with self.lock:
+            cmd_id = next(self.ids)
+        command = ControlCommand(cmd_id=cmd_id, name=name, func=func, kwargs=kwargs)
+        if on_done:
+            command.future.add_done_callback(lambda _: on_done(command.result()))
+        self.queue_cmd.put_nowait(command)
+        return command
+
+    def stats(self) -> dict:
+        with self.lock:
+            metrics = dict((k, dict(v)) for k, v in self.metrics.items())
+        for m in metrics.values():
+            m["wait_avg_ms"] = round(m.pop("wait") / m["count"] * 1000, 2)
+            m["exec_avg_ms"] = round(m.pop("exec") / m["count"] * 1000, 2)
+            m["exec_max_ms"] = round(m.pop("exec_max") * 1000, 2)
+        current = self.current
+        return {
+            "pending": self.queue_cmd.qsize(),
+            "current": current and current.name,
+            "commands": metrics,
+        }
+
+    def _run(self):
+        while self.running.is_set():
+            command = self.queue_cmd.get()
+            if command is None:
+                continue
+            self.current = command
+            command.start_time = time.perf_counter()
+            try:
+                result = command.func(**command.kwargs)
+                command.end_time = time.perf_counter()
+                command.future.set_result(result)
+            except Exception as e:
+                command.end_time = time.perf_counter()
+                logger.error("控制命令执行失败: %s, %s", command.name, str(e), exc_info=True)
+                command.future.set_exception(e)
+            finally:
+                self.current = None
+                self._record(command)
+
+    def _record(self, command: ControlCommand):
+        wait = command.start_time - command.put_time
+        cost = command.end_time - command.start_time
+        with self.lock:
+            m = self.metrics.setdefault(
+                command.name,
+                {"count": 0, "errors": 0, "wait": 0.0, "exec": 0.0, "exec_max": 0.0},
+            )
+            m["count"] += 1
+            m["wait"] += wait
+            m["exec"] += cost
+            m["exec_max"] = max(m["exec_max"], cost)
+            if command.future.exception():
+                m["errors"] += 1
+
+
 class ByteBuffer(object):
     """Ring buffer to hold audio from PortAudio"""
 
@@ -1,5 +1,13 @@
 # -*- coding: utf-8 -*-
+"""
+配置
+
+配置文件加载后编译为不可变的快照(Snapshot): 预先展开所有路径("/a/b"), 读取时只查一次字典
+重新加载时生成新的快照整体替换, 读取方不会看到修改了一半的配置
+"""
+import itertools
 import os
+import threading
 import yaml
 import logging
 
@@ -7,8 +15,94 @@ from octopus.robot import constants
 
 logger = logging.getLogger(__name__)
 
-_config = {}
+_MISSING = object()
+
+
+class FrozenDict(dict):
+    """只读字典"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("配置是只读的")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+def freeze(value):
+    """dict -> FrozenDict, list -> tuple"""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class Snapshot:
+    """配置快照"""
+
+    _versions = itertools.count(1)
+
+    def __init__(self, data: dict):
+        self.version = next(self._versions)
+        self.data = freeze(data or {})
+        self.paths = dict()  # "/a/b" -> 值, 第一级同时保存 "a"
+        for key, value in self.data.items():
+            self.paths[key] = value
+        self._flatten("", self.data)
+
+    def _flatten(self, prefix: str, node: dict):
+        for key, value in node.items():
+            if not isinstance(key, str):
+                continue
+            path = f"{prefix}/{key}"
+            self.paths[path] = value
+            if isinstance(value, dict):
+                self._flatten(path, value)
+
+
+class Binding:
+    """
+    绑定的配置项: 按快照版本缓存(转换类型后的)值, 重新加载后自动更新
+    """
+
+    def __init__(self, item: str, default=None, type=None):
+        self.item = item
+        self.default = default
+        self.type = type
+        self.version = 0
+        self._value = default
+
+    @property
+    def value(self):
+        if not has_init:
+            init()
+        snapshot = _snapshot
+        if self.version != snapshot.version:
+            value = snapshot.paths.get(self.item, self.default)
+            if self.type and value is not None and not isinstance(value, self.type):
+                try:
+                    value = self.type(value)
+                except (TypeError, ValueError):
+                    logger.warning(
+                        "配置 %s 的值 %r 不是 %s, 使用默认值",
+                        self.item,
+                        value,
+                        self.type.__name__,
+                    )
+                    value = self.default
+            self._value = value
+            self.version = snapshot.version
+        return self._value
+
+
+_snapshot = Snapshot({})
+_config = _snapshot.data
 has_init = False
+_subscribers = dict()  # 路径 -> [callback]
+_subscribers_lock = threading.Lock()
 
 
 def reload():
@@ -16,7 +110,56 @@ def reload():
     重新加载配置
     """
     logger.info("配置文件发生变更，重新加载配置文件")
+    old = _snapshot
     init()
+    _notify(old=old, new=_snapshot)
+
+
+def bind(item: str, default=None, type=None) -> Binding:
+    """
+    绑定配置项, 之后通过 binding.value 读取
+    :param item: 配置项, 同 get
+    :param type: 转换的类型(int/float/str/bool...)
+    """
+    return Binding(item=item, default=default, type=type)
+
+
+def subscribe(item: str, callback):
+    """
+    订阅配置项: 重新加载后该配置项的值有变化时调用 callback(new, old)
+    """
+    with _subscribers_lock:
+        _subscribers.setdefault(item, []).append(callback)
+    return callback
+
+
+def unsubscribe(item: str, callback):
+    with _subscribers_lock:
+        callbacks = _subscribers.get(item, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+
+def _notify(old: Snapshot, new: Snapshot):
+    with _subscribers_lock:
+        subscribers = [(item, list(cbs)) for item, cbs in _subscribers.items()]
+    for item, callbacks in subscribers:
+        old_value = old.paths.get(item)
+        new_value = new.paths.get(item)
+        if old_value == new_value:
+            continue
+        for callback in callbacks:
+            try:
+                callback(new_value, old_value)
+            except Exception:
+                logger.error("配置变更回调失败: %s", item, exc_info=True)
+
+
+def snapshot() -> Snapshot:
+    """当前的配置快照"""
+    if not has_init:
+        init()
+    return _snapshot
 
 
 def init():
@@ -56,56 +199,44 @@ def doInit(config_file=constants.getDefaultConfigPath()):
             constants.CONFIG_PATH,
         )
 
-    global _config
+    global _config, _snapshot
 
     # Read config
     logger.debug("Trying to read config file: '%s'", config_file)
     try:
         with open(file=config_file, mode="r", encoding="utf8") as f:
-            _config = yaml.safe_load(f)
+            snapshot = Snapshot(yaml.safe_load(f))
     except Exception as e:
         logger.critical("配置文件 %s 读取失败: %s", config_file, str(e), exc_info=True)
         raise
+    # 整体替换
+    _snapshot = snapshot
+    _config = snapshot.data
+
+
+def _missing(item: str, default, warn: bool):
+    if warn:
+        logger.warning("%s not specified in profile, defaulting to '%s'", item, default)
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s not specified in profile, defaulting to '%s'", item, default)
+    return default
 
 
 def get_path(items, default=None, warn=False):
-    global _config
-    curConfig = _config
-    if isinstance(items, str) and items[0] == "/":
-        items = items.split("/")[1:]
+    if isinstance(items, str):
+        value = _snapshot.paths.get(items if items[0] == "/" else f"/{items}", _MISSING)
+        return _missing(items, default, warn) if value is _MISSING else value
+    curConfig = _snapshot.data
     for key in items:
-        if key in curConfig:
+        if isinstance(curConfig, dict) and key in curConfig:
             curConfig = curConfig[key]
         else:
-            if warn:
-                logger.warning(
-                    "/%s not specified in profile, defaulting to " "'%s'",
-                    "/".join(items),
-                    default,
-                )
-            else:
-                logger.debug(
-                    "/%s not specified in profile, defaulting to " "'%s'",
-                    "/".join(items),
-                    default,
-                )
-            return default
+            return _missing("/" + "/".join(items), default, warn)
     return curConfig
 
 
 def has_path(items):
-    global _config
-    curConfig = _config
-    if isinstance(items, str) and items[0] == "/":
-        items = items.split("/")[1:]
-    else:
-        items = [items]
-    for key in items:
-        if key in curConfig:
-            curConfig = curConfig[key]
-        else:
-            return False
-    return True
+    return items in _snapshot.paths
 
 
 def has(item):
@@ -115,6 +246,8 @@ def has(item):
     :param item: 配置项名
     :returns: True: 包含; False: 不包含
     """
+    if not has_init:
+        init()
     return has_path(item)
 
 
@@ -127,25 +260,14 @@ def get(item="", default=None, warn=False):
     :param warn: 不存在该配置时，是否告警
     :returns: 这个配置的值。如果没有该配置，则提供一个默认值
     """
-    global has_init
     if not has_init:
         init()
     if not item:
-        return _config
-    if item[0] == "/":
-        return get_path(item, default, warn)
-    try:
-        return _config[item]
-    except KeyError:
-        if warn:
-            logger.warning(
-                "%s not specified in profile, defaulting to '%s'", item, default
-            )
-        else:
-            logger.debug(
-                "%s not specified in profile, defaulting to '%s'", item, default
-            )
-        return default
+        return _snapshot.data
+    value = _snapshot.paths.get(item, _MISSING)
+    if value is _MISSING:
+        return _missing(item, default, warn)
+    return value
 
 
 def getConfig():
@@ -154,7 +276,7 @@ def getConfig():
 
     :returns: 全部配置数据（字典类型）
     """
-    return _config
+    return _snapshot.data
 
 
 def getText():
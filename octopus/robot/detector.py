@@ -7,6 +7,7 @@ from typing import Tuple
 from octopus.robot import config, log, utils, RTAsr
 from octopus.robot.compt import CircularQueue, ThreadManager, Robot
 from octopus.robot.enums import AssistantEvent
+from octopus.robot.tracer import tracer
 
 logger = log.getLogger(__name__)
 
@@ -124,6 +125,7 @@ class RealTimeDetector(AbstractDetector):
     def _on_detected(self, text: str = None, end: bool = False):
         self.detecting.clear()
         self.detect_queue.clear()
+        tracer.begin(source="voice")
         self.bot.action(event=AssistantEvent.DETECTED, text=text, end=end)
 
 
@@ -7,6 +7,7 @@ import dbus
 
 from octopus.robot import config, log, utils
 from octopus.robot.compt import ScreenControl
+from octopus.robot.memwatch import memwatch
 from octopus.robot.schedulers import DeferredScheduler
 
 logger = log.getLogger(__name__)
@@ -112,3 +113,25 @@ class ClearVoiceJob(ConfigJob):
             utils.clear_voice_cache(file=self.file, days=self.days)
         except:
             logger.critical(msg="清理音频文件异常.", exc_info=True)
+
+
+class MemoryWatchJob(ConfigJob):
+    """内存增长追踪"""
+
+    SLUG = "memory_watch"
+
+    def __init__(self, scheduler: DeferredScheduler, **kwargs):
+        if config.get(f"/jobs/{self.SLUG}/enabled", True):
+            memwatch.start()
+        super().__init__(
+            scheduler=scheduler,
+            trigger="interval",
+            minutes=config.get(f"/jobs/{self.SLUG}/minutes", 15),
+            **kwargs,
+        )
+
+    def run_job(self):
+        try:
+            memwatch.sample()
+        except:
+            logger.critical(msg="内存快照异常.", exc_info=True)
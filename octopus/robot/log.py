@@ -1,10 +1,16 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import threading
+import time
 
 from octopus.robot import constants, config
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 PAGE = 4096
+FORMAT = "%(asctime)s - %(name)s - %(filename)s - %(funcName)s - line %(lineno)s - %(levelname)s - %(message)s"
 
 DEBUG = logging.DEBUG
 INFO = logging.INFO
@@ -44,29 +50,132 @@ def tail(filepath, n=10):
     return res
 
 
-def getLogger(name):
+class JsonFormatter(logging.Formatter):
+    """JSON格式: 每条日志一行"""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "name": record.name,
+            "file": record.filename,
+            "func": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _QueueHandler(QueueHandler):
     """
-    作用同标准模块 logging.getLogger(name)
-
-    :returns: logger
+    只在调用线程合并消息参数, 格式化和写入在日志线程
+    根日志的唯一handler: 不复制record, 不加锁(SimpleQueue线程安全)
     """
-    format = "%(asctime)s - %(name)s - %(filename)s - %(funcName)s - line %(lineno)s - %(levelname)s - %(message)s"
-    log_level = config.get("/log/level", "INFO")
-    formatter = logging.Formatter(format)
-    logging.basicConfig(format=format)
-    logger = logging.getLogger(name)
-    logger.setLevel(log_level)
 
-    # FileHandler
-    file_handler = RotatingFileHandler(
-        filename=os.path.join(constants.LOG_PATH, "octopus.log"),
+    def handle(self, record):
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = _formatter.formatException(record.exc_info)
+                record.exc_info = None
+            self.queue.put_nowait(record)
+        except Exception:
+            # 与 QueueHandler.emit 一致: 消息参数有误时报告, 不影响调用方
+            self.handleError(record)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """DEBUG日志限流: 每秒最多rate条, 丢弃的条数附加在下一条日志"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.tokens = rate
+        self.last = time.monotonic()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno > DEBUG:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            self.dropped += 1
+            return False
+        self.tokens -= 1
+        if self.dropped:
+            record.msg = f"{record.msg} (限流丢弃 {self.dropped} 条)"
+            self.dropped = 0
+        return True
+
+
+_lock = threading.Lock()
+_listener = None
+_formatter = logging.Formatter(FORMAT)
+
+
+def _file_handler(filename: str) -> logging.Handler:
+    handler = RotatingFileHandler(
+        filename=os.path.join(constants.LOG_PATH, filename),
         maxBytes=10 * 1024 * 1024,
         backupCount=5,
     )
-    file_handler.setLevel(level=logging.NOTSET)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    handler.setFormatter(_formatter)
+    return handler
+
+
+def _setup():
+    """
+    所有日志经队列由一个线程写入(控制台和 octopus.log)
+    """
+    global _listener, _formatter
+    with _lock:
+        if _listener:
+            return
+        if config.get("/log/format", "text") == "json":
+            _formatter = JsonFormatter()
+        console = logging.StreamHandler()
+        console.setFormatter(_formatter)
+        _listener = QueueListener(
+            queue.SimpleQueue(),
+            console,
+            _file_handler("octopus.log"),
+            respect_handler_level=True,
+        )
+        root = logging.getLogger()
+        root.addHandler(_QueueHandler(_listener.queue))
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def use_file(filename: str):
+    """日志改写到其他文件(如web工作进程)"""
+    _setup()
+    old = _listener.handlers
+    _listener.handlers = (old[0], _file_handler(filename))
+    old[1].close()
 
+
+def getLogger(name):
+    """
+    作用同标准模块 logging.getLogger(name)
+
+    :returns: logger
+    """
+    _setup()
+    logger = logging.getLogger(name)
+    logger.setLevel(config.get("/log/level", "INFO"))
+    rate = (config.get("/log/rate_limit", {}) or {}).get(name)
+    if rate and not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter(rate=rate))
     return logger
 
 
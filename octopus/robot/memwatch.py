@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+内存增长追踪
+
+定期记录: 进程RSS、关键类的对象数量、关键结构的长度(probe)、tracemalloc分配最多的位置
+快照保存在环形缓冲中, 与最早的快照对比得到增长报告
+"""
+import gc
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from octopus.robot import config, log
+from octopus.robot.compt import CircularQueue
+
+logger = log.getLogger(__name__)
+
+SLUG = "memory_watch"
+
+
+def rss_bytes() -> int:
+    """当前RSS(非Linux时为峰值RSS)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryWatch:
+    """内存快照和增长报告"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshots = CircularQueue(size=config.get(f"/jobs/{SLUG}/size", 96))
+        self.types = set(config.get(f"/jobs/{SLUG}/types", []))
+        self.top = config.get(f"/jobs/{SLUG}/top", 10)
+        self.threshold = config.get(f"/jobs/{SLUG}/threshold", 50)  # MB
+        self.frames = config.get(f"/jobs/{SLUG}/tracemalloc", 0)
+        self.probes: Dict[str, Callable] = dict()
+        self.baseline: Optional[tracemalloc.Snapshot] = None  # 最早的tracemalloc快照
+        self.latest: Optional[tracemalloc.Snapshot] = None
+        self.warned_rss = 0
+
+    def start(self):
+        """开启tracemalloc(有额外的内存和性能开销)"""
+        if self.frames and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            logger.info("开启tracemalloc: frames=%s", self.frames)
+
+    def register(self, name: str, probe: Callable):
+        """注册关键结构, probe返回其长度"""
+        self.probes[name] = probe
+
+    def sample(self) -> dict:
+        """记录一次快照, 超过阈值时记录增长的位置"""
+        with self.lock:
+            start = time.perf_counter()
+            snapshot = {
+                "time": time.time(),
+                "rss": rss_bytes(),
+                "objects": self._count_objects(),
+                "probes": self._run_probes(),
+            }
+            if tracemalloc.is_tracing():
+                current = tracemalloc.take_snapshot().filter_traces(
+                    (tracemalloc.Filter(False, tracemalloc.__file__),)
+                )
+                self.baseline = self.baseline or current
+                self.latest = current
+                snapshot["traced"] = tracemalloc.get_traced_memory()[0]
+                snapshot["top"] = [
+                    _format_stat(stat)
+                    for stat in current.statistics("lineno")[: self.top]
+                ]
+            snapshot["cost_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            self.snapshots.enqueue(snapshot)
+        self._check(snapshot)
+        return snapshot
+
+    def report(self) -> dict:
+        """与最早的快照对比: RSS、对象数量、结构长度和分配位置的增长"""
+        with self.lock:
+            snapshots = self.snapshots.all()
+            if not snapshots:
+                return {"snapshots": 0}
+            first, last = snapshots[0], snapshots[-1]
+            hours = max(last["time"] - first["time"], 1) / 3600
+            report = {
+                "snapshots": len(snapshots),
+                "since": first["time"],
+                "rss": last["rss"],
+                "rss_growth": last["rss"] - first["rss"],
+                "rss_growth_per_hour": round((last["rss"] - first["rss"]) / hours),
+                "objects": _diff(first["objects"], last["objects"]),
+                "probes": _diff(first["probes"], last["probes"]),
+                "history": [
+                    {"time": s["time"], "rss": s["rss"], "cost_ms": s["cost_ms"]}
+                    for s in snapshots
+                ],
+            }
+            if self.baseline and self.latest:
+                report["growing"] = self._growing()
+        return report
+
+    def _check(self, snapshot: dict):
+        """RSS比最早的快照增长超过阈值时, 记录增长的位置(每增长一个阈值记录一次)"""
+        if self.threshold <= 0:
+            return
+        first = self.snapshots.all()[0]
+        growth = snapshot["rss"] - first["rss"]
+        if growth < self.threshold * 1024 * 1024 * (self.warned_rss + 1):
+            return
+        self.warned_rss = growth // (self.threshold * 1024 * 1024)
+        report = self.report()
+        logger.warning(
+            "内存增长: %.1fMB, 对象: %s, 结构: %s",
+            growth / 1024 / 1024,
+            {k: v for k, v in report["objects"].items() if v["growth"] > 0},
+            {k: v for k, v in report["probes"].items() if v["growth"] > 0},
+        )
+        for site in report.get("growing", []):
+            logger.warning("内存增长位置: %s", site)
+
+    def _growing(self) -> list:
+        stats = self.latest.compare_to(self.baseline, "lineno")
+        return [_format_stat(stat) for stat in stats[: self.top] if stat.size_diff > 0]
+
+    def _count_objects(self) -> dict:
+        if not self.types:
+            return {}
+        counts = Counter()
+        for obj in gc.get_objects():
+            name = type(obj).__name__
+            if name in self.types:
+                counts[name] += 1
+        return {name: counts.get(name, 0) for name in self.types}
+
+    def _run_probes(self) -> dict:
+        values = {}
+        for name, probe in list(self.probes.items()):
+            try:
+                values[name] = probe()
+            except Exception:
+                values[name] = None
+        return values
+
+
+def _diff(first: dict, last: dict) -> dict:
+    result = {}
+    for name, value in last.items():
+        old = first.get(name)
+        growth = value - old if value is not None and old is not None else 0
+        result[name] = {"value": value, "growth": growth}
+    return result
+
+
+def _format_stat(stat) -> dict:
+    frame = stat.traceback[0]
+    result = {
+        "site": f"{frame.filename}:{frame.lineno}",
+        "size": stat.size,
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        result.update(size_diff=stat.size_diff, count_diff=stat.count_diff)
+    return result
+
+
+memwatch = MemoryWatch()
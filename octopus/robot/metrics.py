@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标: 计数器(Counter)、仪表(Gauge)、固定分桶直方图(Histogram)
+输出 Prometheus 文本格式
+
+计数器和直方图按线程分别累计(每个线程只写自己的单元, 无锁), 采集时汇总
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+# 默认分桶(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Cells:
+    """按线程分配的累计单元"""
+
+    PRUNE_MIN = 16
+
+    def __init__(self, size: int):
+        self.size = size
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.cells = []  # (thread, cell)
+        self.retired = [0] * size  # 已结束线程的累计值
+        self.prune_at = self.PRUNE_MIN  # 单元数达到该值时合并已结束的线程
+
+    def cell(self) -> list:
+        try:
+            return self.local.cell
+        except AttributeError:
+            cell = [0] * self.size
+            self.local.cell = cell
+            with self.lock:
+                self.cells.append((threading.current_thread(), cell))
+                # 短生命周期的线程很多, 没有采集时也要定期合并(均摊)
+                if len(self.cells) >= self.prune_at:
+                    self._prune()
+                    self.prune_at = max(self.PRUNE_MIN, len(self.cells) * 2)
+            return cell
+
+    def sum(self) -> list:
+        with self.lock:
+            self._prune()
+            total = list(self.retired)
+            for _, cell in self.cells:
+                total = [a + b for a, b in zip(total, cell)]
+        return total
+
+    def _prune(self):
+        """已结束线程的单元合并到 retired(需持有锁)"""
+        alive = []
+        for thread, cell in self.cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+            else:
+                self.retired = [a + b for a, b in zip(self.retired, cell)]
+        self.cells = alive
+
+
+class Metric:
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[tuple, "Metric"] = {}
+        self.lock = threading.Lock()
+        self.labelvalues = ()
+
+    def labels(self, *values, **kwargs):
+        """带标签的子指标"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    child.labelvalues = key
+                    self.children[key] = child
+        return child
+
+    def collect(self) -> list:
+        """返回: [(后缀, 标签, 值)]"""
+        if not self.labelnames:
+            return self._samples(labels={})
+        samples = []
+        for key, child in list(self.children.items()):
+            samples.extend(child._samples(labels=dict(zip(self.labelnames, key))))
+        return samples
+
+    def _new_child(self):
+        return type(self)(self.name, self.documentation)
+
+    def _samples(self, labels: dict) -> list:
+        return []
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.cells = _Cells(1)
+
+    def inc(self, value=1):
+        self.cells.cell()[0] += value
+
+    def _samples(self, labels: dict) -> list:
+        return [("_total", labels, self.cells.sum()[0])]
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0
+        self.func: Optional[Callable] = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, value=1):
+        with self.lock:
+            self.value += value
+
+    def dec(self, value=1):
+        self.inc(-value)
+
+    def set_function(self, func: Callable):
+        """采集时调用func获取当前值"""
+        self.func = func
+        return self
+
+    def _samples(self, labels: dict) -> list:
+        value = self.value
+        if self.func:
+            try:
+                value = self.func()
+            except Exception:
+                value = float("nan")
+        return [("", labels, value)]
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple = (),
+        buckets: Tuple = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 各分桶计数 + sum + count
+        self.cells = _Cells(len(self.buckets) + 3)
+
+    def observe(self, value: float):
+        cell = self.cells.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def _samples(self, labels: dict) -> list:
+        total = self.cells.sum()
+        samples = []
+        acc = 0
+        for bound, count in zip(self.buckets, total):
+            acc += count
+            samples.append(("_bucket", dict(labels, le=_format(bound)), acc))
+        samples.append(("_bucket", dict(labels, le="+Inf"), total[-1]))
+        samples.append(("_sum", labels, total[-2]))
+        samples.append(("_count", labels, total[-1]))
+        return samples
+
+
+class Registry:
+    """指标注册表: 同名指标只创建一次"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def register(self, cls, name: str, documentation: str, **kwargs) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, **kwargs)
+                self.metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"指标类型冲突: {name}")
+            return metric
+
+    def exposition(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.TYPE}")
+            for suffix, labels, value in metric.collect():
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Tuple = ()) -> Counter:
+    return registry.register(Counter, name, documentation, labelnames=labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: Tuple = ()) -> Gauge:
+    return registry.register(Gauge, name, documentation, labelnames=labelnames)
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Tuple = (),
+    buckets: Tuple = DEFAULT_BUCKETS,
+) -> Histogram:
+    return registry.register(
+        Histogram, name, documentation, labelnames=labelnames, buckets=buckets
+    )
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if value in (float("inf"), float("-inf")):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            k, str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+        )
+        for k, v in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+if __name__ == "__main__":
+    # 单次记录的耗时
+    import timeit
+
+    n = 1000000
+    c = Counter("bench_counter", "bench")
+    lc = Counter("bench_labeled", "bench", labelnames=("engine",))
+    h = Histogram("bench_histogram", "bench")
+    child = lc.labels("edge-tts")
+    for title, stmt in (
+        ("Counter.inc", c.inc),
+        ("Counter.labels().inc", lambda: lc.labels("edge-tts").inc()),
+        ("Counter(labeled child).inc", child.inc),
+        ("Histogram.observe", lambda: h.observe(0.2)),
+    ):
+        cost = timeit.timeit(stmt, number=n) / n
+        print(f"{title:32s} {cost * 1e6:.3f} us")
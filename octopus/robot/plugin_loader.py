@@ -1,13 +1,31 @@
 # -*- coding: utf-8 -*-
+"""
+技能插件加载
+
+插件清单(模块路径、SLUG、优先级、关键词、文件签名)缓存在数据目录, 文件未变化的插件不再导入,
+插件在第一次匹配时才导入并实例化
+"""
+import json
+import os
 import pkgutil
+import threading
+import time
+from typing import Optional
+
 from octopus.robot import config, constants, log
 from octopus.robot.sdk.AbstractPlugin import AbstractPlugin
 
 logger = log.getLogger(__name__)
 _has_init = False
 
-# plugins run at query
-_plugins_query = []
+MANIFEST_FILE = "plugins.json"
+MANIFEST_VERSION = 2
+
+_lock = threading.RLock()
+# 模块路径 -> (文件签名, 模块), 文件未变化时复用
+_modules = dict()
+# 插件加载耗时: SLUG -> dict
+_timings = dict()
 
 
 def init_plugins(con):
@@ -16,60 +34,240 @@ def init_plugins(con):
 
     参数：
     con -- 会话模块
+
+    返回: 按优先级排序的插件(延迟加载)
     """
 
     global _has_init
     locations = [constants.PLUGIN_PATH, constants.CONTRIB_PATH, constants.CUSTOM_PATH]
     logger.debug(f"检查插件目录：{locations}")
 
-    global _plugins_query
+    plugins = []
     nameSet = set()
+    for entry in scan(locations):
+        if not entry["plugin"]:
+            logger.debug(f"模块 {entry['name']} 非插件，跳过")
+            continue
+        slug = entry["slug"]
+        # check conflict
+        if slug in nameSet:
+            logger.warning(f"插件 {entry['name']} SLUG({slug}) 重复，跳过")
+            continue
+        nameSet.add(slug)
+
+        # whether a plugin is enabled
+        if config.has(slug) and "enable" in config.get(slug):
+            if not config.get(slug)["enable"]:
+                logger.info(f"插件 {entry['name']} 已被禁用")
+                continue
+
+        logger.info(f"插件 {entry['name']} 加载成功 ")
+        plugins.append(PluginProxy(entry=entry, con=con))
+
+    plugins.sort(key=lambda m: m.PRIORITY, reverse=True)
+    _has_init = True
+    return plugins
+
 
-    for finder, name, ispkg in pkgutil.walk_packages(locations):
+def get_plugins(con):
+    return init_plugins(con)
+
+
+def scan(locations) -> list:
+    """扫描插件目录, 文件未变化的模块使用清单中的记录"""
+    start = time.perf_counter()
+    manifest = _read_manifest()
+    entries, hits = [], 0
+    for finder, name, ispkg in pkgutil.iter_modules(locations):
+        path = os.path.join(finder.path, name)
+        signature = _signature(path=path, ispkg=ispkg)
+        cached = manifest.get(path)
+        if cached and cached["signature"] == signature:
+            entries.append(cached)
+            hits += 1
+            continue
         try:
-            loader = finder.find_module(name)
-            mod = loader.load_module(name)
+            entry = _inspect(finder=finder, name=name, path=path, signature=signature)
         except Exception:
             logger.warning(f"插件 {name} 加载出错，跳过", exc_info=True)
             continue
+        entries.append(entry)
+    if hits != len(entries) or len(manifest) != len(entries):
+        _write_manifest(entries)
+    logger.info(
+        "扫描插件: %d 个模块, 清单命中 %d, %.0fms",
+        len(entries),
+        hits,
+        (time.perf_counter() - start) * 1000,
+    )
+    return entries
 
-        if not hasattr(mod, "Plugin"):
-            logger.debug(f"模块 {name} 非插件，跳过")
-            continue
 
-        # plugins run at query
-        plugin = mod.Plugin(con)
+def report() -> list:
+    """插件加载耗时(毫秒)"""
+    with _lock:
+        return sorted(
+            (dict(slug=slug, **timing) for slug, timing in _timings.items()),
+            key=lambda t: -(t.get("import_ms") or 0) - (t.get("init_ms") or 0),
+        )
+
+
+class PluginProxy:
+    """插件代理: SLUG/优先级来自清单, 访问其它属性时才导入并实例化插件"""
+
+    def __init__(self, entry: dict, con):
+        self.entry = entry
+        self.con = con
+        self.SLUG = entry["slug"]
+        self.PRIORITY = entry["priority"]
+        self.IS_IMMERSIVE = entry["immersive"]
+        self.KEYWORDS = tuple(entry["keywords"])
+        self.failed = False  # 导入或实例化出错, 不再重试
+        self._plugin = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._plugin is not None
 
+    def get_plugin(self) -> Optional[AbstractPlugin]:
+        """导入并实例化插件, 出错时返回 None"""
+        if self._plugin is None and not self.failed:
+            with _lock:
+                if self._plugin is None and not self.failed:
+                    try:
+                        self._plugin = self._load()
+                    except Exception:
+                        self.failed = True
+                        logger.warning(
+                            f"插件 {self.entry['name']} 加载出错，跳过", exc_info=True
+                        )
+        return self._plugin
+
+    def __getattr__(self, name):
+        # 只有实例上不存在的属性才会到这里
+        if name.startswith("__") or name in ("_plugin", "entry", "con", "failed"):
+            raise AttributeError(name)
+        plugin = self.get_plugin()
+        if plugin is None:
+            raise AttributeError(f"插件 {self.SLUG} 加载失败: {name}")
+        return getattr(plugin, name)
+
+    def _load(self) -> AbstractPlugin:
+        entry = self.entry
+        start = time.perf_counter()
+        mod = _import(entry)
+        imported = time.perf_counter()
+        plugin = mod.Plugin(self.con)
         if plugin.SLUG == "AbstractPlugin":
-            plugin.SLUG = name
+            plugin.SLUG = entry["name"]
+        end = time.perf_counter()
+        _timings[self.SLUG] = dict(
+            module=entry["name"],
+            path=entry["path"],
+            import_ms=round((imported - start) * 1000, 1),
+            init_ms=round((end - imported) * 1000, 1),
+            time=time.time(),
+        )
+        logger.info(
+            "插件 %s 实例化, 导入 %.0fms, 初始化 %.0fms",
+            self.SLUG,
+            (imported - start) * 1000,
+            (end - imported) * 1000,
+        )
+        return plugin
 
-        # check conflict
-        if plugin.SLUG in nameSet:
-            logger.warning(f"插件 {name} SLUG({plugin.SLUG}) 重复，跳过")
-            continue
-        nameSet.add(plugin.SLUG)
+    def __repr__(self):
+        return f"<PluginProxy {self.SLUG} loaded={self.loaded} failed={self.failed}>"
 
-        # whether a plugin is enabled
-        if config.has(plugin.SLUG) and "enable" in config.get(plugin.SLUG):
-            if not config.get(plugin.SLUG)["enable"]:
-                logger.info(f"插件 {name} 已被禁用")
-                continue
 
-        if issubclass(mod.Plugin, AbstractPlugin):
-            logger.info(f"插件 {name} 加载成功 ")
-            _plugins_query.append(plugin)
+def _import(entry: dict):
+    """导入模块, 文件未变化时复用已导入的模块"""
+    path, signature = entry["path"], entry["signature"]
+    with _lock:
+        cached = _modules.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        finder = pkgutil.get_importer(os.path.dirname(path))
+        loader = finder.find_module(entry["name"])
+        mod = loader.load_module(entry["name"])
+        _modules[path] = (signature, mod)
+        return mod
 
-    def sort_priority(m):
-        if hasattr(m, "PRIORITY"):
-            return m.PRIORITY
-        return 0
 
-    _plugins_query.sort(key=sort_priority, reverse=True)
-    _has_init = True
+def _inspect(finder, name: str, path: str, signature: list) -> dict:
+    """导入模块, 记录插件信息"""
+    start = time.perf_counter()
+    with _lock:
+        loader = finder.find_module(name)
+        mod = loader.load_module(name)
+        _modules[path] = (signature, mod)
+    entry = dict(
+        name=name,
+        path=path,
+        signature=signature,
+        plugin=False,
+        slug=name,
+        priority=0,
+        immersive=False,
+        keywords=[],
+    )
+    cls = getattr(mod, "Plugin", None)
+    if isinstance(cls, type) and issubclass(cls, AbstractPlugin):
+        slug = cls.SLUG
+        entry.update(
+            plugin=True,
+            slug=name if slug == "AbstractPlugin" else slug,
+            priority=getattr(cls, "PRIORITY", 0),
+            immersive=bool(cls.IS_IMMERSIVE),
+            keywords=list(getattr(cls, "KEYWORDS", None) or ()),
+        )
+    logger.debug("检查插件模块 %s, %.0fms", name, (time.perf_counter() - start) * 1000)
+    return entry
 
 
-def get_plugins(con):
-    global _plugins_query
-    _plugins_query = []
-    init_plugins(con)
-    return _plugins_query
+def _signature(path: str, ispkg: bool) -> list:
+    """文件签名: [最后修改时间, 大小], 包取其中所有py文件"""
+    if not ispkg:
+        path = path + ".py"
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return [0, 0]
+        return [stat.st_mtime_ns, stat.st_size]
+    mtime, size = 0, 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d != "__pycache__"]
+        for file in files:
+            if file.endswith(".py"):
+                stat = os.stat(os.path.join(root, file))
+                mtime = max(mtime, stat.st_mtime_ns)
+                size += stat.st_size
+    return [mtime, size]
+
+
+def _read_manifest() -> dict:
+    """模块路径 -> 记录"""
+    try:
+        with open(constants.getData(MANIFEST_FILE), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        logger.warning("插件清单读取失败, 重新扫描", exc_info=True)
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return {entry["path"]: entry for entry in data.get("plugins", [])}
+
+
+def _write_manifest(entries: list):
+    path = constants.getData(MANIFEST_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                dict(version=MANIFEST_VERSION, plugins=entries), f, ensure_ascii=False
+            )
+        os.replace(tmp, path)
+    except Exception:
+        logger.warning("插件清单保存失败", exc_info=True)
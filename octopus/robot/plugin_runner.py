@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+技能插件执行: 插件在有界线程池中执行, 不阻塞对话
+
+- 时间预算内完成: 与直接调用一致, 返回 handle 的结果
+- 超过预算: 播报提示, 插件在后台继续执行, 本轮对话结束
+- 超过超时时间或被打断: 设置本次执行的取消标记(插件自行检查 is_cancelled),
+  同一插件的多次执行互不影响
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Callable, Dict
+
+from octopus.robot import config, log, metrics
+from octopus.robot.sdk.AbstractPlugin import bind_cancelled
+
+logger = log.getLogger(__name__)
+
+
+class PluginBusy(Exception):
+    """执行线程已满"""
+
+
+m_handle = metrics.histogram(
+    "octopus_plugin_handle_seconds", "技能处理耗时", labelnames=("plugin",)
+)
+m_outcome = metrics.counter(
+    "octopus_plugin_runs",
+    "技能处理次数(result: ok/error/slow/timeout/cancelled/busy)",
+    labelnames=("plugin", "result"),
+)
+
+
+class PluginStats:
+    """插件处理耗时统计"""
+
+    def __init__(self, size: int = 100):
+        self.count = 0
+        self.results: Dict[str, int] = dict()
+        self.durations = deque(maxlen=size)  # 最近的耗时(秒)
+
+    def record(self, result: str, duration: float = None):
+        self.results[result] = self.results.get(result, 0) + 1
+        if duration is not None:
+            self.count += 1
+            self.durations.append(duration)
+
+    def dict(self) -> dict:
+        durations = sorted(self.durations)
+
+        def percentile(p):
+            if not durations:
+                return None
+            index = min(len(durations) - 1, int(len(durations) * p))
+            return round(durations[index] * 1000, 1)
+
+        return dict(
+            count=self.count,
+            results=dict(self.results),
+            p50_ms=percentile(0.5),
+            p95_ms=percentile(0.95),
+            max_ms=round(durations[-1] * 1000, 1) if durations else None,
+        )
+
+
+class PluginRunner:
+    def __init__(self, on_error: Callable = None, on_slow: Callable = None):
+        """
+        :param on_error: 插件出错时回调 on_error(plugin, exception)
+        :param on_slow: 超过时间预算时回调 on_slow(plugin), 用于播报提示
+        """
+        self.workers = config.get("/plugin_executor/workers", 4)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="plugin"
+        )
+        self.slots = threading.BoundedSemaphore(self.workers)
+        self.on_error = on_error
+        self.on_slow = on_slow
+        self.lock = threading.Lock()
+        # 执行编号 -> (执行中的插件, 取消标记)
+        self.running: Dict[int, tuple] = dict()
+        self.run_ids = itertools.count()
+        self.stats: Dict[str, PluginStats] = dict()
+
+    def budget(self, plugin) -> float:
+        return config.get(
+            f"/{plugin.SLUG}/budget", config.get("/plugin_executor/budget", 3)
+        )
+
+    def timeout(self, plugin) -> float:
+        return config.get(
+            f"/{plugin.SLUG}/timeout", config.get("/plugin_executor/timeout", 60)
+        )
+
+    def run(self, plugin, text, parsed) -> bool:
+        """
+        执行插件, 最多等待插件的时间预算
+
+        :returns: handle 的返回值(是否继续匹配其它插件), 超过预算时为 False
+        """
+        if not self.slots.acquire(blocking=False):
+            logger.warning("技能执行线程已满, 跳过: %s", plugin.SLUG)
+            self._record(plugin, "busy")
+            raise PluginBusy(plugin.SLUG)
+        start = time.perf_counter()
+        run_id = next(self.run_ids)
+        cancelled = threading.Event()
+        with self.lock:
+            self.running[run_id] = (plugin, cancelled)
+        future = self.executor.submit(
+            self._handle, plugin, text, parsed, start, run_id, cancelled
+        )
+        try:
+            return future.result(timeout=self.budget(plugin))
+        except TimeoutError:
+            pass
+        logger.info("技能 %s 超过时间预算, 转入后台执行", plugin.SLUG)
+        self._record(plugin, "slow")
+        if self.on_slow:
+            self.on_slow(plugin)
+        # 超时取消
+        timer = threading.Timer(
+            max(0, self.timeout(plugin) - (time.perf_counter() - start)),
+            self._expire,
+            args=(plugin, future, cancelled),
+        )
+        timer.daemon = True
+        timer.start()
+        future.add_done_callback(lambda f: timer.cancel())
+        return False
+
+    def cancel(self):
+        """打断: 取消执行中的插件"""
+        with self.lock:
+            runs = list(self.running.values())
+        for plugin, cancelled in runs:
+            logger.info("取消技能: %s", plugin.SLUG)
+            cancelled.set()
+
+    @property
+    def busy(self) -> bool:
+        """是否有执行中的插件(包括转入后台执行的)"""
+        with self.lock:
+            return bool(self.running)
+
+    def report(self) -> dict:
+        with self.lock:
+            return {slug: stats.dict() for slug, stats in self.stats.items()}
+
+    def shutdown(self):
+        """不再接收新的任务, 执行中的插件继续执行"""
+        self.executor.shutdown(wait=False)
+
+    def _handle(self, plugin, text, parsed, start, run_id, cancelled):
+        bind_cancelled(cancelled)
+        try:
+            result = plugin.handle(text, parsed)
+            duration = time.perf_counter() - start
+            self._record(plugin, "cancelled" if cancelled.is_set() else "ok", duration)
+            return result
+        except Exception as e:
+            self._record(plugin, "error", time.perf_counter() - start)
+            if self.on_error:
+                self.on_error(plugin, e)
+            return False
+        finally:
+            bind_cancelled(None)
+            with self.lock:
+                self.running.pop(run_id, None)
+            self.slots.release()
+
+    def _expire(self, plugin, future, cancelled):
+        if future.done():
+            return
+        logger.warning("技能 %s 执行超时, 取消", plugin.SLUG)
+        self._record(plugin, "timeout")
+        cancelled.set()
+
+    def _record(self, plugin, result: str, duration: float = None):
+        m_outcome.labels(plugin.SLUG, result).inc()
+        if duration is not None:
+            m_handle.labels(plugin.SLUG).observe(duration)
+        with self.lock:
+            stats = self.stats.get(plugin.SLUG)
+            if stats is None:
+                stats = self.stats[plugin.SLUG] = PluginStats()
+            stats.record(result, duration)
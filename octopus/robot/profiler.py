@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+采样分析和线程栈快照
+
+采样: 按固定频率读取所有线程的栈(sys._current_frames), 汇总为折叠栈格式
+(collapsed stack, 每行 "角色;帧;帧... 次数"), 可直接用 flamegraph.pl / speedscope 打开
+"""
+import collections
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from octopus.robot import config, log
+from octopus.robot.compt import ThreadManager
+
+logger = log.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """采样分析: 同一时刻只运行一次采样"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = False
+        self.stacks = collections.Counter()  # (角色, 帧...) -> 次数
+        self.frame_names = dict()  # (code, lineno) -> 帧名
+        self.info = dict()
+        self.result = ""  # 最近一次采样的折叠栈
+
+    def start(self, rate: int = None, seconds: float = None) -> dict:
+        """
+        开始采样(后台线程)
+        :param rate: 采样频率(次/秒)
+        :param seconds: 采样时长(秒)
+        """
+        rate = min(int(rate or config.get("/profiler/rate", 100)), 1000)
+        seconds = min(
+            float(seconds or config.get("/profiler/seconds", 10)),
+            config.get("/profiler/max_seconds", 120),
+        )
+        with self.lock:
+            if self.running:
+                raise RuntimeError("采样进行中")
+            self.running = True
+            self.stacks = collections.Counter()
+            self.info = {"rate": rate, "seconds": seconds, "start": time.time()}
+        ThreadManager.new(
+            target=self._run, kwargs=dict(rate=rate, seconds=seconds), role="profiler"
+        ).start()
+        logger.info("开始采样: rate=%s, seconds=%s", rate, seconds)
+        return self.status()
+
+    def status(self) -> dict:
+        return dict(self.info, running=self.running)
+
+    def collapsed(self) -> Optional[str]:
+        """最近一次采样的折叠栈(采样进行中返回None)"""
+        if self.running:
+            return None
+        return self.result
+
+    def _run(self, rate: int, seconds: float):
+        interval = 1.0 / rate
+        me = threading.get_ident()
+        samples = 0
+        cost = 0.0
+        start = time.perf_counter()
+        deadline = start + seconds
+        next_time = start
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                self._sample(me)
+                cost += time.perf_counter() - now
+                samples += 1
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_time = time.perf_counter()  # 跟不上时不追赶
+        except Exception:
+            logger.error("采样失败", exc_info=True)
+        finally:
+            self.result = self._format()
+            self.info.update(
+                samples=samples,
+                elapsed=round(time.perf_counter() - start, 3),
+                sample_us=round(cost / samples * 1e6, 1) if samples else 0,
+            )
+            self.running = False
+            logger.info("采样结束: %s", self.info)
+
+    def _sample(self, me: int):
+        roles = {t.ident: ThreadManager.role(t) for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            stack.append(roles.get(ident, str(ident)))
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+
+    def _frame_name(self, frame) -> str:
+        key = (frame.f_code, frame.f_lineno)
+        name = self.frame_names.get(key)
+        if name is None:
+            code = frame.f_code
+            name = "{} ({}:{})".format(
+                code.co_name, os.path.basename(code.co_filename), frame.f_lineno
+            )
+            self.frame_names[key] = name
+        return name
+
+    def _format(self) -> str:
+        return "".join(
+            "{} {}\n".format(";".join(f.replace(";", ":") for f in stack), count)
+            for stack, count in self.stacks.most_common()
+        )
+
+    @staticmethod
+    def thread_dump() -> list:
+        """所有线程的当前栈, 按ThreadManager角色标记"""
+        frames = sys._current_frames()
+        threads = []
+        for t in threading.enumerate():
+            frame = frames.get(t.ident)
+            stack = []
+            while frame is not None:
+                stack.append(
+                    "{}:{} {}".format(
+                        frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name
+                    )
+                )
+                frame = frame.f_back
+            stack.reverse()
+            threads.append(
+                {
+                    "name": t.name,
+                    "ident": t.ident,
+                    "role": ThreadManager.role(t),
+                    "daemon": t.daemon,
+                    "managed": hasattr(t, "role"),
+                    "stack": stack,
+                }
+            )
+        return threads
+
+
+profiler = SamplingProfiler()
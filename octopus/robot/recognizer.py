@@ -7,6 +7,7 @@ from octopus.robot import config, log, utils, RTAsr
 from octopus.robot.Sender import ACTION_USER_SPEAK
 from octopus.robot.compt import ThreadManager, Robot
 from octopus.robot.enums import AssistantEvent
+from octopus.robot.tracer import tracer
 
 logger = log.getLogger(__name__)
 
@@ -62,6 +63,12 @@ class RealTimeRecognizer(AbstractRecongnizer):
         self.detect_end = True  # False-关键字并且online状态;True-关键字并且offline
         self.listen_data = list()  # 聆听内容
         self.query_data = list()  # 查询内容
+        self._load_config()
+        config.subscribe("/realtime", lambda new, old: self._load_config())
+        self.asr.add_handler(self._on_message)
+
+    def _load_config(self):
+        """识别参数(/realtime 变更后重新读取)"""
         self.keywords = dict(
             (kw, len(kw))
             for kw in config.get(item="/realtime/keywords", default=["你好", "小惠"])
@@ -70,7 +77,6 @@ class RealTimeRecognizer(AbstractRecongnizer):
         self.silent_threshold = config.get("/realtime/silent_threshold", 3)
         self.recording_threshold = config.get("/realtime/recording_timeout", 50)
         self.interval_time = config.get("/realtime/interval_time", 200) / 1000
-        self.asr.add_handler(self._on_message)
 
     def start(self):
         self.running.set()
@@ -98,7 +104,10 @@ class RealTimeRecognizer(AbstractRecongnizer):
 
     def recognize(self, **kwargs):
         self.recognizing.set()
-        # 开始聆听
+        # 开始识别(另起线程, 不阻塞状态机)
+        ThreadManager.new(target=self._run_recognize).start()
+
+    def _run_recognize(self):
         while self.recognizing.is_set():
             data = self.bot.get_audio_data(timeout=1)
             if data and self.asr.is_ok():
@@ -171,12 +180,14 @@ class RealTimeRecognizer(AbstractRecongnizer):
 
     def _on_listened(self, clear_data: bool = False):
         self.listening.clear()
+        tracer.mark("endpoint")
         self.bot.action(event=AssistantEvent.LISTENED)
         if clear_data:
             self.listen_data.clear()
 
     def _on_queried(self, clear_data: bool = False):
         self.recognizing.clear()
+        tracer.mark("recognized")
         query = "".join(self.query_data)
         self.bot.action(event=AssistantEvent.RECOGNIZED, query=query)
         if clear_data:
@@ -205,6 +216,7 @@ class RealTimeRecognizer(AbstractRecongnizer):
             self.conversation.clear_break_time()
             return
         if not is_amend:  # 聆听内容
+            tracer.mark("first_partial")
             self.listen_data.append(text)
             self.sender.put_message(
                 action=ACTION_USER_SPEAK,
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+引擎注册表: slug -> "模块:类"
+
+按 slug 导入引擎所在的模块, 引擎依赖的第三方SDK在引擎实例化时才导入,
+未选用的引擎不增加启动时间
+不在注册表中的 slug(如自定义引擎)回退到遍历子类
+"""
+import importlib
+import threading
+from typing import Dict, Optional
+
+from octopus.robot import log
+
+logger = log.getLogger(__name__)
+
+ENGINES: Dict[str, Dict[str, str]] = {
+    "tts": {
+        "han-tts": "octopus.robot.TTS:HanTTS",
+        "azure-tts": "octopus.robot.TTS:AzureTTS",
+        "baidu-tts": "octopus.robot.TTS:BaiduTTS",
+        "tencent-tts": "octopus.robot.TTS:TencentTTS",
+        "xunfei-tts": "octopus.robot.TTS:XunfeiTTS",
+        "ali-tts": "octopus.robot.TTS:AliTTS",
+        "edge-tts": "octopus.robot.TTS:EdgeTTS",
+        "mac-tts": "octopus.robot.TTS:MacTTS",
+        "VITS": "octopus.robot.TTS:VITS",
+    },
+    "asr": {
+        "azure-asr": "octopus.robot.ASR:AzureASR",
+        "baidu-asr": "octopus.robot.ASR:BaiduASR",
+        "tencent-asr": "octopus.robot.ASR:TencentASR",
+        "xunfei-asr": "octopus.robot.ASR:XunfeiASR",
+        "ali-asr": "octopus.robot.ASR:AliASR",
+        "openai": "octopus.robot.ASR:WhisperASR",
+        "fun-asr": "octopus.robot.ASR:FunASR",
+    },
+    "ai": {
+        "tuling": "octopus.robot.AI:TulingRobot",
+        "unit": "octopus.robot.AI:UnitRobot",
+        "bing": "octopus.robot.AI:BingRobot",
+        "anyq": "octopus.robot.AI:AnyQRobot",
+        "openai": "octopus.robot.AI:OPENAIRobot",
+        "wenxin": "octopus.robot.AI:WenxinRobot",
+        "tongyi": "octopus.robot.AI:TongyiRobot",
+        "fastgpt": "octopus.robot.AI:FastGPTRobot",
+    },
+    "nlu": {
+        "unit": "octopus.robot.NLU:UnitNLU",
+        "local": "octopus.robot.NLU:LocalNLU",
+    },
+    "rtasr": {
+        "funasr": "octopus.robot.RTAsr:FunRTAsr",
+        "volcengine": "octopus.robot.RTAsr:VolcengineRTAsr",
+        "mixed": "octopus.robot.RTAsr:MixedRTAsr",
+    },
+    "dh": {
+        "tencent-dh": "octopus.robot.DigitalHuman:TecentDigitalHuman",
+    },
+}
+
+_classes: Dict[tuple, type] = dict()
+_lock = threading.Lock()
+
+
+def register(kind: str, slug: str, target: str):
+    """注册引擎, target: "模块:类" """
+    ENGINES.setdefault(kind, {})[slug] = target
+    _classes.pop((kind, slug), None)
+
+
+def find(kind: str, slug: str) -> Optional[type]:
+    """按 slug 查找引擎类(首次使用时导入模块), 未注册返回None"""
+    key = (kind, slug)
+    cls = _classes.get(key)
+    if cls is not None:
+        return cls
+    target = ENGINES.get(kind, {}).get(slug)
+    if not target:
+        return None
+    module_name, _, class_name = target.partition(":")
+    with _lock:
+        cls = getattr(importlib.import_module(module_name), class_name)
+        if getattr(cls, "SLUG", None) != slug:
+            logger.warning("引擎注册表与类的SLUG不一致: %s -> %s", slug, target)
+        _classes[key] = cls
+    return cls
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+配置热更新: 对比新旧配置快照, 只重建受影响的组件
+
+组件在后台线程重建, 重建完成后暂存, 由使用方在两轮对话之间调用 apply 整体替换
+"""
+import threading
+from typing import Callable, Dict, List
+
+from octopus.robot import config, log
+from octopus.robot.compt import ThreadManager
+
+logger = log.getLogger(__name__)
+
+
+class Component:
+    """可重建的组件"""
+
+    def __init__(
+        self,
+        name: str,
+        build: Callable,
+        current: Callable,
+        swap: Callable,
+        keys=(),
+    ):
+        """
+        :param build: 创建新组件
+        :param current: 返回当前组件
+        :param swap: 替换为新组件 swap(new, old)
+        :param keys: 依赖的配置项(或返回配置项列表的函数)
+        """
+        self.name = name
+        self.build = build
+        self.current = current
+        self.swap = swap
+        self.keys = keys
+        self.profile = None  # 创建时组件的配置(get_config)
+
+    def get_keys(self) -> list:
+        return list(self.keys() if callable(self.keys) else self.keys)
+
+    def record(self):
+        self.profile = _profile(self.current())
+
+    def changed(self, old: config.Snapshot, new: config.Snapshot) -> bool:
+        for key in self.get_keys():
+            if old.paths.get(key) != new.paths.get(key):
+                return True
+        # 引擎自己的配置段(get_config)
+        return _profile(self.current()) != self.profile
+
+
+class ReloadPlanner:
+    """热更新计划"""
+
+    def __init__(self, on_ready: Callable = None):
+        """
+        :param on_ready: 有组件重建完成时回调(可以立即apply时调用)
+        """
+        self.components: Dict[str, Component] = dict()
+        self.pending: Dict[str, object] = dict()  # 重建完成, 待替换
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.on_ready = on_ready
+
+    def register(self, name: str, build, current, swap, keys=()) -> Component:
+        component = Component(
+            name=name, build=build, current=current, swap=swap, keys=keys
+        )
+        component.record()
+        self.components[name] = component
+        return component
+
+    def plan(self, old: config.Snapshot, new: config.Snapshot) -> List[str]:
+        """需要重建的组件"""
+        names = []
+        for name, component in self.components.items():
+            try:
+                if component.changed(old=old, new=new):
+                    names.append(name)
+            except Exception:
+                logger.warning("配置对比失败: %s", name, exc_info=True)
+        return names
+
+    def reload(self, old: config.Snapshot, new: config.Snapshot) -> List[str]:
+        """对比配置, 在后台重建受影响的组件"""
+        names = self.plan(old=old, new=new)
+        if not names:
+            logger.info("配置变更不影响已加载的组件")
+            return names
+        logger.info("配置变更, 重建组件: %s", names)
+        ThreadManager.new(
+            target=self._build, kwargs=dict(names=names), role="config-reload"
+        ).start()
+        return names
+
+    def apply(self) -> List[str]:
+        """替换重建完成的组件(在两轮对话之间调用)"""
+        if not self.pending:
+            return []
+        with self.lock:
+            pending, self.pending = self.pending, dict()
+        for name, obj in pending.items():
+            component = self.components[name]
+            try:
+                component.swap(obj, component.current())
+                component.record()
+            except Exception:
+                logger.critical("组件替换失败: %s", name, exc_info=True)
+        logger.info("组件已替换: %s", list(pending))
+        return list(pending)
+
+    def _build(self, names: List[str]):
+        with self.build_lock:
+            for name in names:
+                try:
+                    obj = self.components[name].build()
+                except Exception:
+                    logger.critical("组件重建失败, 继续使用原组件: %s", name, exc_info=True)
+                    continue
+                _warm_up(name, obj)
+                with self.lock:
+                    self.pending[name] = obj
+        if self.pending and self.on_ready:
+            self.on_ready()
+
+
+def _warm_up(name, obj):
+    """替换前先预热(建立连接等), 不影响替换"""
+    warm_up = getattr(obj, "warm_up", None)
+    if not callable(warm_up):
+        return
+    try:
+        warm_up()
+    except Exception:
+        logger.warning("组件预热失败: %s", name, exc_info=True)
+
+
+def _profile(obj):
+    get_config = getattr(type(obj), "get_config", None)
+    if get_config is None:
+        return None
+    try:
+        return get_config()
+    except Exception:
+        return None
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+技能路由: 插件加载时建立索引, 只有可能匹配的插件才调用 isValid
+
+- 插件声明的关键词(KEYWORDS)合并为一棵字典树, 一次扫描得到候选插件,
+  声明了关键词但文本中没有出现的插件不调用 isValid(避免无谓的NLU请求)
+- 配置中的自定义匹配规则(/SLUG/patterns)预编译, 尽量合并为一个正则
+"""
+import re
+import time
+from typing import Callable, List
+
+from octopus.robot import log, metrics
+
+logger = log.getLogger(__name__)
+
+m_match = metrics.histogram(
+    "octopus_plugin_match_seconds",
+    "技能匹配耗时",
+    labelnames=("plugin",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+m_skipped = metrics.counter(
+    "octopus_plugin_skipped", "按关键词跳过的技能匹配次数", labelnames=("plugin",)
+)
+
+_END = ""  # 字典树中的结束标记(字符不会是空串)
+
+
+class KeywordTrie:
+    """关键词字典树: 找出文本中出现的关键词对应的值"""
+
+    def __init__(self):
+        self.root = dict()
+
+    def add(self, word: str, value):
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, dict())
+        node.setdefault(_END, set()).add(value)
+
+    def search(self, text: str) -> set:
+        found = set()
+        root = self.root
+        for i in range(len(text)):
+            node = root
+            for char in text[i:]:
+                node = node.get(char)
+                if node is None:
+                    break
+                if _END in node:
+                    found |= node[_END]
+        return found
+
+
+class IntentRouter:
+    """按优先级返回匹配的插件"""
+
+    def __init__(self, plugins: list, get_patterns: Callable):
+        """
+        :param plugins: 按优先级排序的插件
+        :param get_patterns: 插件的自定义匹配规则 get_patterns(plugin)
+        """
+        self.plugins = plugins
+        self.get_patterns = get_patterns
+        self.trie = KeywordTrie()
+        self.gated = set()  # 声明了关键词的插件
+        self.compiled = dict()  # SLUG -> (匹配规则, 正则列表)
+        for plugin in plugins:
+            keywords = getattr(plugin, "KEYWORDS", None)
+            if not keywords:
+                continue
+            self.gated.add(plugin.SLUG)
+            for word in keywords:
+                self.trie.add(word.lower(), plugin.SLUG)
+
+    def route(self, text: str, parsed, immersive: str = None):
+        """
+        依次返回匹配的插件(生成器)
+
+        :param immersive: 当前沉浸模式的插件
+        """
+        hits = self.trie.search(text.lower()) if self.gated else ()
+        for plugin in self.plugins:
+            if getattr(plugin, "failed", False):
+                continue
+            slug = plugin.SLUG
+            start = time.perf_counter()
+            valid = self.is_valid(
+                plugin,
+                text=text,
+                parsed=parsed,
+                keyword=slug not in self.gated or slug in hits,
+                immersive=immersive == slug,
+            )
+            m_match.labels(slug).observe(time.perf_counter() - start)
+            if valid:
+                yield plugin
+
+    def is_valid(self, plugin, text, parsed, keyword=True, immersive=False) -> bool:
+        if self.match(plugin, text):
+            return self.ready(plugin)
+        if not keyword:
+            m_skipped.labels(plugin.SLUG).inc()
+            if not immersive:
+                return False
+        if not self.ready(plugin):
+            return False
+        if keyword and plugin.isValid(text, parsed):
+            return True
+        return immersive and plugin.isValidImmersive(text, parsed)
+
+    @staticmethod
+    def ready(plugin) -> bool:
+        """延迟加载的插件: 导入并实例化, 出错时跳过"""
+        load = getattr(plugin, "get_plugin", None)
+        return load is None or load() is not None
+
+    def match(self, plugin, text) -> bool:
+        """自定义匹配规则"""
+        for regex in self._compile(plugin):
+            if regex.match(text) is not None:
+                return True
+        return False
+
+    def _compile(self, plugin) -> tuple:
+        patterns = self.get_patterns(plugin)
+        cached = self.compiled.get(plugin.SLUG)
+        if cached is not None and (cached[0] is patterns or cached[0] == patterns):
+            return cached[1]
+        valid: List[str] = []
+        for pattern in patterns or ():
+            try:
+                re.compile(pattern)
+            except re.error:
+                logger.warning("技能 %s 的匹配规则有误: %s", plugin.SLUG, pattern)
+                continue
+            valid.append(pattern)
+        try:
+            # 合并为一个正则
+            combined = "|".join(f"(?:{p})" for p in valid)
+            regexes = (re.compile(combined),) if valid else ()
+        except re.error:
+            # 无法合并(如带全局内联标记 (?i) 的规则), 逐个匹配
+            regexes = tuple(re.compile(p) for p in valid)
+        self.compiled[plugin.SLUG] = (patterns, regexes)
+        return regexes
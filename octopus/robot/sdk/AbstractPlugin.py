@@ -1,4 +1,5 @@
 import sys
+import threading
 from octopus.robot import log
 from octopus.robot import constants
 from abc import ABCMeta, abstractmethod
@@ -10,12 +11,23 @@ try:
 except Exception as e:
     logger.error(f"未检测到插件目录, Error: {e}", stack_info=True)
 
+# 当前线程执行的技能的取消标记(每次执行一个, 由 PluginRunner 设置)
+_run = threading.local()
+
+
+def bind_cancelled(event: threading.Event = None):
+    """设置当前线程执行的技能的取消标记, None 表示执行结束"""
+    _run.cancelled = event
+
 
 class AbstractPlugin(metaclass=ABCMeta):
     """技能插件基类"""
 
     SLUG = "AbstractPlugin"
     IS_IMMERSIVE = False
+    # 关键词: isValid 只在文本包含其中之一时才可能返回True,
+    # 声明后不包含关键词的文本不再调用 isValid
+    KEYWORDS = ()
 
     def __init__(self, con):
         if self.IS_IMMERSIVE:
@@ -26,6 +38,27 @@ class AbstractPlugin(metaclass=ABCMeta):
         self.con = con
         self.nlu = self.con.nlu
 
+    @property
+    def cancelled(self) -> threading.Event:
+        """
+        取消标记: 执行超时或被打断时设置
+        由 PluginRunner 执行时是本次执行的标记(只在执行 handle 的线程中可见)
+        """
+        event = getattr(_run, "cancelled", None)
+        if event is not None:
+            return event
+        event = self.__dict__.get("_cancelled")
+        if event is None:
+            event = self.__dict__.setdefault("_cancelled", threading.Event())
+        return event
+
+    def is_cancelled(self) -> bool:
+        """
+        是否已被取消，
+        耗时的处理逻辑(网络请求、循环等)应检查并尽早结束
+        """
+        return self.cancelled.is_set()
+
     @abstractmethod
     def isValid(self, query, parsed):
         """
@@ -118,7 +151,7 @@ class AbstractPlugin(metaclass=ABCMeta):
         return self.con.active_listen(silent)
 
     def clearImmersive(self):
-        self.con.setImmersiveMode(None)
+        self.con.set_immersive_mode(None)
 
     def parse(self, query):
         """
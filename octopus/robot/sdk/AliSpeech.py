@@ -1,14 +1,77 @@
 # -*- coding: UTF-8 -*-
 
+import base64
+import hashlib
+import hmac
 import http.client
+import time
 import urllib.parse
+import uuid
 import json
+
+import requests
+
 from octopus.robot import utils
 from octopus.robot import log
+from octopus.robot.tokens import tokens
 
 logger = log.getLogger(__name__)
 
 
+def _percent_encode(value):
+    # 采用RFC 3986规范进行urlencode编码
+    value = urllib.parse.quote(str(value), safe="~")
+    return value.replace("+", "%20").replace("*", "%2A")
+
+
+def create_token(access_key_id, access_key_secret):
+    """
+    使用 AccessKey 获取访问令牌(POP CreateToken)
+
+    :returns: (令牌, 有效期秒数)
+    """
+    params = {
+        "AccessKeyId": access_key_id,
+        "Action": "CreateToken",
+        "Format": "JSON",
+        "RegionId": "cn-shanghai",
+        "SignatureMethod": "HMAC-SHA1",
+        "SignatureNonce": uuid.uuid4().hex,
+        "SignatureVersion": "1.0",
+        "Timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "Version": "2019-02-28",
+    }
+    query = "&".join(
+        f"{_percent_encode(k)}={_percent_encode(v)}" for k, v in sorted(params.items())
+    )
+    string_to_sign = "GET&%2F&" + _percent_encode(query)
+    digest = hmac.new(
+        (access_key_secret + "&").encode("utf-8"),
+        string_to_sign.encode("utf-8"),
+        hashlib.sha1,
+    ).digest()
+    signature = _percent_encode(base64.b64encode(digest).decode("utf-8"))
+    r = requests.get(
+        f"http://nls-meta.cn-shanghai.aliyuncs.com/?Signature={signature}&{query}",
+        timeout=10,
+    )
+    result = r.json()
+    if "Token" not in result:
+        raise ValueError(f"阿里云令牌获取失败: {result}")
+    token = result["Token"]
+    return token["Id"], token["ExpireTime"] - time.time()
+
+
+def get_token(token, access_key_id=None, access_key_secret=None):
+    """配置了 AccessKey 时使用自动刷新的令牌, 否则使用配置的令牌"""
+    if not (access_key_id and access_key_secret):
+        return token
+    return tokens.get(
+        key=tokens.key("ali-nls", access_key_id, access_key_secret),
+        fetcher=lambda: create_token(access_key_id, access_key_secret),
+    )
+
+
 def processGETRequest(appKey, token, voice, text, format, sampleRate):
     host = "nls-gateway.cn-shanghai.aliyuncs.com"
     url = "https://" + host + "/stream/v1/tts"
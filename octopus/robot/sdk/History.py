@@ -1,6 +1,20 @@
 # -*- coding: utf-8 -*-
 # 用于维护历史消息
+import re
+import sqlite3
+import threading
+from typing import Optional, List, Tuple
+
 import tornado.locks
+from tornado.ioloop import IOLoop
+
+from octopus.robot import config, constants, log
+
+logger = log.getLogger(__name__)
+
+# 将图片/链接处理成HTML
+re_img = re.compile(r"https?://.+\.(?:png|jpg|jpeg|bmp|gif|JPG|PNG|JPEG|BMP|GIF)")
+re_url = re.compile(r"^https?://.+")
 
 
 def Singleton(cls):
@@ -14,29 +28,232 @@ def Singleton(cls):
     return _singleton
 
 
+def render(message: dict) -> dict:
+    """渲染消息(返回副本), 文本中的图片和链接转为HTML"""
+    text = message.get("text") or ""
+    for img in re_img.findall(text):
+        text = text.replace(
+            img,
+            f'<a data-fancybox="images" href="{img}"><img src={img} class="img fancybox"></img></a>',
+        )
+    for url in re_url.findall(text):
+        text = text.replace(url, f'<a href={url} target="_blank">{url}</a>')
+    return dict(message, text=text)
+
+
+class HistoryDB:
+    """
+    历史消息持久化: sqlite, 只追加
+    支持FTS5(trigram分词)时使用全文检索, 否则或关键字少于3个字时使用LIKE
+    """
+
+    def __init__(self, file: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "seq INTEGER PRIMARY KEY, uuid TEXT, type INTEGER, text TEXT, "
+            "plugin TEXT, time TEXT)"
+        )
+        self.fts = True
+        try:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5("
+                "text, content='history', content_rowid='seq', tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            logger.warning("sqlite不支持FTS5, 历史消息使用LIKE检索")
+            self.fts = False
+        self.conn.commit()
+
+    def append(self, seq: int, message: dict):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO history(seq, uuid, type, text, plugin, time) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    seq,
+                    message["uuid"],
+                    message["type"],
+                    message["text"],
+                    message.get("plugin") or "",
+                    message["time"],
+                ),
+            )
+            if self.fts:
+                self.conn.execute(
+                    "INSERT INTO history_fts(rowid, text) VALUES (?, ?)",
+                    (seq, message["text"]),
+                )
+            self.conn.commit()
+
+    def last(self, limit: int) -> List[Tuple[int, dict]]:
+        """最近的消息(按seq升序)"""
+        rows = self._query(
+            "SELECT seq, uuid, type, text, plugin, time FROM history "
+            "ORDER BY seq DESC LIMIT ?",
+            (limit,),
+        )
+        rows.reverse()
+        return rows
+
+    def page(self, offset: int, limit: int, keyword: str = None) -> Tuple[int, list]:
+        """
+        分页查询(按seq倒序)
+        返回: 总数, 消息列表
+        """
+        if not keyword:
+            where, args = "", ()
+        elif self.fts and len(keyword) >= 3:
+            where = (
+                "WHERE seq IN "
+                "(SELECT rowid FROM history_fts WHERE history_fts MATCH ?)"
+            )
+            args = ('"' + keyword.replace('"', '""') + '"',)
+        else:
+            where, args = "WHERE text LIKE ?", (f"%{keyword}%",)
+        with self.lock:
+            total = self.conn.execute(
+                f"SELECT COUNT(*) FROM history {where}", args
+            ).fetchone()[0]
+        rows = self._query(
+            "SELECT seq, uuid, type, text, plugin, time FROM history "
+            f"{where} ORDER BY seq DESC LIMIT ? OFFSET ?",
+            args + (limit, offset),
+        )
+        return total, [message for _, message in rows]
+
+    def max_seq(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT MAX(seq) FROM history").fetchone()[0] or 0
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _query(self, sql: str, args: tuple) -> List[Tuple[int, dict]]:
+        with self.lock:
+            rows = self.conn.execute(sql, args).fetchall()
+        return [
+            (
+                row[0],
+                {
+                    "type": row[2],
+                    "text": row[3],
+                    "time": row[5],
+                    "uuid": row[1],
+                    "plugin": row[4],
+                },
+            )
+            for row in rows
+        ]
+
+
 @Singleton
 class History(object):
+    """
+    历史消息: 环形缓冲 + uuid索引, 按游标(uuid)增量读取
+    消息保存原始文本, 读取时再渲染HTML
+    """
+
     def __init__(self):
         # cond is notified whenever the message cache is updated
         self.cond = tornado.locks.Condition()
-        self.cache = []
-        self.cache_size = 100
+        self.io_loop = None
+        self.cache_size = config.get("/history/cache_size", 100)
+        self.buffer: List[Optional[dict]] = [None] * self.cache_size
+        self.index = {}  # uuid -> seq
+        self.seq = 0  # 最后一条消息的序号
+        self.lock = threading.Lock()
+        self.listeners = []  # 新消息的回调
+        self.db = None
+        if config.get("/history/persist", True):
+            try:
+                self.db = HistoryDB(
+                    file=constants.getData(config.get("/history/db", "history.db"))
+                )
+                self._restore()
+            except sqlite3.Error:
+                logger.critical("历史消息数据库初始化失败", exc_info=True)
+                self.db = None
+
+    @property
+    def cache(self) -> list:
+        """缓存中的消息(已渲染)"""
+        return self.get_messages_since(cursor=None)
 
-    def get_messages_since(self, cursor):
+    def get_messages_since(self, cursor, html=True) -> list:
         """Returns a list of messages newer than the given cursor.
 
         ``cursor`` should be the ``uuid`` of the last message received.
         """
-        results = []
-        for msg in reversed(self.cache):
-            if msg["uuid"] == cursor:
-                break
-            results.append(msg)
-        results.reverse()
-        return results
-
-    def add_message(self, message):
-        self.cache.append(message)
-        if len(self.cache) > self.cache_size:
-            self.cache = self.cache[-self.cache_size :]
-        self.cond.notify_all()
+        with self.lock:
+            first = max(1, self.seq - self.cache_size + 1)
+            start = self.index.get(cursor, first - 1) + 1 if cursor else first
+            messages = [
+                self.buffer[seq % self.cache_size]
+                for seq in range(max(start, first), self.seq + 1)
+            ]
+        if html:
+            return list(map(render, messages))
+        return messages
+
+    def add_message(self, message, persist=True):
+        with self.lock:
+            self.seq += 1
+            seq = self.seq
+            self._put(seq=seq, message=message)
+        for listener in self.listeners:
+            listener(message)
+        if persist and self.db:
+            try:
+                self.db.append(seq=seq, message=message)
+            except sqlite3.Error:
+                logger.error("历史消息保存失败", exc_info=True)
+        # tornado的Condition不是线程安全的, 在IOLoop中通知
+        if self.io_loop:
+            self.io_loop.add_callback(self.cond.notify_all)
+
+    def page(
+        self, page: int, paginate_by: int, keyword: str = None, html=True
+    ) -> Tuple[int, list]:
+        """
+        分页查询(按时间倒序)
+        返回: 总数, 消息列表
+        """
+        offset = (page - 1) * paginate_by
+        if self.db:
+            total, messages = self.db.page(
+                offset=offset, limit=paginate_by, keyword=keyword
+            )
+        else:
+            messages = list(reversed(self.get_messages_since(cursor=None, html=False)))
+            if keyword:
+                messages = [msg for msg in messages if keyword in msg["text"]]
+            total = len(messages)
+            messages = messages[offset : offset + paginate_by]
+        if html:
+            messages = list(map(render, messages))
+        return total, messages
+
+    def wait(self, timeout):
+        """等待新消息(必须在IOLoop线程中调用)"""
+        self.io_loop = IOLoop.current()
+        return self.cond.wait(timeout=timeout)
+
+    def _put(self, seq: int, message: dict):
+        slot = seq % self.cache_size
+        old = self.buffer[slot]
+        if old and self.index.get(old["uuid"]) == seq - self.cache_size:
+            self.index.pop(old["uuid"], None)
+        self.buffer[slot] = message
+        self.index[message["uuid"]] = seq
+
+    def _restore(self):
+        """从数据库恢复最近的消息"""
+        for seq, message in self.db.last(limit=self.cache_size):
+            self._put(seq=seq, message=message)
+        self.seq = self.db.max_seq()
+        logger.debug("恢复历史消息: seq=%s", self.seq)
@@ -1,42 +1,31 @@
 # encoding:utf-8
-import os
 import uuid
 import json
 import requests
-import datetime
 from uuid import getnode as get_mac
-from octopus.robot import constants, log
-from dateutil import parser as dparser
+from octopus.robot import log
+from octopus.robot.tokens import baidu_oauth, tokens
 
 logger = log.getLogger(__name__)
 
+_http = requests.Session()  # 复用连接
+# 令牌无效/过期
+TOKEN_ERRORS = (110, 111)
+
+
+def _token_key(api_key, secret_key):
+    return tokens.key("baidu-unit", api_key, secret_key)
+
 
 def get_token(api_key, secret_key):
-    cache = open(os.path.join(constants.TEMP_PATH, "baidustt.ini"), "a+")
-    try:
-        pms = cache.readlines()
-        if len(pms) > 0:
-            time = pms[0]
-            tk = pms[1]
-            # 计算token是否过期 官方说明一个月，这里保守29天
-            time = dparser.parse(time)
-            endtime = datetime.datetime.now()
-            if (endtime - time).days <= 29:
-                return tk
-    finally:
-        cache.close()
-    URL = "http://openapi.baidu.com/oauth/2.0/token"
-    params = {
-        "grant_type": "client_credentials",
-        "client_id": api_key,
-        "client_secret": secret_key,
-    }
-    r = requests.get(URL, params=params)
+    """UNIT 访问令牌(缓存, 过期前后台刷新)"""
     try:
-        r.raise_for_status()
-        token = r.json()["access_token"]
-        return token
-    except requests.exceptions.HTTPError:
+        return tokens.get(
+            key=_token_key(api_key, secret_key),
+            fetcher=lambda: baidu_oauth(api_key, secret_key),
+        )
+    except Exception:
+        logger.error("UNIT 令牌获取失败", exc_info=True)
         return ""
 
 
@@ -50,11 +39,6 @@ def getUnit(query, service_id, api_key, secret_key):
     :param secret_key: UNIT secret_key
     :returns: UNIT 解析结果。如果解析失败，返回 None
     """
-    access_token = get_token(api_key, secret_key)
-    url = (
-        "https://aip.baidubce.com/rpc/2.0/unit/service/chat?access_token="
-        + access_token
-    )
     request = {"query": query, "user_id": str(get_mac())[:32]}
     body = {
         "log_id": str(uuid.uuid4()),
@@ -63,12 +47,24 @@ def getUnit(query, service_id, api_key, secret_key):
         "session_id": str(uuid.uuid4()),
         "request": request,
     }
-    try:
-        headers = {"Content-Type": "application/json"}
-        request = requests.post(url, json=body, headers=headers)
-        return json.loads(request.text)
-    except Exception:
-        return None
+    result = None
+    # 令牌被拒绝时作废, 用新的令牌重试一次
+    for _ in range(2):
+        access_token = get_token(api_key, secret_key)
+        url = (
+            "https://aip.baidubce.com/rpc/2.0/unit/service/chat?access_token="
+            + access_token
+        )
+        try:
+            headers = {"Content-Type": "application/json"}
+            request = _http.post(url, json=body, headers=headers, timeout=10)
+            result = json.loads(request.text)
+        except Exception:
+            return None
+        if result.get("error_code") not in TOKEN_ERRORS:
+            break
+        tokens.invalidate(_token_key(api_key, secret_key))
+    return result
 
 
 def getIntent(parsed):
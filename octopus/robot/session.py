@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from octopus.robot import config, log
+
+logger = log.getLogger(__name__)
+
+
+class Session:
+    """
+    会话状态: 对话上下文、中断标记、历史游标
+    引擎客户端(AI/TTS等)由所有会话共享; 文字会话不经过技能插件, 沉浸模式只属于语音对话
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.context = []  # AI对话上下文
+        self.interrupted = threading.Event()  # 当前请求的中断标记
+        self.cursor = None  # 历史消息游标(uuid)
+        self.resp_uuid = None  # 当前响应标记
+        self.created = time.time()
+        self.last_active = self.created
+
+    def begin(self, resp_uuid=None) -> threading.Event:
+        """
+        开始新的请求: 中断该会话之前的请求
+        返回: 新请求的中断标记
+        """
+        self.interrupted.set()
+        self.interrupted = threading.Event()
+        self.resp_uuid = resp_uuid
+        self.touch()
+        return self.interrupted
+
+    def interrupt(self):
+        """打断"""
+        self.interrupted.set()
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def info(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "context": len(self.context),
+            "cursor": self.cursor,
+            "idle": round(time.time() - self.last_active, 1),
+        }
+
+
+class SessionManager:
+    """
+    会话管理: LRU淘汰, 空闲超时
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None):
+        self.max_size = max_size or config.get("/session/max_size", 64)
+        self.ttl = ttl or config.get("/session/ttl", 1800)
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, session_id: str) -> Session:
+        """获取会话, 不存在则创建"""
+        with self.lock:
+            self._sweep()
+            session = self.sessions.get(session_id)
+            if session:
+                self.sessions.move_to_end(session_id)
+            else:
+                session = Session(session_id=session_id)
+                self.sessions[session_id] = session
+                # LRU淘汰
+                while len(self.sessions) > self.max_size:
+                    _, old = self.sessions.popitem(last=False)
+                    self._evict(old)
+            session.touch()
+            return session
+
+    def find(self, session_id: str) -> Optional[Session]:
+        """获取会话, 不存在返回None"""
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def get_cursor(self, session_id: str) -> Optional[str]:
+        """会话的历史游标, 会话不存在返回None"""
+        session = self.find(session_id)
+        return session and session.cursor
+
+    def set_cursor(self, session_id: str, cursor: str):
+        session = self.find(session_id)
+        if session:
+            session.cursor = cursor
+
+    def remove(self, session_id: str):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session:
+            session.interrupt()
+
+    def interrupt_all(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.interrupt()
+
+    def stats(self) -> dict:
+        with self.lock:
+            self._sweep()
+            return {
+                "size": len(self.sessions),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "evicted": self.evicted,
+                "sessions": [session.info() for session in self.sessions.values()],
+            }
+
+    def _sweep(self):
+        """清理空闲超时的会话(按最近使用排序, 从头部开始)"""
+        expire = time.time() - self.ttl
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.last_active >= expire:
+                break
+            self.sessions.popitem(last=False)
+            self._evict(session)
+
+    def _evict(self, session: Session):
+        session.interrupt()
+        self.evicted += 1
+        logger.debug("会话淘汰: %s", session.session_id)
+
+    def __len__(self):
+        return len(self.sessions)
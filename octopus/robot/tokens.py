@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+访问令牌管理(百度OAuth、阿里云NLS等)
+
+- 令牌缓存在内存和数据目录(原子写入), 重启后继续使用
+- 过期前在后台线程刷新, 请求路径只读缓存
+- 同一个令牌同时只有一个请求在获取, 其它线程等待其结果
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import requests
+
+from octopus.robot import config, constants, log, metrics
+from octopus.robot.compt import ThreadManager
+
+logger = log.getLogger(__name__)
+
+TOKEN_FILE = "tokens.json"
+
+m_fetch = metrics.counter(
+    "octopus_token_fetch", "令牌获取次数", labelnames=("provider", "result")
+)
+
+
+class Credential:
+    def __init__(self, value: str, expires_at: float, fetched_at: float = None):
+        self.value = value
+        self.expires_at = expires_at
+        self.fetched_at = fetched_at or time.time()
+
+    def valid(self, now: float = None) -> bool:
+        return bool(self.value) and (now or time.time()) < self.expires_at
+
+    def to_dict(self) -> dict:
+        return dict(
+            value=self.value, expires_at=self.expires_at, fetched_at=self.fetched_at
+        )
+
+
+class _Flight:
+    """进行中的获取"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class TokenManager:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.cache: Dict[str, Credential] = dict()
+        self.fetchers: Dict[str, Callable] = dict()
+        self.flights: Dict[str, _Flight] = dict()
+        self.retry_at: Dict[str, float] = dict()  # 不早于此时刷新
+        self.loaded = False
+        self.thread = None
+        self.refresh_ahead = config.get("/tokens/refresh_ahead", 600)  # 秒
+        # 刷新失败的重试间隔, 也是两次刷新的最小间隔(秒)
+        self.retry = config.get("/tokens/retry", 60)
+
+    @staticmethod
+    def key(provider: str, *secrets) -> str:
+        """令牌的键: 凭据变化后使用新的令牌(不保存凭据原文)"""
+        digest = hashlib.sha1("\n".join(map(str, secrets)).encode("utf-8"))
+        return f"{provider}:{digest.hexdigest()[:16]}"
+
+    def get(self, key: str, fetcher: Callable) -> str:
+        """
+        获取令牌, 没有有效的缓存时才同步获取
+
+        :param fetcher: 获取令牌, 返回 (令牌, 有效期秒数)
+        """
+        with self.lock:
+            self._load()
+            self.fetchers[key] = fetcher
+            credential = self.cache.get(key)
+            if credential and credential.valid():
+                self._ensure_thread()
+                return credential.value
+        self._fetch(key)
+        return self.cache[key].value
+
+    def invalidate(self, key: str):
+        """令牌被服务端拒绝时作废, 下次获取时重新请求"""
+        with self.lock:
+            self.cache.pop(key, None)
+
+    def stats(self) -> list:
+        now = time.time()
+        with self.lock:
+            return [
+                dict(
+                    key=key,
+                    expires_in=round(credential.expires_at - now),
+                    fetched_at=credential.fetched_at,
+                )
+                for key, credential in self.cache.items()
+            ]
+
+    def _fetch(self, key: str):
+        """获取令牌(单飞): 已有进行中的获取时等待其结果"""
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+            fetcher = self.fetchers[key]
+        if not leader:
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return
+        provider = key.partition(":")[0]
+        try:
+            value, expires_in = fetcher()
+            now = time.time()
+            with self.lock:
+                self.cache[key] = Credential(
+                    value=value, expires_at=now + float(expires_in), fetched_at=now
+                )
+                # 有效期很短(或已过期)的令牌也不会被反复刷新
+                self.retry_at[key] = now + self.retry
+                self._save()
+                self._ensure_thread()
+            m_fetch.labels(provider, "ok").inc()
+            logger.info("令牌已更新: %s, 有效期 %ss", key, expires_in)
+        except BaseException as e:
+            flight.error = e
+            m_fetch.labels(provider, "error").inc()
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+                self.wakeup.notify_all()  # 重新计算下次刷新的时间
+            flight.done.set()
+
+    def _refresh_forever(self):
+        """在令牌过期前刷新"""
+        while True:
+            with self.lock:
+                due, wait = self._next_due()
+                if not due:
+                    self.wakeup.wait(timeout=wait)
+                    continue
+            for key in due:
+                try:
+                    self._fetch(key)
+                except Exception:
+                    logger.warning("令牌刷新失败: %s", key, exc_info=True)
+                    with self.lock:
+                        self.retry_at[key] = time.time() + self.retry
+
+    def _next_due(self) -> tuple:
+        """需要刷新的令牌, 及下一次检查前的等待秒数"""
+        now = time.time()
+        due, wait = [], 3600.0
+        for key, credential in self.cache.items():
+            if key not in self.fetchers or key in self.flights:
+                continue
+            # 有效期短于提前量的令牌在有效期过半时刷新
+            half = (credential.fetched_at + credential.expires_at) / 2
+            at = max(
+                credential.expires_at - self.refresh_ahead,
+                half,
+                self.retry_at.get(key, 0),
+            )
+            if at <= now:
+                due.append(key)
+            else:
+                wait = min(wait, at - now)
+        return due, wait
+
+    def _ensure_thread(self):
+        if self.thread is None:
+            self.thread = ThreadManager.new(
+                target=self._refresh_forever, role="token-refresh"
+            )
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            with open(constants.getData(TOKEN_FILE), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key, item in data.items():
+                self.cache[key] = Credential(**item)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.warning("令牌缓存读取失败", exc_info=True)
+
+    def _save(self):
+        path = constants.getData(TOKEN_FILE)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({k: c.to_dict() for k, c in self.cache.items()}, f)
+            os.replace(tmp, path)
+        except Exception:
+            logger.warning("令牌缓存保存失败", exc_info=True)
+
+
+def baidu_oauth(api_key: str, secret_key: str, scope: str = None) -> tuple:
+    """百度开放平台 client_credentials 令牌: (令牌, 有效期秒数)"""
+    r = requests.post(
+        "https://openapi.baidu.com/oauth/2.0/token",
+        data={
+            "grant_type": "client_credentials",
+            "client_id": api_key,
+            "client_secret": secret_key,
+        },
+        timeout=10,
+    )
+    r.raise_for_status()
+    result = r.json()
+    if "access_token" not in result:
+        raise ValueError(f"百度令牌获取失败: {result}")
+    if scope and scope not in result.get("scope", "").split(" "):
+        logger.error("当前百度云api_id尚未有 %s 的授权。", scope)
+    return result["access_token"], result.get("expires_in", 2592000)
+
+
+tokens = TokenManager()
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+对话轮次的耗时追踪
+
+一轮对话(turn)从唤醒开始, 绑定响应标记(resp_uuid)后, 各阶段按 resp_uuid 记录:
+wake -> first_partial -> endpoint -> recognized -> llm_request -> first_token
+-> first_sentence -> tts(每句) -> playback(每句)
+结束的轮次保存在环形缓冲中, 可选写入 JSONL 或 Chrome trace 文件
+"""
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy
+
+from octopus.robot import config, constants, log
+from octopus.robot.compt import CircularQueue
+
+logger = log.getLogger(__name__)
+
+
+class Turn:
+    """一轮对话"""
+
+    def __init__(self, source: str):
+        self.turn_id = uuid.uuid4().hex
+        self.resp_uuid = None
+        self.source = source
+        self.wall_time = time.time()
+        self.start = time.perf_counter()
+        self.spans = []  # (name, start, end, attrs)
+        self.names = set()
+
+    def add(self, name: str, start: float, end: float, once=False, **attrs):
+        if once and name in self.names:
+            return
+        self.names.add(name)
+        self.spans.append((name, start, end, attrs))
+
+    def info(self) -> dict:
+        return {
+            "turn_id": self.turn_id,
+            "resp_uuid": self.resp_uuid,
+            "source": self.source,
+            "time": self.wall_time,
+            "spans": [
+                dict(
+                    name=name,
+                    start_ms=round((start - self.start) * 1000, 2),
+                    dur_ms=round((end - start) * 1000, 2),
+                    **attrs,
+                )
+                for name, start, end, attrs in self.spans
+            ],
+        }
+
+
+class Tracer:
+    """
+    耗时追踪: 所有方法都可以在任意线程调用
+    未指定 resp_uuid 时记录到当前轮次(语音对话同一时刻只有一轮)
+    """
+
+    def __init__(self):
+        self.enabled = config.get("/trace/enable", True)
+        self.verbose = False  # 每轮结束时打印耗时(profiling)
+        self.lock = threading.Lock()
+        self.current: Optional[Turn] = None
+        self.active: "OrderedDict[str, Turn]" = OrderedDict()  # resp_uuid -> Turn
+        self.max_active = 16
+        self.turns = CircularQueue(size=config.get("/trace/size", 200))
+        self.file = None
+        self.format = config.get("/trace/format", "jsonl")
+        self.file_lock = threading.Lock()
+        file = config.get("/trace/file", "")
+        if file:
+            self.open(file=file)
+
+    def open(self, file: str):
+        """写入文件: jsonl-每轮一行; chrome-Chrome trace(chrome://tracing)"""
+        path = constants.getData(file)
+        self.file = open(path, "a", encoding="utf-8")
+        if self.format == "chrome" and self.file.tell() == 0:
+            self.file.write("[\n")
+        logger.info("对话耗时追踪写入: %s", path)
+
+    def profiling(self):
+        """性能调优模式: 打印每轮的耗时, 默认写入trace文件"""
+        self.enabled = True
+        self.verbose = True
+        if not self.file:
+            self.open(file=f"trace.{'json' if self.format == 'chrome' else 'jsonl'}")
+
+    def begin(self, source="voice", name="wake") -> Optional[Turn]:
+        """开始新的一轮(结束之前未绑定响应的轮次)"""
+        if not self.enabled:
+            return None
+        turn = Turn(source=source)
+        turn.add(name, turn.start, turn.start)
+        with self.lock:
+            old, self.current = self.current, turn
+        if old and not old.resp_uuid:
+            self._finish(old)
+        return turn
+
+    def bind(self, resp_uuid: str, source="text", current=True):
+        """
+        轮次绑定响应标记
+        :param current: 绑定当前轮次(没有时开始新的一轮); 否则开始独立的一轮(如API请求)
+        """
+        if not self.enabled or not resp_uuid:
+            return
+        with self.lock:
+            turn = self.current if current else None
+            if not turn or turn.resp_uuid:
+                turn = Turn(source=source)
+                turn.add("query", turn.start, turn.start)
+            turn.resp_uuid = resp_uuid
+            if current:
+                self.current = turn
+            self.active[resp_uuid] = turn
+            while len(self.active) > self.max_active:
+                _, old = self.active.popitem(last=False)
+                self._finish(old)
+
+    def mark(self, name: str, resp_uuid=None, **attrs):
+        """瞬时事件, 每轮只记录第一次"""
+        turn = self._turn(resp_uuid)
+        if turn:
+            now = time.perf_counter()
+            turn.add(name, now, now, once=True, **attrs)
+
+    def add_span(self, name: str, start: float, resp_uuid=None, **attrs):
+        """记录从start(perf_counter)到现在的阶段"""
+        turn = self._turn(resp_uuid)
+        if turn:
+            turn.add(name, start, time.perf_counter(), **attrs)
+
+    @contextmanager
+    def span(self, name: str, resp_uuid=None, **attrs):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, resp_uuid=resp_uuid, **attrs)
+
+    def end(self, resp_uuid=None):
+        """结束一轮"""
+        with self.lock:
+            turn = self.active.pop(resp_uuid, None) if resp_uuid else self.current
+            if turn is self.current:
+                self.current = None
+            if turn and turn.resp_uuid:
+                self.active.pop(turn.resp_uuid, None)
+        if turn:
+            self._finish(turn)
+
+    def recent(self, limit: int = 20) -> list:
+        """最近结束的轮次"""
+        return [turn.info() for turn in self.turns.all()[-limit:]]
+
+    def stats(self, last: int = 50) -> dict:
+        """
+        最近N轮各阶段的耗时(毫秒)
+        at: 阶段开始(第一次)距唤醒的时间; dur: 阶段持续时间(多次时取平均)
+        """
+        turns = self.turns.all()[-last:]
+        stages = OrderedDict()
+        for turn in turns:
+            firsts = {}
+            for name, start, end, _ in turn.spans:
+                at, durs = firsts.setdefault(name, (start - turn.start, []))
+                durs.append(end - start)
+            for name, (at, durs) in firsts.items():
+                s = stages.setdefault(name, {"at": [], "dur": []})
+                s["at"].append(at * 1000)
+                s["dur"].append(sum(durs) / len(durs) * 1000)
+        result = OrderedDict()
+        for name, s in stages.items():
+            at, dur = numpy.array(s["at"]), numpy.array(s["dur"])
+            result[name] = {
+                "count": len(at),
+                "at_p50": round(float(numpy.percentile(at, 50)), 2),
+                "at_p95": round(float(numpy.percentile(at, 95)), 2),
+                "dur_p50": round(float(numpy.percentile(dur, 50)), 2),
+                "dur_p95": round(float(numpy.percentile(dur, 95)), 2),
+            }
+        return {"turns": len(turns), "stages": result}
+
+    def _turn(self, resp_uuid=None) -> Optional[Turn]:
+        if not self.enabled:
+            return None
+        if resp_uuid:
+            return self.active.get(resp_uuid)
+        return self.current
+
+    def _finish(self, turn: Turn):
+        if not turn.spans:
+            return
+        self.turns.enqueue(turn)
+        if self.verbose:
+            logger.info(
+                "对话耗时: %s",
+                ", ".join(
+                    f"{name}={(start - turn.start) * 1000:.0f}ms"
+                    for name, start, _, _ in turn.spans
+                ),
+            )
+        if self.file:
+            self._write(turn)
+
+    def _write(self, turn: Turn):
+        try:
+            with self.file_lock:
+                if self.format == "chrome":
+                    tid = turn.turn_id[:8]
+                    base = turn.wall_time * 1e6
+                    for name, start, end, attrs in turn.spans:
+                        event = {
+                            "name": name,
+                            "ph": "X",
+                            "ts": round(base + (start - turn.start) * 1e6),
+                            "dur": round((end - start) * 1e6),
+                            "cat": turn.source,
+                            "pid": 1,
+                            "tid": tid,
+                            "args": dict(attrs, resp_uuid=turn.resp_uuid),
+                        }
+                        self.file.write(json.dumps(event, ensure_ascii=False) + ",\n")
+                else:
+                    self.file.write(json.dumps(turn.info(), ensure_ascii=False) + "\n")
+                self.file.flush()
+        except (OSError, ValueError):
+            logger.warning("对话耗时写入失败", exc_info=True)
+
+
+tracer = Tracer()
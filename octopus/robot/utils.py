@@ -27,6 +27,7 @@ logger = log.getLogger(__name__)
 
 do_not_bother = False
 is_recordable = True
+_bother_profile = config.bind("do_not_bother")  # 勿扰模式配置
 
 system = platform.system()
 
@@ -235,9 +236,9 @@ def is_proper_time():
     global do_not_bother
     if do_not_bother == True:
         return False
-    if not config.has("do_not_bother"):
+    bother_profile = _bother_profile.value
+    if not bother_profile:
         return True
-    bother_profile = config.get("do_not_bother")
     if not bother_profile["enable"]:
         return True
     if "since" not in bother_profile or "till" not in bother_profile:
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+web接口压测: 并发请求指定接口, 统计吞吐和延迟, 并对比压测前后的录音帧抖动
+
+用法:
+    python -m octopus.tools.bench_web --url http://127.0.0.1:5001/chat-robot/api/history/list \\
+        --validate <md5> --clients 32 --requests 2000
+
+分别在 /server/workers 为 0 和大于 0 时运行, 对比两种模式
+冒烟测试: tests/test_bench_web.py
+"""
+import argparse
+import json
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def fetch(url: str, timeout: float) -> float:
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        resp.read()
+    return time.perf_counter() - start
+
+
+def with_validate(url: str, validate: str) -> str:
+    if not validate:
+        return url
+    sep = "&" if "?" in url else "?"
+    return f"{url}{sep}{urllib.parse.urlencode({'validate': validate})}"
+
+
+def audio_stats(url: str, timeout: float) -> dict:
+    """录音帧抖动(/monitor/audio)"""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return json.loads(resp.read()).get("data") or {}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def bench(url: str, clients: int, requests: int, timeout: float) -> dict:
+    """并发请求, 返回: 失败数, 耗时(秒), 各请求延迟(秒)"""
+    errors = 0
+    latencies = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        futures = [pool.submit(fetch, url, timeout) for _ in range(requests)]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - start
+    return dict(errors=errors, elapsed=elapsed, latencies=latencies)
+
+
+def run(args):
+    url = with_validate(args.url, args.validate)
+    monitor = with_validate(
+        urllib.parse.urljoin(args.url, f"{args.base}/api/monitor/audio"),
+        args.validate,
+    )
+    before = audio_stats(monitor, args.timeout)
+    result = bench(url, args.clients, args.requests, args.timeout)
+    after = audio_stats(monitor, args.timeout)
+
+    latencies, elapsed = result["latencies"], result["elapsed"]
+    lat = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    print(f"请求: {args.requests}, 并发: {args.clients}, 失败: {result['errors']}")
+    print(f"耗时: {elapsed:.2f}s, 吞吐: {len(latencies) / elapsed:.1f} req/s")
+    print(
+        f"延迟(ms): p50={np.percentile(lat, 50):.1f} "
+        f"p95={np.percentile(lat, 95):.1f} max={lat.max():.1f}"
+    )
+    print(f"录音帧抖动(压测前): {before}")
+    print(f"录音帧抖动(压测后): {after}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="web接口压测")
+    parser.add_argument("--url", required=True, help="压测的接口地址")
+    parser.add_argument("--validate", default="", help="/server/validate")
+    parser.add_argument("--base", default="/chat-robot", help="/server/path")
+    parser.add_argument("--clients", type=int, default=16, help="并发数")
+    parser.add_argument("--requests", type=int, default=1000, help="请求总数")
+    parser.add_argument("--timeout", type=float, default=10, help="超时(秒)")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+启动导入耗时检查: 在子进程中以 python -X importtime 导入指定模块, 汇总耗时
+
+用法:
+    python -m octopus.tools.importtime --budget-ms 3000
+    python -m octopus.tools.importtime --module octopus.robot.TTS --top 30
+
+超过预算, 或导入了禁止在启动时导入的模块(未选用引擎的SDK)时, 返回码为1
+修改引擎或启动流程后手动运行, 禁止导入的检查也在测试中运行(tests/test_importtime.py)
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# 只应在选用对应引擎时导入
+FORBIDDEN = (
+    "edge_tts",
+    "aip",
+    "pypinyin",
+    "funasr_onnx",
+    "openai",
+    "dashscope",
+    "nest_asyncio",
+)
+
+
+def measure(module: str) -> list:
+    """返回: [(模块, 自身耗时us, 累计耗时us)], 按导入顺序"""
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:") :].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # 表头
+        rows.append((parts[2].strip(), self_us, cumulative_us))
+    if proc.returncode != 0:
+        lines = proc.stderr.splitlines()
+        errors = [line for line in lines if not line.startswith("import time:")]
+        sys.stderr.write("\n".join(errors[-20:]) + "\n")
+        raise SystemExit(f"导入失败: {module}")
+    return rows
+
+
+def run(args) -> int:
+    rows = measure(args.module)
+    total_ms = next((cum for name, _, cum in rows if name == args.module), 0) / 1000
+    print(f"{args.module}: {total_ms:.1f} ms, 导入模块数: {len(rows)}")
+    print(f"{'累计(ms)':>10} {'自身(ms)':>10}  模块")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: -r[2])[: args.top]:
+        print(f"{cumulative_us / 1000:10.1f} {self_us / 1000:10.1f}  {name}")
+
+    failed = False
+    imported = {name.split(".")[0] for name, _, _ in rows}
+    forbidden = sorted(imported.intersection(args.forbid))
+    if forbidden:
+        print(f"启动时导入了未选用引擎的模块: {forbidden}")
+        failed = True
+    if args.budget_ms and total_ms > args.budget_ms:
+        print(f"超过导入耗时预算: {total_ms:.1f} ms > {args.budget_ms} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动导入耗时检查")
+    parser.add_argument("--module", default="octopus.app", help="导入的模块")
+    parser.add_argument("--budget-ms", type=float, default=0, help="耗时预算, 0不检查")
+    parser.add_argument("--top", type=int, default=20, help="显示耗时最多的模块数")
+    parser.add_argument(
+        "--forbid", nargs="*", default=FORBIDDEN, help="启动时禁止导入的顶层模块"
+    )
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
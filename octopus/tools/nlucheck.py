@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+本地NLU识别检查: 用内置样本(resources/nlu.yml)训练, 检查常见说法的识别结果
+
+用法:
+    python -m octopus.tools.nlucheck
+    python -m octopus.tools.nlucheck --threshold 0.5 --margin 0.1
+
+修改内置样本或阈值后运行, 有识别错误时返回码为1(同样的样本在 tests/test_nlucheck.py 中检查)
+"""
+import argparse
+import sys
+
+# 说法 -> 期望的意图, 空串表示不应在本地识别(交给云端NLU/聊天机器人)
+CASES = {
+    "大声点儿": "CHANGE_VOL",
+    "声音再大一点": "CHANGE_VOL",
+    "小点声吧": "CHANGE_VOL",
+    "音量大一点": "CHANGE_VOL",
+    "下一首歌": "CHANGE_TO_NEXT",
+    "换一首歌吧": "CHANGE_TO_NEXT",
+    "切到下一首": "CHANGE_TO_NEXT",
+    "上一首歌": "CHANGE_TO_LAST",
+    "放一首歌吧": "MUSICRANK",
+    "我想听音乐": "MUSICRANK",
+    "暂停一下": "PAUSE",
+    "继续放": "CONTINUE",
+    "接着放歌": "CONTINUE",
+    "关掉音乐吧": "CLOSE_MUSIC",
+    "看看有什么提醒": "CHECK_REMIND",
+    "我的提醒呢": "CHECK_REMIND",
+    "帮我写一首诗": "BUILT_POEM",
+    "今天天气怎么样": "",
+    "北京明天天气": "",
+    "我想继续聊天": "",
+    "继续说下去": "",
+    "你好啊": "",
+    "讲个故事": "",
+    "今天星期几": "",
+    "你喜欢什么": "",
+    "我想去旅游": "",
+    "给我推荐一本书": "",
+    "打开灯": "",
+}
+
+
+def build(threshold=None, margin=None):
+    """只使用内置样本的本地NLU"""
+    from octopus.robot.NLU import LocalNLU
+
+    options = dict(fallback=None, file=None)
+    if threshold is not None:
+        options["threshold"] = threshold
+    if margin is not None:
+        options["margin"] = margin
+    return LocalNLU(**options)
+
+
+def recognize(nlu, query: str) -> tuple:
+    """返回: (识别的意图, 空串表示未识别, 置信度)"""
+    _, confidence, _ = nlu.classify(query)
+    parsed = nlu.parse(query)
+    return (nlu.getIntent(parsed) if parsed else ""), confidence
+
+
+def run(args) -> int:
+    nlu = build(threshold=args.threshold, margin=args.margin)
+    failed = 0
+    for query, expected in CASES.items():
+        actual, confidence = recognize(nlu, query)
+        ok = actual == expected
+        failed += not ok
+        print(
+            f"{'OK ' if ok else 'ERR'} {query:<10} {actual or '-':<16}"
+            f"期望 {expected or '-':<16} 置信度 {confidence:.2f}"
+        )
+    print(f"共 {len(CASES)} 条, 错误 {failed} 条")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地NLU识别检查")
+    parser.add_argument("--threshold", type=float, default=None, help="置信度阈值")
+    parser.add_argument("--margin", type=float, default=None, help="与次高意图的差距")
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,22 @@
 # -*- coding: utf-8 -*-
 import hashlib
+import json
+import queue
+import threading
 import uuid
 
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.queues import Queue
+
 from octopus.robot import config, log
 from octopus.robot.Sender import ACTION_USER_SPEAK
+from octopus.robot.compt import ThreadManager
 from octopus.robot.enums import AssistantEvent, AssistantStatus
-from octopus.schemas.core import Response
-from octopus.web.core import BaseHandler, ApiBaseHandler
+from octopus.robot.sdk.History import History
+from octopus.schemas.core import Response, Page
+from octopus.web.core import BaseHandler, ApiBaseHandler, call
 from octopus.srv.navigation import FaqService
 
 logger = log.getLogger(__name__)
@@ -115,8 +125,9 @@ class DigitalHumanHandler(BaseHandler):
         return func
 
     @classmethod
-    def info(cls, dh):
-        data = dh and dh.info()
+    def info(cls, dh=None, data: dict = None):
+        """播放信息, data: 已获取的 dh.info()"""
+        data = data or (dh and dh.info())
         data = data or dict(session_id=None, play_stream_addr=None, cmd_status=False)
         detect_engine = config.get("/detector", "porcupine")
         data.update(
@@ -135,22 +146,22 @@ class DigitalHumanHandler(BaseHandler):
 class DetectorHandler(BaseHandler):
     """关键字检测接口"""
 
-    def post(self, action: str):
+    async def post(self, action: str):
         if not self.valid_to_json():
             return
         if "log-on" == action:
-            self.start_log()
+            await self.start_log()
         elif "log-off" == action:
-            self.stop_log()
+            await self.stop_log()
         else:
             self.send_error(status_code=404)
 
-    def start_log(self):
-        self.octopus.robot.open_log()
+    async def start_log(self):
+        await call(self.octopus.robot.open_log)
         self.response(Response.ok())
 
-    def stop_log(self):
-        self.octopus.robot.close_log()
+    async def stop_log(self):
+        await call(self.octopus.robot.close_log)
         self.response(Response.ok())
 
 
@@ -169,19 +180,19 @@ class HandControlHandler(BaseHandler):
         else:
             self.send_error(status_code=404)
 
-    def post(self, action: str):
+    async def post(self, action: str):
         if not self.valid_to_json():
             return
         if "wakeup" == action:
-            self.wakeup_robot()
+            await self.wakeup_robot()
         elif "interrupt" == action:
-            self.interrupt_robot()
+            await self.interrupt_robot()
         elif "interrupt-wakeup" == action:
-            self.interrupt_and_wakeup()
+            await self.interrupt_and_wakeup()
         elif "sleep" == action:
-            self.sleep_robot()
+            await self.sleep_robot()
         elif "commit-query" == action:
-            self.commit_query()
+            await self.commit_query()
         else:
             self.send_error(status_code=404)
 
@@ -189,38 +200,62 @@ class HandControlHandler(BaseHandler):
         # todo: 获取机器人状态
         ...
 
-    def wakeup_robot(self):
+    async def wakeup_robot(self):
         # 手工唤醒
-        self.octopus.robot.action(AssistantEvent.CTRL_WAKEUP, manual=True)
-        self.response(Response.ok())
+        await self._control(AssistantEvent.CTRL_WAKEUP, manual=True)
 
-    def interrupt_robot(self):
+    async def interrupt_robot(self):
         # 打断说话
-        self.octopus.robot.action(AssistantEvent.CTRL_STOP_RESP, manual=True)
-        self.response(Response.ok())
+        await self._control(AssistantEvent.CTRL_STOP_RESP, manual=True)
 
-    def interrupt_and_wakeup(self):
+    async def interrupt_and_wakeup(self):
         # 重新提问
-        self.octopus.robot.action(
+        await self._control(
             AssistantEvent.CTRL_ASK_AGAIN,
             interrupt_time=self.interrupt_time,
             manual=True,
         )
-        self.response(Response.ok())
 
-    def sleep_robot(self):
+    async def sleep_robot(self):
         # 打断说话
-        if not self.octopus.robot.status() == AssistantStatus.DEFAULT:
-            self.octopus.robot.action(AssistantEvent.CTRL_STOP_RESP, manual=True)
+        if not await call(self.octopus.robot.status) == AssistantStatus.DEFAULT:
+            await call(
+                self.octopus.robot.submit, AssistantEvent.CTRL_STOP_RESP, manual=True
+            )
         # 反馈休眠
         if self.octopus and hasattr(self.octopus, "life_cycle_event"):
-            self.octopus.life_cycle_event.fire_event(event="sleep")
+            await call(self.octopus.life_cycle_event.fire_event, event="sleep")
         self.response(Response.ok())
 
-    def commit_query(self):
+    async def commit_query(self):
         """直接提交"""
-        self.octopus.robot.action(AssistantEvent.CTRL_COMMIT_LISTEN)
-        self.response(Response.ok())
+        await self._control(AssistantEvent.CTRL_COMMIT_LISTEN)
+
+    async def _control(self, event: AssistantEvent, **kwargs):
+        """
+        提交控制命令, 由控制线程执行, 不阻塞IOLoop
+        参数 wait=1: 等待执行完成后返回执行结果, 否则立即返回命令ID
+        """
+        try:
+            if self.get_argument("wait", "0") != "1":
+                cmd_id = await call(self.octopus.robot.submit, event, **kwargs)
+                self.response(Response.ok(data={"id": cmd_id}))
+                return
+            io_loop = IOLoop.current()
+            done = Future()
+
+            def on_done(result: dict):
+                io_loop.add_callback(done.set_result, result)
+
+            await call(self.octopus.robot.submit, event, on_done=on_done, **kwargs)
+            result = await done
+        except queue.Full:
+            self.response(Response.error(code=2, message="control queue is full"))
+            return
+        if result["ok"]:
+            self.response(Response.ok(data=result))
+        else:
+            self.response(Response.error(code=1, message=result["error"], data=result))
 
 
 class TuningControlHandler(BaseHandler):
@@ -229,22 +264,25 @@ class TuningControlHandler(BaseHandler):
     def get(self, action: str):
         self.send_error(status_code=404)
 
-    def post(self, action: str):
+    async def post(self, action: str):
         if not self.valid_to_json():
             return
         if "feedback" == action:
-            self.feedback()
+            await self.feedback()
         else:
             self.send_error(status_code=404)
 
-    def feedback(self):
+    async def feedback(self):
         # 反馈
         data = self.get_body_json()
         data_id = data.get("data_id")
         useful = data.get("useful", False)
         if self.octopus and hasattr(self.octopus, "conversation"):
-            resp = self.octopus.conversation.feedback(
-                chat_id=data_id, data_id=data_id, useful=useful
+            resp = await call(
+                self.octopus.conversation.feedback,
+                chat_id=data_id,
+                data_id=data_id,
+                useful=useful,
             )
             self.response(Response.ok(data=resp))
 
@@ -252,23 +290,200 @@ class TuningControlHandler(BaseHandler):
 class ChatApiHandler(ApiBaseHandler):
     """聊天API接口"""
 
-    def post_send_query(self) -> Response:
+    async def post_send_query(self) -> Response:
         """手动提交查询"""
         data = self.get_body_json()
         query = data.get("query", None)
         req_uuid = data.get("uuid", uuid.uuid4().hex)
+        user_id = data.get("user_id", None)
         if not query:
             return Response.error(code=1, message="query text is empty")
         else:
-            self.octopus.sender.put_message(
-                action=ACTION_USER_SPEAK, data={"end": True}, message=query, t=0
+            await call(
+                self.octopus.sender.put_message,
+                action=ACTION_USER_SPEAK,
+                data={"end": True},
+                message=query,
+                user_id=user_id,
+                t=0,
             )
-            # 另起线程执行
-            self.octopus.robot.action(
-                AssistantEvent.CTRL_QUERY, query=query, req_uuid=req_uuid
+            # 由控制线程执行
+            await call(
+                self.octopus.robot.submit,
+                AssistantEvent.CTRL_QUERY,
+                query=query,
+                req_uuid=req_uuid,
+                user_id=user_id,
             )
             return Response.ok()
 
+
+    async def post_stream(self):
+        """
+        流式返回单个查询的回复(text/event-stream)
+        事件: delta-文字片段; end-结束(完整回复); error-出错
+        参数 tts: 是否同时朗读, 默认只返回文字
+        参数 session_id: 会话ID(默认使用user_id), 会话之间上下文隔离
+        """
+        data = self.get_body_json()
+        query = data.get("query", None)
+        if not query:
+            return Response.error(code=1, message="query text is empty")
+        req_uuid = data.get("uuid", uuid.uuid4().hex)
+        resp_uuid = uuid.uuid4().hex
+        self.canceled = threading.Event()
+        io_loop = IOLoop.current()
+        deltas = Queue()
+
+        def on_delta(text):
+            io_loop.add_callback(deltas.put_nowait, ("delta", text))
+
+        def run():
+            try:
+                self.octopus.conversation.do_stream(
+                    query=query,
+                    on_delta=on_delta,
+                    req_uuid=req_uuid,
+                    resp_uuid=resp_uuid,
+                    tts=bool(data.get("tts", False)),
+                    canceled=self.canceled,
+                    session_id=data.get("session_id") or data.get("user_id"),
+                    user_id=data.get("user_id"),
+                )
+                io_loop.add_callback(deltas.put_nowait, ("end", None))
+            except Exception as e:
+                logger.error("流式请求失败: %s", str(e), exc_info=True)
+                io_loop.add_callback(deltas.put_nowait, ("error", str(e)))
+
+        self.set_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("X-Accel-Buffering", "no")
+        ThreadManager.new(target=run).start()
+        texts = []
+        while True:
+            event, text = await deltas.get()
+            if event == "delta":
+                texts.append(text)
+            elif event == "end":
+                text = "".join(texts)
+            try:
+                await self._write_event(event=event, uuid=resp_uuid, text=text)
+            except StreamClosedError:
+                self.canceled.set()
+                return
+            if event != "delta":
+                break
+        self.finish()
+
+    def on_connection_close(self):
+        # 客户端断开, 取消上游请求
+        if getattr(self, "canceled", None):
+            self.canceled.set()
+
+    async def _write_event(self, event: str, **data):
+        payload = json.dumps(data, ensure_ascii=False)
+        self.write(f"event: {event}\ndata: {payload}\n\n")
+        await self.flush()
+
+
+class HistoryApiHandler(ApiBaseHandler):
+    """历史消息接口"""
+
+    def get_list(self) -> Page:
+        """分页查询, 支持关键字检索"""
+        paginate = self.get_paginate()
+        keyword = self.get_query_argument("keyword", None)
+        html = self.get_query_argument("html", "1") == "1"
+        total, messages = History().page(
+            page=paginate.page,
+            paginate_by=paginate.paginate_by,
+            keyword=keyword,
+            html=html,
+        )
+        paginate.set_total(total)
+        return Page(paginate=paginate, content=messages)
+
+    async def get_since(self) -> list:
+        """游标之后的消息, 指定会话(session_id)时默认使用会话的游标"""
+        cursor = self.get_query_argument("cursor", None)
+        html = self.get_query_argument("html", "1") == "1"
+        session_id = self.get_query_argument("session_id", None)
+        sessions = self.octopus.conversation.sessions
+        if session_id:
+            cursor = cursor or await call(sessions.get_cursor, session_id)
+        messages = History().get_messages_since(cursor, html=html)
+        if session_id and messages:
+            await call(sessions.set_cursor, session_id, messages[-1]["uuid"])
+        return messages
+
+
+class MetricsHandler(BaseHandler):
+    """运行指标(Prometheus文本格式)"""
+
+    async def get(self):
+        if not self.valid_to_json():
+            return
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(await call(self.octopus.metrics.exposition))
+
+
+class MonitorApiHandler(ApiBaseHandler):
+    """运行状态监控接口"""
+
+    async def get_websocket(self) -> list:
+        """websocket客户端发送统计"""
+        return await call(self.octopus.sender.stats)
+
+    async def get_sessions(self) -> dict:
+        """文字会话"""
+        return await call(self.octopus.conversation.sessions.stats)
+
+    async def get_audio(self) -> dict:
+        """录音帧间隔抖动"""
+        return await call(self.octopus.robot.listener.frame_stats)
+
+    async def get_workers(self) -> dict:
+        """web工作进程(多进程模式)"""
+        workers = getattr(self.octopus, "web_workers", None)
+        return await call(workers.stats) if workers is not None else {}
+
+    async def get_memory(self) -> dict:
+        """内存增长报告, sample=1 时先记录一次快照"""
+        if self.get_argument("sample", default=None):
+            await call(self.octopus.memwatch.sample)
+        return await call(self.octopus.memwatch.report)
+
+    async def get_plugins(self) -> list:
+        """技能插件加载耗时"""
+        return await call(self.octopus.conversation.brain.plugin_report)
+
+    async def get_boot(self) -> dict:
+        """启动时间线: 各启动步骤的开始/结束时间"""
+        return await call(self.octopus.boot.timeline)
+
+    async def get_control(self) -> dict:
+        """控制命令执行统计"""
+        return await call(self.octopus.robot.control_stats)
+
+    async def get_machine(self) -> dict:
+        """状态机: 当前状态, 各状态停留时长分布"""
+        return await call(self.octopus.robot.machine.stats)
+
+    async def get_transitions(self) -> list:
+        """状态变更轨迹"""
+        return await call(self.octopus.robot.machine.traces)
+
+    async def get_latency(self) -> dict:
+        """最近N轮(last)对话各阶段耗时的p50/p95"""
+        last = int(self.get_query_argument("last", "50"))
+        return await call(self.octopus.conversation.tracer.stats, last=last)
+
+    async def get_turns(self) -> list:
+        """最近的对话轮次耗时明细"""
+        limit = int(self.get_query_argument("limit", "20"))
+        return await call(self.octopus.conversation.tracer.recent, limit=limit)
+
+
 class NavigationHandler(ApiBaseHandler):
 
     def get_faq_list(self) -> list:
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import inspect
 import json
 from typing import List, Any, Tuple
 
@@ -8,6 +9,28 @@ from octopus.robot import config
 from octopus.schemas.core import Paginate, Response
 
 
+async def call(func, *args, **kwargs):
+    """
+    调用 octopus 对象的方法
+    多进程web服务时 func 是主进程对象的引用(RemoteRef), 等待结果时不阻塞IOLoop
+    """
+    call_async = getattr(func, "_call_async", None)
+    if call_async is not None:
+        return await call_async(*args, **kwargs)
+    return func(*args, **kwargs)
+
+
+async def truth(obj) -> bool:
+    """
+    octopus 对象的属性是否存在(非空)
+    多进程web服务时 obj 是主进程对象的引用(RemoteRef), 等待结果时不阻塞IOLoop
+    """
+    truth_async = getattr(obj, "_truth_async", None)
+    if truth_async is not None:
+        return await truth_async()
+    return bool(obj)
+
+
 class Route:
     def __init__(self, path: str, handler: Any, kwarg: dict = None):
         self.path = path
@@ -15,6 +38,9 @@ class Route:
         self.kwarg = kwarg
 
 
+_validate = config.bind("/server/validate", default="", type=str)
+
+
 class BaseHandler(tornado.web.RequestHandler):
 
     def initialize(self, octopus=None, **kwargs):
@@ -29,13 +55,13 @@ class BaseHandler(tornado.web.RequestHandler):
             valid_cookie = str(valid_cookie, encoding="utf-8").replace('"', "")
         if valid_arg:
             valid_arg = valid_arg.replace('"', "")
-        validate = config.get("/server/validate", "")
+        validate = _validate.value
         return valid_arg == validate or valid_cookie == validate
 
     def validate(self, validation):
         if validation and '"' in validation:
             validation = validation.replace('"', "")
-        return validation == config.get("/server/validate", "") or validation == str(
+        return validation == _validate.value or validation == str(
             self.get_cookie("validation")
         )
 
@@ -66,33 +92,33 @@ class BaseHandler(tornado.web.RequestHandler):
 class ApiBaseHandler(BaseHandler):
     """API接口"""
 
-    def get(self, action: str):
+    async def get(self, action: str):
         """
         对应请求: GET
         对应子类方法: get_{action.replace('-', '_')}
         """
-        self._do_service(method="get", action=action)
+        await self._do_service(method="get", action=action)
 
-    def post(self, action: str):
+    async def post(self, action: str):
         """
         对应请求: POST
         对应子类方法: post_{action.replace('-', '_')}
         """
-        self._do_service(method="post", action=action)
+        await self._do_service(method="post", action=action)
 
-    def put(self, action: str):
+    async def put(self, action: str):
         """
         对应请求: PUT
         对应子类方法: put_{action.replace('-', '_')}
         """
-        self._do_service(method="put", action=action)
+        await self._do_service(method="put", action=action)
 
-    def delete(self, action: str):
+    async def delete(self, action: str):
         """
         对应请求: DELETE
         对应子类方法: delete_{action.replace('-', '_')}
         """
-        self._do_service(method="delete", action=action)
+        await self._do_service(method="delete", action=action)
 
     def get_paginate(self) -> Paginate:
         page = int(self.get_query_argument("page", "1"))
@@ -120,9 +146,9 @@ class ApiBaseHandler(BaseHandler):
         else:
             self.response(Response.ok(res))
 
-    def _do_service(self, method: str, action: str):
+    async def _do_service(self, method: str, action: str):
         """
-        对应子类方法: {method}_{action}
+        对应子类方法: {method}_{action}, 支持异步方法
         """
         if not self.valid_to_json():
             return
@@ -132,6 +158,8 @@ class ApiBaseHandler(BaseHandler):
             self.send_error(status_code=404)
             return
         res = func(*args)
+        if inspect.isawaitable(res):
+            res = await res
         if res is None:
             return
         self._resp_result(res)
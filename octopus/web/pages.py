@@ -7,17 +7,20 @@ import os
 import random
 import subprocess
 import time
+from datetime import timedelta
 from urllib.parse import unquote
 
 import markdown
 import requests
 import yaml
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
 from tornado.websocket import WebSocketHandler
 
 from octopus.robot import config, log, utils, constants
 from octopus.robot.sdk.History import History
 from octopus.web.apis import DigitalHumanHandler
-from octopus.web.core import BaseHandler
+from octopus.web.core import BaseHandler, call, truth
 from octopus.tools import make_json, solr_tools
 
 logger = log.getLogger(__name__)
@@ -35,10 +38,10 @@ suggestions = [
 
 
 class MainHandler(BaseHandler):
-    def get(self):
+    async def get(self):
         if not self.valid_to_login():
             return
-        if self.octopus and self.octopus.conversation:
+        if self.octopus and await truth(self.octopus.conversation):
             # info = Updater.fetch()
             info = {}
             suggestion = random.choice(suggestions)
@@ -73,7 +76,7 @@ class MessageUpdatesHandler(BaseHandler):
             while not messages:
                 # Save the Future returned here so we can cancel it in
                 # on_connection_close.
-                self.wait_future = history.cond.wait(timeout=1)
+                self.wait_future = history.wait(timeout=timedelta(seconds=30))
                 try:
                     await self.wait_future
                 except asyncio.CancelledError:
@@ -115,6 +118,11 @@ class ChatWebSocketHandler(WebSocketHandler, BaseHandler):
 
 
 class ChatHandler(BaseHandler):
+    """
+    回复通过 onSay 回调写入(多进程web服务时在接收线程中回调),
+    统一交给IOLoop线程写入, 调用结束后等待已提交的写入完成
+    """
+
     def onResp(self, msg, audio, plugin):
         logger.info(f"response msg: {msg}")
         res = {
@@ -130,7 +138,12 @@ class ChatHandler(BaseHandler):
         except:
             pass
 
-    def post(self):
+    async def post(self):
+        io_loop = IOLoop.current()
+
+        def on_say(msg, audio, plugin):
+            io_loop.add_callback(self.onResp, msg, audio, plugin)
+
         if self.validate(self.get_argument("validate", default=None)):
             if self.get_argument("type") == "text":
                 query = self.get_argument("query")
@@ -139,12 +152,11 @@ class ChatHandler(BaseHandler):
                     res = {"code": 1, "message": "query text is empty"}
                     self.write(json.dumps(res))
                 else:
-                    self.octopus.conversation.do_response(
+                    await call(
+                        self.octopus.conversation.do_response,
                         query=query,
                         req_uuid=req_uuid,
-                        onSay=lambda msg, audio, plugin: self.onResp(
-                            msg, audio, plugin
-                        ),
+                        onSay=on_say,
                     )
 
             elif self.get_argument("type") == "voice":
@@ -156,9 +168,8 @@ class ChatHandler(BaseHandler):
                 soxCall = "sox " + tmpfile + " " + nfile + " rate 16k"
                 subprocess.call([soxCall], shell=True, close_fds=True)
                 utils.check_and_delete(tmpfile)
-                self.octopus.conversation.do_converse(
-                    voice=nfile,
-                    onSay=lambda msg, audio, plugin: self.onResp(msg, audio, plugin),
+                await call(
+                    self.octopus.conversation.do_converse, voice=nfile, onSay=on_say
                 )
             else:
                 res = {"code": 1, "message": "illegal type"}
@@ -166,6 +177,10 @@ class ChatHandler(BaseHandler):
         else:
             res = {"code": 1, "message": "illegal visit"}
             self.write(json.dumps(res))
+        # 排在已提交的回复之后
+        written = Future()
+        io_loop.add_callback(written.set_result, None)
+        await written
         self.finish()
 
 
@@ -178,7 +193,7 @@ class GetHistoryHandler(BaseHandler):
             res = {
                 "code": 0,
                 "message": "ok",
-                "history": json.dumps(self.octopus.conversation.getHistory().cache),
+                "history": json.dumps(History().cache),
             }
             self.write(json.dumps(res))
         self.finish()
@@ -196,6 +211,69 @@ class GetLogHandler(BaseHandler):
         self.finish()
 
 
+class ProfileHandler(BaseHandler):
+    """
+    采样分析
+    POST: 开始采样(rate: 次/秒, seconds: 时长)
+    GET: 下载最近一次采样的折叠栈(status=1 时返回采样状态)
+    """
+
+    async def get(self):
+        if not self.validate(self.get_argument("validate", default=None)):
+            self.write(json.dumps({"code": 1, "message": "illegal visit"}))
+        elif self.get_argument("status", default=None):
+            status = await call(self.octopus.profiler.status)
+            self.write(json.dumps({"code": 0, "message": "ok", "status": status}))
+        else:
+            collapsed = await call(self.octopus.profiler.collapsed)
+            if collapsed is None:
+                res = {"code": 1, "message": "profiling"}
+                self.write(json.dumps(res))
+            elif not collapsed:
+                res = {"code": 1, "message": "no profile"}
+                self.write(json.dumps(res))
+            else:
+                filename = time.strftime("octopus-%Y%m%d%H%M%S.folded")
+                self.set_header("Content-Type", "text/plain; charset=utf-8")
+                self.set_header(
+                    "Content-Disposition", f"attachment; filename={filename}"
+                )
+                self.write(collapsed)
+        self.finish()
+
+    async def post(self):
+        if not self.validate(self.get_argument("validate", default=None)):
+            res = {"code": 1, "message": "illegal visit"}
+        else:
+            try:
+                status = await call(
+                    self.octopus.profiler.start,
+                    rate=self.get_argument("rate", default=None),
+                    seconds=self.get_argument("seconds", default=None),
+                )
+                res = {"code": 0, "message": "ok", "status": status}
+            except Exception as e:  # 采样进行中/参数错误
+                res = {"code": 1, "message": str(e)}
+        self.write(json.dumps(res))
+        self.finish()
+
+
+class ThreadDumpHandler(BaseHandler):
+    """线程栈快照"""
+
+    async def get(self):
+        if not self.validate(self.get_argument("validate", default=None)):
+            res = {"code": 1, "message": "illegal visit"}
+        else:
+            res = {
+                "code": 0,
+                "message": "ok",
+                "threads": await call(self.octopus.profiler.thread_dump),
+            }
+        self.write(json.dumps(res, ensure_ascii=False))
+        self.finish()
+
+
 class LogPageHandler(BaseHandler):
     def get(self):
         if not self.is_validated():
@@ -205,15 +283,15 @@ class LogPageHandler(BaseHandler):
 
 
 class OperateHandler(BaseHandler):
-    def post(self):
+    async def post(self):
         if self.validate(self.get_argument("validate", default=None)):
             type = self.get_argument("type")
             if type in ["restart", "0"]:
                 res = {"code": 0, "message": "ok"}
                 self.write(json.dumps(res))
                 self.finish()
-                time.sleep(3)
-                self.octopus.restart()
+                await asyncio.sleep(3)
+                await call(self.octopus.restart)
             else:
                 res = {"code": 1, "message": f"illegal type {type}"}
                 self.write(json.dumps(res))
@@ -351,14 +429,15 @@ class APIHandler(BaseHandler):
 
 
 class UpdateHandler(BaseHandler):
-    def post(self):
+    async def post(self):
         if self.validate(self.get_argument("validate", default=None)):
-            if self.octopus.update():
+            if await call(self.octopus.update):
                 res = {"code": 0, "message": "ok"}
                 self.write(json.dumps(res))
                 self.finish()
-                time.sleep(3)
-                self.octopus.restart()
+                await asyncio.sleep(3)
+                await call(self.octopus.restart)
+                return
             else:
                 res = {"code": 1, "message": "更新失败，请手动更新"}
                 self.write(json.dumps(res))
@@ -403,10 +482,11 @@ class LogoutHandler(BaseHandler):
 class DHPageHandler(BaseHandler):
     """数字人页面"""
 
-    def get(self):
+    async def get(self):
         if not self.valid_to_login():
             return
+        dh = self.octopus.conversation.speaker.dh
+        data = await call(dh.info) if await truth(dh) else None
         self.render(
-            template_name="digital-human.html",
-            **DigitalHumanHandler.info(dh=self.octopus.conversation.speaker.dh),
+            template_name="digital-human.html", **DigitalHumanHandler.info(data=data)
         )
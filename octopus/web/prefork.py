@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+"""
+多进程web服务
+
+语音主进程(core)运行 CoreServer, 通过 unix socket 与 N 个web工作进程通信:
+- 工作进程通过 RemoteRef 调用主进程的 octopus 对象(回调函数和 threading.Event 会被代理)
+- 主进程把 websocket 消息、音频分片、历史消息转发给所有工作进程
+- 工作进程共享端口(SO_REUSEPORT), 历史消息直接读取本地数据库
+"""
+import asyncio
+import itertools
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Listener, Client, Connection
+
+from octopus.robot import config, constants, log
+from octopus.robot.compt import ThreadManager
+
+logger = log.getLogger(__name__)
+
+ENV_ADDRESS = "OCTOPUS_IPC_ADDRESS"
+ENV_AUTHKEY = "OCTOPUS_IPC_KEY"
+
+
+class CallbackRef:
+    """跨进程的回调函数"""
+
+    def __init__(self, ref_id: int):
+        self.ref_id = ref_id
+
+
+class EventRef:
+    """跨进程的 threading.Event, 只支持由工作进程 set"""
+
+    def __init__(self, ref_id: int):
+        self.ref_id = ref_id
+
+
+class RemoteError(Exception):
+    """主进程调用失败"""
+
+
+class RemoteFull(RemoteError, queue.Full):
+    """主进程的队列已满"""
+
+
+# 主进程的异常类型 -> 工作进程抛出的异常, 调用方可以按原类型捕获
+REMOTE_ERRORS = {"Full": RemoteFull}
+
+
+# ---------------------------------- 主进程 ----------------------------------
+
+
+class WorkerLink:
+    """主进程与单个工作进程的连接"""
+
+    def __init__(self, server: "CoreServer", conn: Connection):
+        self.server = server
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.events = {}  # ref_id -> threading.Event
+        self.audio_clients = 0
+        self.clients = 0
+        self.calls = 0
+        self.pid = None
+        self.closed = False
+
+    def send(self, message):
+        if self.closed:
+            return
+        try:
+            with self.send_lock:
+                self.conn.send(message)
+        except (OSError, EOFError, ValueError):
+            self.close()
+
+    def send_text(self, payload: str, put_time: float, user_id=None):
+        self.send(("ws", payload, put_time, user_id))
+
+    def send_audio(self, frame: bytes, put_time: float):
+        if self.audio_clients:
+            self.send(("audio", frame, put_time))
+
+    def send_history(self, message: dict):
+        self.send(("history", message))
+
+    def has_audio_clients(self) -> bool:
+        return self.audio_clients > 0
+
+    def serve(self):
+        while not self.closed:
+            try:
+                message = self.conn.recv()
+            except (OSError, EOFError):
+                break
+            kind = message[0]
+            if kind == "call":
+                self.calls += 1
+                self.server.pool.submit(self._call, *message[1:])
+            elif kind == "event":
+                event = self.events.get(message[1])
+                event and event.set()
+            elif kind == "clients":
+                self.pid = message[1].get("pid")
+                self.clients = message[1].get("total", 0)
+                self.audio_clients = message[1].get("audio", 0)
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for event in list(self.events.values()):
+            event.set()
+        self.server.remove_link(self)
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+
+    def info(self) -> dict:
+        return {
+            "pid": self.pid,
+            "clients": self.clients,
+            "audio_clients": self.audio_clients,
+            "calls": self.calls,
+        }
+
+    def _call(self, call_id, path, args, kwargs, op="call"):
+        refs = []
+        try:
+            args = [self._unwrap(arg, refs) for arg in args]
+            kwargs = dict((k, self._unwrap(v, refs)) for k, v in kwargs.items())
+            target = self.server.resolve(path)
+            result = bool(target) if op == "truth" else target(*args, **kwargs)
+            self.send(("result", call_id, True, result))
+        except Exception as e:
+            logger.warning("web进程调用失败: %s, %s", path, str(e), exc_info=True)
+            self.send(("result", call_id, False, (type(e).__name__, str(e))))
+        finally:
+            for ref_id in refs:
+                self.events.pop(ref_id, None)
+
+    def _unwrap(self, value, refs: list):
+        if isinstance(value, CallbackRef):
+            ref_id = value.ref_id
+            return lambda *a, **kw: self.send(("callback", ref_id, a, kw))
+        if isinstance(value, EventRef):
+            event = threading.Event()
+            self.events[value.ref_id] = event
+            refs.append(value.ref_id)
+            return event
+        return value
+
+
+class CoreServer:
+    """主进程: 启动并管理web工作进程, 处理工作进程的调用"""
+
+    def __init__(self, octopus, workers: int):
+        self.octopus = octopus
+        self.workers = workers
+        self.address = os.path.join(
+            constants.DATA_PATH, f"web-{os.getpid()}.sock"
+        )
+        self.authkey = secrets.token_bytes(16)
+        self.listener = None
+        self.links = []
+        self.links_lock = threading.Lock()
+        self.processes = {}  # index -> Popen
+        self.pool = ThreadPoolExecutor(
+            max_workers=config.get("/server/ipc_threads", 32),
+            thread_name_prefix="web-ipc",
+        )
+        self.running = threading.Event()
+        self.restarts = 0
+
+    def start(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        self.listener = Listener(
+            address=self.address, family="AF_UNIX", authkey=self.authkey
+        )
+        self.running.set()
+        ThreadManager.new(target=self._accept).start()
+        # 转发消息
+        self.octopus.sender.relays.append(self)
+        from octopus.robot.sdk.History import History
+
+        History().listeners.append(self._relay_history)
+        for index in range(self.workers):
+            self._spawn(index)
+        ThreadManager.new(target=self._supervise).start()
+        logger.info("web服务已启动: %s个工作进程", self.workers)
+
+    def stop(self):
+        self.running.clear()
+        for process in self.processes.values():
+            process.terminate()
+        for link in list(self.links):
+            link.close()
+        if self.listener:
+            self.listener.close()
+        self.pool.shutdown(wait=False)
+
+    def resolve(self, path: str):
+        target = self.octopus
+        for name in path.split(".") if path else []:
+            if name.startswith("_"):
+                raise AttributeError(f"不允许访问私有属性: {name}")
+            target = getattr(target, name)
+        return target
+
+    def remove_link(self, link: WorkerLink):
+        with self.links_lock:
+            if link in self.links:
+                self.links.remove(link)
+
+    # 作为 WebSocketSender 的转发
+    def send_text(self, payload: str, put_time: float, user_id=None):
+        for link in list(self.links):
+            link.send_text(payload=payload, put_time=put_time, user_id=user_id)
+
+    def send_audio(self, frame: bytes, put_time: float):
+        for link in list(self.links):
+            link.send_audio(frame=frame, put_time=put_time)
+
+    def has_audio_clients(self) -> bool:
+        return any(link.has_audio_clients() for link in list(self.links))
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "restarts": self.restarts,
+            "links": [link.info() for link in list(self.links)],
+        }
+
+    def _relay_history(self, message: dict):
+        for link in list(self.links):
+            link.send_history(message)
+
+    def _accept(self):
+        while self.running.is_set():
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError):
+                if self.running.is_set():
+                    logger.warning("web进程连接失败", exc_info=True)
+                    continue
+                return
+            link = WorkerLink(server=self, conn=conn)
+            with self.links_lock:
+                self.links.append(link)
+            ThreadManager.new(target=link.serve).start()
+
+    def _spawn(self, index: int):
+        env = dict(os.environ)
+        env[ENV_ADDRESS] = self.address
+        env[ENV_AUTHKEY] = self.authkey.hex()
+        env.setdefault("OCTOPUS_CONFIG", constants.CONFIG_PATH)
+        # 保证工作进程可以导入 octopus 包
+        root = os.path.dirname(constants.APP_PATH)
+        env["PYTHONPATH"] = os.pathsep.join(
+            filter(None, [root, env.get("PYTHONPATH")])
+        )
+        self.processes[index] = subprocess.Popen(
+            [sys.executable, "-m", "octopus.web.prefork", str(index)],
+            env=env,
+        )
+
+    def _supervise(self):
+        """工作进程退出后重启"""
+        while self.running.is_set():
+            time.sleep(3)
+            for index, process in list(self.processes.items()):
+                if process.poll() is not None and self.running.is_set():
+                    logger.warning(
+                        "web进程%s退出(code=%s), 重新启动", index, process.returncode
+                    )
+                    self.restarts += 1
+                    self._spawn(index)
+
+
+# ---------------------------------- 工作进程 ----------------------------------
+
+
+class CoreClient:
+    """工作进程: 调用主进程, 接收主进程转发的消息"""
+
+    def __init__(self, address: str, authkey: bytes, io_loop=None):
+        self.conn = Client(address=address, family="AF_UNIX", authkey=authkey)
+        self.io_loop = io_loop
+        self.send_lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.pending = {}  # call_id -> Future
+        self.callbacks = {}  # ref_id -> callable, 调用结束时移除
+        self.events = {}  # ref_id -> threading.Event
+        self.timeout = config.get("/server/ipc_timeout", 600)
+        self.closed = threading.Event()
+
+    def start(self):
+        ThreadManager.new(target=self._receive).start()
+        ThreadManager.new(target=self._watch_events).start()
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+    def call(self, path: str, *args, op="call", **kwargs):
+        """调用主进程(阻塞等待结果), 不要在IOLoop线程中调用"""
+        call_id, refs, future = self._request(path, args, kwargs, op)
+        try:
+            ok, result = future.result(timeout=self.timeout)
+        finally:
+            self._release(call_id, refs)
+        return self._result(ok, result)
+
+    async def call_async(self, path: str, *args, op="call", **kwargs):
+        """调用主进程, 等待结果时不阻塞IOLoop"""
+        call_id, refs, future = self._request(path, args, kwargs, op)
+        try:
+            ok, result = await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout=self.timeout
+            )
+        finally:
+            self._release(call_id, refs)
+        return self._result(ok, result)
+
+    def _request(self, path: str, args, kwargs, op: str) -> tuple:
+        call_id = next(self.ids)
+        refs = []
+        args = [self._wrap(arg, refs) for arg in args]
+        kwargs = dict((k, self._wrap(v, refs)) for k, v in kwargs.items())
+        future = Future()
+        self.pending[call_id] = future
+        try:
+            self.send(("call", call_id, path, args, kwargs, op))
+        except BaseException:
+            self._release(call_id, refs)
+            raise
+        return call_id, refs, future
+
+    def _release(self, call_id: int, refs: list):
+        self.pending.pop(call_id, None)
+        for ref_id in refs:
+            self.events.pop(ref_id, None)
+            self.callbacks.pop(ref_id, None)
+
+    @staticmethod
+    def _result(ok: bool, result):
+        if ok:
+            return result
+        if isinstance(result, (tuple, list)):
+            name, message = result
+            raise REMOTE_ERRORS.get(name, RemoteError)(f"{name}: {message}")
+        raise RemoteError(result)
+
+    def _wrap(self, value, refs: list):
+        if isinstance(value, threading.Event):
+            ref_id = next(self.ids)
+            self.events[ref_id] = value
+            refs.append(ref_id)
+            return EventRef(ref_id)
+        if callable(value):
+            ref_id = next(self.ids)
+            self.callbacks[ref_id] = value
+            refs.append(ref_id)
+            return CallbackRef(ref_id)
+        return value
+
+    def _receive(self):
+        from octopus.robot.Sender import ExtWebSocketHandler
+        from octopus.robot.sdk.History import History
+
+        while True:
+            try:
+                message = self.conn.recv()
+            except (OSError, EOFError):
+                break
+            kind = message[0]
+            if kind == "result":
+                future = self.pending.get(message[1])
+                future and future.set_result((message[2], message[3]))
+            elif kind == "callback":
+                callback = self.callbacks.get(message[1])
+                try:
+                    callback and callback(*message[2], **message[3])
+                except Exception:
+                    logger.warning("web进程回调失败", exc_info=True)
+            elif kind == "ws":
+                self.io_loop.add_callback(ExtWebSocketHandler.dispatch, *message[1:])
+            elif kind == "audio":
+                self.io_loop.add_callback(
+                    ExtWebSocketHandler.dispatch_audio, *message[1:]
+                )
+            elif kind == "history":
+                History().add_message(message[1], persist=False)
+        # 主进程退出
+        self.closed.set()
+        for future in list(self.pending.values()):
+            future.done() or future.set_result(
+                (False, ("ConnectionError", "主进程连接已断开"))
+            )
+        logger.info("与主进程的连接已断开, web进程退出")
+        self.io_loop.add_callback(self.io_loop.stop)
+
+    def _watch_events(self):
+        """本地 Event 被设置时通知主进程"""
+        while not self.closed.is_set():
+            for ref_id, event in list(self.events.items()):
+                if event.is_set():
+                    self.events.pop(ref_id, None)
+                    self.send(("event", ref_id))
+            time.sleep(0.1)
+
+
+class RemoteRef:
+    """主进程对象的引用: 属性访问返回新的引用, 调用时请求主进程"""
+
+    def __init__(self, client: CoreClient, path: str = ""):
+        self._client = client
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        path = f"{self._path}.{name}" if self._path else name
+        if path == "conversation":
+            return RemoteConversation(client=self._client, path=path)
+        return RemoteRef(client=self._client, path=path)
+
+    def __call__(self, *args, **kwargs):
+        return self._client.call(self._path, *args, **kwargs)
+
+    async def _call_async(self, *args, **kwargs):
+        return await self._client.call_async(self._path, *args, **kwargs)
+
+    def __bool__(self):
+        # 主进程的 octopus 对象一定存在, 不需要请求
+        if not self._path:
+            return True
+        return self._client.call(self._path, op="truth")
+
+    async def _truth_async(self):
+        if not self._path:
+            return True
+        return await self._client.call_async(self._path, op="truth")
+
+
+class RemoteConversation(RemoteRef):
+    """Conversation的引用, 历史消息使用本进程的数据"""
+
+    def getHistory(self):
+        from octopus.robot.sdk.History import History
+
+        return History()
+
+
+def _report_clients(client: CoreClient):
+    from octopus.robot.Sender import ExtWebSocketHandler
+
+    clients = list(ExtWebSocketHandler.clients)
+    try:
+        client.send(
+            (
+                "clients",
+                {
+                    "pid": os.getpid(),
+                    "total": len(clients),
+                    "audio": sum(1 for c in clients if c.audio),
+                },
+            )
+        )
+    except (OSError, ValueError):
+        pass
+
+
+def run_worker(index: int):
+    """工作进程入口"""
+    import asyncio
+
+    import tornado.httpserver
+    import tornado.ioloop
+    import tornado.netutil
+
+    from octopus.web import server
+
+    log.use_file(f"octopus-web{index}.log")  # 避免多个进程轮转同一个日志文件
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    io_loop = tornado.ioloop.IOLoop.current()
+    client = CoreClient(
+        address=os.environ[ENV_ADDRESS],
+        authkey=bytes.fromhex(os.environ[ENV_AUTHKEY]),
+        io_loop=io_loop,
+    )
+    client.start()
+    application = server.make_application(octopus=RemoteRef(client=client))
+    sockets = tornado.netutil.bind_sockets(
+        int(config.get("/server/port", "5001")), reuse_port=True
+    )
+    http_server = tornado.httpserver.HTTPServer(application)
+    http_server.add_sockets(sockets)
+    tornado.ioloop.PeriodicCallback(lambda: _report_clients(client), 1000).start()
+    logger.info("web进程%s已启动: pid=%s", index, os.getpid())
+    io_loop.start()
+
+
+if __name__ == "__main__":
+    # 以包内模块运行, 保证跨进程传递的类型可以被解析
+    from octopus.web import prefork
+
+    prefork.run_worker(index=int(sys.argv[1]) if len(sys.argv) > 1 else 0)
@@ -19,6 +19,9 @@ from octopus.web.apis import (
     TuningControlHandler,
     ChatApiHandler,
     NavigationHandler,
+    MonitorApiHandler,
+    HistoryApiHandler,
+    MetricsHandler,
 )
 from octopus.web.core import api_base, Route, add_routes
 from octopus.web.pages import (
@@ -33,6 +36,8 @@ from octopus.web.pages import (
     OperateHandler,
     LogPageHandler,
     GetLogHandler,
+    ProfileHandler,
+    ThreadDumpHandler,
     APIHandler,
     QAHandler,
     UpdateHandler,
@@ -53,6 +58,9 @@ route_apis = [
     Route(path=api_base(r"/ctl/(.*)"), handler=HandControlHandler),
     Route(path=api_base(r"/tuning/(.*)"), handler=TuningControlHandler),
     Route(path=api_base(r"/navi/(.*)"), handler=NavigationHandler),
+    Route(path=api_base(r"/monitor/(.*)"), handler=MonitorApiHandler),
+    Route(path=api_base(r"/history/(.*)"), handler=HistoryApiHandler),
+    Route(path=api_base(r"/metrics"), handler=MetricsHandler),
 ]
 
 # 页面
@@ -69,6 +77,8 @@ route_pages = [
     Route(path=r"/operate", handler=OperateHandler),
     Route(path=r"/logpage", handler=LogPageHandler),
     Route(path=r"/log", handler=GetLogHandler),
+    Route(path=r"/profile", handler=ProfileHandler),
+    Route(path=r"/threads", handler=ThreadDumpHandler),
     Route(path=r"/api", handler=APIHandler),
     Route(path=r"/qa", handler=QAHandler),
     Route(path=r"/upgrade", handler=UpdateHandler),
@@ -115,9 +125,18 @@ settings = {
     "debug": False,
 }
 
-application = tornado.web.Application(
-    **settings,
-)
+
+def make_application(octopus) -> tornado.web.Application:
+    application = tornado.web.Application(
+        **settings,
+    )
+    # 页面路由
+    add_routes(app=application, routes=route_pages, kwarg=dict(octopus=octopus))
+    # 静态资源路由
+    add_routes(app=application, routes=route_statics)
+    # API路由
+    add_routes(app=application, routes=route_apis, kwarg=dict(octopus=octopus))
+    return application
 
 
 def start_server(octopus):
@@ -125,12 +144,7 @@ def start_server(octopus):
         return
     try:
         port = config.get("/server/port", "5001")
-        # 页面路由
-        add_routes(app=application, routes=route_pages, kwarg=dict(octopus=octopus))
-        # 静态资源路由
-        add_routes(app=application, routes=route_statics)
-        # API路由
-        add_routes(app=application, routes=route_apis, kwarg=dict(octopus=octopus))
+        application = make_application(octopus=octopus)
         asyncio.set_event_loop(asyncio.new_event_loop())
         application.listen(int(port))
         tornado.ioloop.IOLoop.instance().start()
@@ -140,5 +154,13 @@ def start_server(octopus):
 
 def run(octopus, debug=False):
     settings["debug"] = debug
+    workers = config.get("/server/workers", 0)
+    if workers and config.get("/server/enable", False):
+        # 多进程模式: web服务运行在独立的进程中
+        from octopus.web import prefork
+
+        octopus.web_workers = prefork.CoreServer(octopus=octopus, workers=workers)
+        octopus.web_workers.start()
+        return
     t = ThreadManager.new(target=lambda: start_server(octopus=octopus))
     t.start()
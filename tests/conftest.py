@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+测试使用临时的配置目录(默认配置), 不读写 ~/.octopus
+须在导入 octopus 之前设置, 子进程继承同样的环境变量
+"""
+import os
+import shutil
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_PATH = tempfile.mkdtemp(prefix="octopus-test-")
+
+shutil.copyfile(
+    os.path.join(ROOT, "octopus", "resources", "default.yml"),
+    os.path.join(CONFIG_PATH, "config.yml"),
+)
+os.environ["OCTOPUS_CONFIG"] = CONFIG_PATH
+os.environ["OCTOPUS_DATA_DIR"] = os.path.join(CONFIG_PATH, "data")
+os.environ["OCTOPUS_LOG_DIR"] = os.path.join(CONFIG_PATH, "log")
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(CONFIG_PATH, ignore_errors=True)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from argparse import Namespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from octopus.tools import bench_web
+
+AUDIO = {"frames": 10, "jitter_ms": 1.5}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/chat-robot/api/monitor/audio"):
+            body = {"code": 0, "data": AUDIO}
+        elif self.path.startswith("/chat-robot/api/history/list"):
+            body = {"code": 0, "data": []}
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_with_validate():
+    assert bench_web.with_validate("http://h/a", "") == "http://h/a"
+    assert bench_web.with_validate("http://h/a", "x") == "http://h/a?validate=x"
+    assert bench_web.with_validate("http://h/a?b=1", "x") == "http://h/a?b=1&validate=x"
+
+
+def test_run(server, capsys):
+    args = Namespace(
+        url=f"{server}/chat-robot/api/history/list",
+        validate="abc",
+        base="/chat-robot",
+        clients=4,
+        requests=40,
+        timeout=5,
+    )
+    result = bench_web.run(args)
+    assert result["errors"] == 0
+    assert len(result["latencies"]) == 40
+    out = capsys.readouterr().out
+    assert "失败: 0" in out
+    assert str(AUDIO) in out
+
+
+def test_run_errors(server):
+    result = bench_web.bench(f"{server}/missing", clients=2, requests=4, timeout=5)
+    assert result["errors"] == 4
+    assert result["latencies"] == []
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from argparse import Namespace
+
+import pytest
+
+from octopus.tools import importtime
+
+
+def check(module, forbid=importtime.FORBIDDEN, budget_ms=0):
+    args = Namespace(module=module, budget_ms=budget_ms, top=0, forbid=forbid)
+    return importtime.run(args)
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "octopus.robot.TTS",
+        "octopus.robot.ASR",
+        "octopus.robot.AI",
+        "octopus.robot.NLU",
+    ],
+)
+def test_engines_import_no_sdk(module):
+    """导入引擎模块时不导入未选用引擎的SDK"""
+    assert check(module) == 0
+
+
+def test_forbidden_module_fails():
+    assert check("json", forbid=("json",)) == 1
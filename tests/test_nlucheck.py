@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from octopus.tools import nlucheck
+
+
+@pytest.fixture(scope="module")
+def nlu():
+    return nlucheck.build()
+
+
+@pytest.mark.parametrize("query,expected", sorted(nlucheck.CASES.items()))
+def test_local_intent(nlu, query, expected):
+    """内置样本的识别结果, 空串表示不应在本地识别"""
+    actual, confidence = nlucheck.recognize(nlu, query)
+    assert actual == expected, f"{query}: {actual or '-'} (置信度 {confidence:.2f})"